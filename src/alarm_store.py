@@ -0,0 +1,275 @@
+import heapq
+import json
+import os
+import time
+from collections import OrderedDict
+
+# (alarm type, message prefix) sent by pingweave.cpp
+ALARM_TYPES = [
+    ("main_start", "Main thread starts"),
+    ("main_exit", "Main thread exits"),
+    ("child_terminated", "Child process termination is detected"),
+]
+ALARM_LOG_PREFIX = "pingweave_alarm_w"
+ALARM_LOG_SUFFIX = ".jsonl"
+
+
+def classify_alarm(message: str) -> str:
+    for alarm_type, prefix in ALARM_TYPES:
+        if message.startswith(prefix):
+            return alarm_type
+    return "other"
+
+
+class AlarmRecord:
+    __slots__ = ["rid", "host", "alarm_type", "message", "first_ts", "last_ts", "count"]
+
+    def __init__(self, rid: int, host: str, alarm_type: str, message: str, ts: float):
+        self.rid = rid
+        self.host = host
+        self.alarm_type = alarm_type
+        self.message = message
+        self.first_ts = ts
+        self.last_ts = ts
+        self.count = 1
+
+    def to_dict(self) -> dict:
+        return {
+            "host": self.host,
+            "type": self.alarm_type,
+            "message": self.message,
+            "first_ts": self.first_ts,
+            "last_ts": self.last_ts,
+            "count": self.count,
+        }
+
+
+class AlarmStore:
+    """
+    Structured, deduplicated alarms with indexes by time, host, type and
+    (host, type).
+
+    An alarm repeating the same (host, type, message) within `dedup_window_sec`
+    only bumps the counter and last_ts of the existing record. Both indexes are
+    ordered by last_ts (an updated record moves to the end), so "the last
+    N alarms of host X since T" walks backwards and stops after N records or
+    at the first older record. Events tailed from other workers may arrive
+    slightly out of order; the largest such skew is tracked and extends the
+    backward walk accordingly.
+    At most `ring_size` records are kept in memory.
+
+    Raw alarm events are appended to a per-writer JSON-lines log in `log_dir`.
+    The logs of other collector workers are tailed by sync(), so every worker
+    answers queries for alarms received by any worker. read_events() only
+    touches the files and may run in another thread; apply_events() updates
+    the indexes.
+    """
+
+    def __init__(
+        self,
+        log_dir: str,
+        logger,
+        writer_id: int = 0,
+        dedup_window_sec: float = 300,
+        ring_size: int = 10000,
+        log_max_MB: float = 5,
+    ):
+        self.log_dir = log_dir
+        self.logger = logger
+        self.writer_id = writer_id
+        self.dedup_window_sec = dedup_window_sec
+        self.ring_size = max(1, ring_size)
+        self.log_max_bytes = int(log_max_MB * 1024 * 1024)
+        self.by_time = OrderedDict()  # rid -> AlarmRecord, ordered by last_ts
+        # key -> OrderedDict(rid -> AlarmRecord), ordered by last_ts
+        self.by_host = {}  # host
+        self.by_type = {}  # alarm type
+        self.by_host_type = {}  # (host, alarm type)
+        self.active = {}  # (host, type, message) -> AlarmRecord of the dedup window
+        self.next_rid = 0
+        self.max_skew = 0.0  # max lateness of an applied event w.r.t. the newest record
+        self.log_path = os.path.join(
+            log_dir, f"{ALARM_LOG_PREFIX}{writer_id}{ALARM_LOG_SUFFIX}"
+        )
+        self.log_file = None
+        self.tail_offsets = {}  # path of other writer's log -> (inode, offset)
+        os.makedirs(log_dir, exist_ok=True)
+
+    def open(self):
+        """
+        Replays the existing logs of all writers in time order, then opens our
+        log for append.
+        """
+        self.apply_events(self.read_events(include_own=True))
+        self.max_skew = 0.0
+        self.log_file = open(self.log_path, "a")
+
+    def close(self):
+        if self.log_file:
+            self.log_file.close()
+            self.log_file = None
+
+    def add(self, host: str, message: str, ts: float = None, alarm_type: str = None) -> AlarmRecord:
+        """
+        Records a new alarm event and appends it to the on-disk log.
+        """
+        ts = time.time() if ts is None else ts
+        alarm_type = alarm_type or classify_alarm(message)
+        if self.log_file:
+            self.log_file.write(
+                json.dumps({"ts": ts, "host": host, "type": alarm_type, "message": message}) + "\n"
+            )
+            self.log_file.flush()
+            if self.log_file.tell() > self.log_max_bytes:
+                self._rotate_log()
+        return self._apply(host, alarm_type, message, ts)
+
+    def _apply(self, host: str, alarm_type: str, message: str, ts: float) -> AlarmRecord:
+        if self.by_time:
+            newest = self.by_time[next(reversed(self.by_time))]
+            self.max_skew = max(self.max_skew, newest.last_ts - ts)
+
+        key = (host, alarm_type, message)
+        record = self.active.get(key)
+        if record is not None and record.rid in self.by_time and ts - record.last_ts <= self.dedup_window_sec:
+            record.count += 1
+            record.last_ts = max(record.last_ts, ts)
+            self.by_time.move_to_end(record.rid)
+            for indexes, key in self._index_keys(record):
+                indexes[key].move_to_end(record.rid)
+            return record
+
+        record = AlarmRecord(self.next_rid, host, alarm_type, message, ts)
+        self.next_rid += 1
+        self.active[key] = record
+        self.by_time[record.rid] = record
+        for indexes, key in self._index_keys(record):
+            indexes.setdefault(key, OrderedDict())[record.rid] = record
+
+        # ring buffer: evict the least recently alarmed record
+        while len(self.by_time) > self.ring_size:
+            _, evicted = self.by_time.popitem(last=False)
+            for indexes, key in self._index_keys(evicted):
+                del indexes[key][evicted.rid]
+                if not indexes[key]:
+                    del indexes[key]
+            evicted_key = (evicted.host, evicted.alarm_type, evicted.message)
+            if self.active.get(evicted_key) is evicted:
+                del self.active[evicted_key]
+        return record
+
+    def _index_keys(self, record: AlarmRecord) -> list:
+        return [
+            (self.by_host, record.host),
+            (self.by_type, record.alarm_type),
+            (self.by_host_type, (record.host, record.alarm_type)),
+        ]
+
+    def _rotate_log(self):
+        self.log_file.close()
+        os.replace(self.log_path, self.log_path + ".1")
+        self.log_file = open(self.log_path, "a")
+
+    def sync(self):
+        """
+        Applies events appended to the logs of other writers since the last sync.
+        """
+        self.apply_events(self.read_events())
+
+    def read_events(self, include_own: bool = False) -> list:
+        """
+        (host, type, message, ts) of the events appended to the logs of other
+        writers (and ours, if include_own) since the last call.
+        """
+        events = []
+        for filename in sorted(os.listdir(self.log_dir)):
+            if not (filename.startswith(ALARM_LOG_PREFIX) and filename.endswith(ALARM_LOG_SUFFIX)):
+                continue
+            path = os.path.join(self.log_dir, filename)
+            if path == self.log_path and not include_own:
+                continue
+            try:
+                self._tail(path, events)
+            except OSError as e:
+                self.logger.warning(f"Cannot read alarm log {path}: {e}")
+        return events
+
+    def apply_events(self, events: list):
+        """
+        Applies the output of read_events() in time order.
+        """
+        events.sort(key=lambda event: event[3])
+        for event in events:
+            self._apply(*event)
+
+    def _tail(self, path: str, events: list):
+        stat = os.stat(path)
+        inode, offset = self.tail_offsets.get(path, (stat.st_ino, 0))
+        if inode != stat.st_ino:
+            # rotated by its writer: finish the old file, now at path + ".1"
+            try:
+                if os.stat(path + ".1").st_ino == inode:
+                    self._read_lines(path + ".1", offset, events)
+            except OSError:
+                pass  # rotated twice since the last sync, the rest is gone
+            offset = 0
+        elif stat.st_size < offset:
+            offset = 0  # truncated
+        if stat.st_size == offset:
+            self.tail_offsets[path] = (stat.st_ino, offset)
+            return
+        self.tail_offsets[path] = (stat.st_ino, self._read_lines(path, offset, events))
+
+    def _read_lines(self, path: str, offset: int, events: list) -> int:
+        """
+        Appends the complete events after `offset` to `events`; returns the new offset.
+        """
+        with open(path, "r") as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith("\n"):
+                    break  # partially written, read again next time
+                offset += len(line.encode())
+                try:
+                    event = json.loads(line)
+                    events.append((event["host"], event["type"], event["message"], float(event["ts"])))
+                except (ValueError, KeyError, TypeError) as e:
+                    self.logger.warning(f"Skip malformed alarm event in {path}: {e}")
+        return offset
+
+    def query(
+        self, host: str = None, since: float = 0, until: float = None, alarm_type: str = None, limit: int = 1000
+    ) -> list:
+        """
+        Alarms whose last_ts is in [since, until], newest first, at most `limit`.
+        Walks the narrowest index backwards: the records newer than `until`,
+        then up to `limit` matches and those within the skew window of them.
+        """
+        if host is not None and alarm_type is not None:
+            index = self.by_host_type.get((host, alarm_type), {})
+        elif host is not None:
+            index = self.by_host.get(host, {})
+        elif alarm_type is not None:
+            index = self.by_type.get(alarm_type, {})
+        else:
+            index = self.by_time
+        if limit <= 0:
+            return []
+
+        newest = []  # min-heap of the `limit` newest matches, (last_ts, rid, record)
+        for rid in reversed(index):
+            record = index[rid]
+            if record.last_ts < since - self.max_skew:
+                break
+            if len(newest) == limit and record.last_ts < newest[0][0] - self.max_skew:
+                break  # no older record can be among the newest `limit`
+            if record.last_ts < since:
+                continue
+            if until is not None and record.last_ts > until:
+                continue
+            if len(newest) < limit:
+                heapq.heappush(newest, (record.last_ts, rid, record))
+            elif record.last_ts > newest[0][0]:
+                heapq.heapreplace(newest, (record.last_ts, rid, record))
+        newest.sort(reverse=True)
+        return [record.to_dict() for _, _, record in newest]
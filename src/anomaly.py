@@ -0,0 +1,200 @@
+import numpy as np
+from multiprocessing import shared_memory
+
+# Per-pair online statistics, indexed like the cells of LatestValueMatrix
+# (see LatestValueMatrix.cell_index). Latencies are network_p50/network_p99 in ns.
+ANOMALY_STATE_DTYPE = np.dtype(
+    [
+        ("n_samples", "<u4"),
+        ("alarmed", "<u4"),  # bit 0: latency, bit 1: failure
+        ("p50_mean", "<f4"),
+        ("p50_var", "<f4"),
+        ("p99_mean", "<f4"),
+        ("p99_var", "<f4"),
+        ("p99_cusum", "<f4"),
+        ("failure_mean", "<f4"),
+    ]
+)
+ANOMALY_LATENCY = 0x1
+ANOMALY_FAILURE = 0x2
+SHM_NAME_PREFIX = "pingweave_anomaly_"
+
+# state arrays created by (or inherited from) this process, proto -> AnomalyDetector
+anomaly_detectors = {}
+
+
+class AnomalyDetector:
+    """
+    Streaming per-pair anomaly detection with O(1) memory per pair.
+
+    Each report updates, for its pair, an EWMA/EWMV of network p50 and p99,
+    an EWMA of the failure ratio and a one-sided CUSUM of the standardized
+    p99 deviation. A whole batch is updated with array operations: the
+    states of the batch's pairs are gathered, updated and scattered back.
+
+    A pair is flagged when, after `warmup_samples`, its p50 or p99 exceeds
+    the baseline by `z_threshold` standard deviations, the CUSUM exceeds
+    `cusum_threshold`, or its failure ratio exceeds the baseline by
+    `failure_ratio_delta`. update() only reports pairs that newly became
+    anomalous, so a persistent anomaly raises one alarm.
+    """
+
+    def __init__(
+        self,
+        proto: str,
+        shm: shared_memory.SharedMemory,
+        capacity: int,
+        lock=None,
+        alpha: float = 0.1,
+        warmup_samples: int = 10,
+        z_threshold: float = 6.0,
+        cusum_threshold: float = 5.0,
+        failure_ratio_delta: float = 0.2,
+    ):
+        self.proto = proto
+        self.shm = shm
+        self.lock = lock
+        self.state = np.ndarray((capacity,), dtype=ANOMALY_STATE_DTYPE, buffer=shm.buf)
+        self.configure(alpha, warmup_samples, z_threshold, cusum_threshold, failure_ratio_delta)
+
+    def configure(
+        self,
+        alpha: float,
+        warmup_samples: int,
+        z_threshold: float,
+        cusum_threshold: float,
+        failure_ratio_delta: float,
+    ):
+        self.alpha = alpha
+        self.warmup_samples = warmup_samples
+        self.z_threshold = z_threshold
+        self.cusum_threshold = cusum_threshold
+        self.cusum_slack = 0.5  # CUSUM drift allowance, in standard deviations
+        self.failure_ratio_delta = failure_ratio_delta
+
+    @classmethod
+    def create(cls, proto: str, capacity: int, lock=None):
+        name = SHM_NAME_PREFIX + proto
+        size = capacity * ANOMALY_STATE_DTYPE.itemsize
+        try:
+            shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            stale = shared_memory.SharedMemory(name=name)
+            stale.close()
+            stale.unlink()
+            shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        return cls(proto, shm, capacity, lock)
+
+    def update(self, records: np.ndarray, cells: np.ndarray):
+        """
+        Updates the states of the records' pairs, given their cell indices
+        (-1: not tracked). Returns (rows, kinds) of the records whose pair
+        newly became anomalous; kinds are ANOMALY_* bits.
+        Records of one pair must not repeat within a call.
+        """
+        rows = np.flatnonzero(cells >= 0)
+        if len(rows) == 0:
+            return rows, rows
+        cells = cells[rows]
+        records = records[rows]
+
+        if self.lock is not None:
+            self.lock.acquire()
+        try:
+            st = self.state[cells]  # gather (copy)
+            kinds = self._step(st, records)
+            self.state[cells] = st  # scatter
+        finally:
+            if self.lock is not None:
+                self.lock.release()
+
+        new = kinds != 0
+        return rows[new], kinds[new]
+
+    def _step(self, st: np.ndarray, records: np.ndarray) -> np.ndarray:
+        alpha = np.float32(self.alpha)
+        n_total = records["n_success"].astype(np.float32) + records["n_failure"]
+        has_latency = records["n_success"] > 0
+        has_total = n_total > 0
+        warm = st["n_samples"] >= self.warmup_samples
+
+        # failure ratio vs. its baseline
+        failure_ratio = np.where(has_total, records["n_failure"] / np.maximum(n_total, 1), 0)
+        failure_anomaly = (
+            warm & has_total & (failure_ratio - st["failure_mean"] > self.failure_ratio_delta)
+        )
+
+        # standardized latency deviations, with a floor on the std. deviation
+        latency_anomaly = np.zeros(len(st), dtype=bool)
+        for stat in ["p50", "p99"]:
+            x = records[f"network_{stat}"].astype(np.float32)
+            mean, var = st[f"{stat}_mean"], st[f"{stat}_var"]
+            std = np.maximum(np.sqrt(var), np.maximum(0.05 * mean, 1000))
+            z = (x - mean) / std
+            latency_anomaly |= warm & has_latency & (z > self.z_threshold)
+            if stat == "p99":
+                cusum = np.maximum(0, st["p99_cusum"] + z - self.cusum_slack)
+                st["p99_cusum"] = np.where(warm & has_latency, cusum, 0)
+                latency_anomaly |= warm & has_latency & (st["p99_cusum"] > self.cusum_threshold)
+
+            # EWMA / EWMV (the first sample initializes the mean)
+            first = has_latency & (mean == 0)
+            delta = x - mean
+            st[f"{stat}_mean"] = np.where(
+                first, x, np.where(has_latency, mean + alpha * delta, mean)
+            )
+            st[f"{stat}_var"] = np.where(
+                has_latency & ~first, (1 - alpha) * (var + alpha * delta * delta), var
+            )
+
+        st["failure_mean"] = np.where(
+            has_total,
+            np.where(
+                st["n_samples"] == 0,
+                failure_ratio,
+                st["failure_mean"] + alpha * (failure_ratio - st["failure_mean"]),
+            ),
+            st["failure_mean"],
+        )
+        st["n_samples"] += (has_latency | has_total).astype(np.uint32)
+
+        # report only transitions into the anomalous state
+        flags = latency_anomaly * ANOMALY_LATENCY | failure_anomaly * ANOMALY_FAILURE
+        flags = flags.astype(np.uint32)
+        kinds = flags & ~st["alarmed"]
+        st["alarmed"] = flags
+        return kinds
+
+    def baseline(self, cell: int) -> dict:
+        state = self.state[cell]
+        return {name: state[name].item() for name in ANOMALY_STATE_DTYPE.names}
+
+    def close(self):
+        del self.state
+        self.shm.close()
+
+
+def create_anomaly_detectors(capacities: dict, lock=None):
+    """
+    Creates the shared states of all protocols, proto -> number of cells of
+    its latest-value matrix. Called by the parent process before forking
+    the collector workers.
+    """
+    for proto, capacity in capacities.items():
+        anomaly_detectors[proto] = AnomalyDetector.create(proto, capacity, lock)
+    return anomaly_detectors
+
+
+def get_anomaly_detector(proto: str):
+    return anomaly_detectors.get(proto)
+
+
+def release_anomaly_detectors():
+    for detector in anomaly_detectors.values():
+        shm = detector.shm
+        detector.close()
+        try:
+            shm.unlink()
+        except FileNotFoundError:
+            pass
+    anomaly_detectors.clear()
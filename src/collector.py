@@ -1,12 +1,32 @@
 import asyncio
 import os
 import socket
+import time
+import multiprocessing
 import configparser
+import json
 from aiohttp import web  # aiohttp for webserver
+from aiohttp.web_protocol import RequestPayloadError
 import redis  # in-memory key-value storage
+import redis.asyncio as aioredis  # asyncio client (redis-py >= 4.2)
 import yaml  # python3 -m pip install pyyaml
 import psutil
 from logger import initialize_pingweave_logger
+import metrics
+from history_store import HistoryStore, history_records_to_dict
+from alarm_store import AlarmStore
+from anomaly import ANOMALY_FAILURE, ANOMALY_LATENCY, get_anomaly_detector
+from ingest_queue import IngestQueue, INGEST_QUEUE_POLICIES, latest_records
+from result_format import (
+    RESULT_PROTOCOLS,
+    format_result_values,
+    int_to_ip,
+    pack_result_values,
+)
+from result_parser import REJECT_REASONS, ResultStreamParser
+from redis_reader import EXPIRE_SCRIPT, update_index_key
+from shm_matrix import get_latest_matrix
+from snapshot import restore_state_snapshot, snapshot_path, write_state_snapshot
 from macro import *
 
 logger = initialize_pingweave_logger(socket.gethostname(), "collector", 5, False)
@@ -14,6 +34,139 @@ logger = initialize_pingweave_logger(socket.gethostname(), "collector", 5, False
 # Global variables
 control_host = None
 collect_port = None
+worker_id = 0
+
+# Content-Encoding of result POSTs; aiohttp decompresses the body while it is read
+# (zstd needs a zstd backend of aiohttp, e.g., backports.zstd before Python 3.14)
+RESULT_CONTENT_ENCODINGS = ["identity", "gzip", "deflate", "zstd"]
+
+# Encoding of result values in Redis (see result_format.py); readers accept both
+REDIS_VALUE_FORMATS = {"text": format_result_values, "packed": pack_result_values}
+
+# Per-worker ingest counters in shared memory (see create_ingest_counters)
+INGEST_COUNTERS = [
+    "requests",
+    "records",
+    "invalid",
+    "bytes",
+    "shed_rejected",  # requests answered with 503
+    "shed_dropped",  # records discarded by drop_oldest
+    "shed_merged",  # records merged into a newer one of the same pair
+    "queue_depth",  # gauge: records waiting for the storage writer
+]
+ingest_counters = None
+redis_batch_max_size = None
+redis_batch_max_latency_millisec = None
+redis_batcher = None
+redis_mirror = None
+redis_key_expire_sec = None
+redis_value_format = None
+history_segment_sec = None
+history_retention_hours = None
+history_fsync_interval_sec = None
+history_compaction_interval_sec = None
+history_store = None
+ingest_queue_max_records = None
+ingest_queue_policy = None
+ingest_retry_after_sec = None
+ingest_queue = None
+result_max_body_MB = None
+result_read_chunk_KB = None
+alarm_dedup_window_sec = None
+alarm_ring_size = None
+alarm_store = None
+anomaly_ewma_alpha = None
+anomaly_warmup_samples = None
+anomaly_z_threshold = None
+anomaly_cusum_threshold = None
+anomaly_failure_ratio_delta = None
+snapshot_interval_sec = None
+snapshot_max_age_sec = None
+
+# Self-instrumentation (see metrics.py)
+REDIS_FLUSH = metrics.histogram(
+    "pingweave_redis_flush_seconds", "Time to flush staged results to Redis"
+)
+REDIS_FLUSH_KEYS = metrics.counter(
+    "pingweave_redis_flush_keys_total", "Number of keys written to Redis"
+)
+REDIS_EXPIRED_KEYS = metrics.counter(
+    "pingweave_redis_expired_keys_total", "Number of stale result keys deleted from Redis"
+)
+RESULT_PARSE = {
+    proto: metrics.histogram(
+        "pingweave_result_parse_seconds", "Time to parse a result POST body", proto=proto
+    )
+    for proto in RESULT_PROTOCOLS
+}
+RESULT_RECORDS = {
+    proto: metrics.counter(
+        "pingweave_result_records_total", "Number of parsed result records", proto=proto
+    )
+    for proto in RESULT_PROTOCOLS
+}
+RESULT_ENCODED_REQUESTS = {
+    (proto, encoding): metrics.counter(
+        "pingweave_result_requests_total",
+        "Number of result POSTs per Content-Encoding",
+        proto=proto,
+        encoding=encoding,
+    )
+    for proto in RESULT_PROTOCOLS
+    for encoding in RESULT_CONTENT_ENCODINGS
+}
+RESULT_REJECTED = {
+    (proto, reason): metrics.counter(
+        "pingweave_result_rejected_lines_total",
+        "Number of result lines rejected by schema validation",
+        proto=proto,
+        reason=reason,
+    )
+    for proto in RESULT_PROTOCOLS
+    for reason in REJECT_REASONS
+}
+RESULT_DECODED_BYTES = {
+    proto: metrics.counter(
+        "pingweave_result_decoded_bytes_total",
+        "Bytes of result POST bodies after decompression",
+        proto=proto,
+    )
+    for proto in RESULT_PROTOCOLS
+}
+SNAPSHOT_WRITE = metrics.histogram(
+    "pingweave_snapshot_write_seconds", "Time to write the warm-restart snapshot"
+)
+STORE_RESULTS = metrics.histogram(
+    "pingweave_store_results_seconds", "Time to store a dequeued batch of results"
+)
+SHM_OVERFLOW = {
+    proto: metrics.counter(
+        "pingweave_shm_overflow_records_total",
+        "Number of results not kept in the shared-memory matrix (pair not reserved)",
+        proto=proto,
+    )
+    for proto in RESULT_PROTOCOLS
+}
+SHM_OVERFLOW_LOG_INTERVAL_SEC = 60
+shm_overflow_logged = {}  # proto -> (time of the last warning, n_overflow then)
+HISTORY_DROPPED = {
+    proto: metrics.counter(
+        "pingweave_history_dropped_records_total",
+        "Number of results not persisted because the history writer queue was full",
+        proto=proto,
+    )
+    for proto in RESULT_PROTOCOLS
+}
+history_dropped_logged = (0, 0)  # (time of the last warning, n_dropped then)
+ALARM_SYNC_INTERVAL_SEC = 1
+# records the storage writer takes from the ingest queue at once; the rest
+# stays queued (and counted against ingest_queue_max_records) meanwhile
+STORE_RESULTS_MAX_RECORDS = 20000
+HISTORY_QUERY_DEFAULT_LIMIT = 10000
+HISTORY_QUERY_MAX_LIMIT = 100000
+INGEST_QUEUE_DEPTH = metrics.gauge(
+    "pingweave_ingest_queue_records", "Number of records waiting for the storage writer"
+)
 
 # Variables to save pinglist
 pinglist_in_memory = {}
@@ -29,8 +182,8 @@ try:
     )
     logger.info(f"Redis server running - {redis_server.ping()}")  # 출력: True
     assert redis_server.ping()
-    redis_server.flushdb()
-    logger.info(f"Redis server cleanup - flushdb()")
+    # Not flushed: the latest results survive a controller restart (see
+    # restore_state_snapshots), stale keys are filtered by the plotter.
 
 except redis.exceptions.ConnectionError as e:
     logger.error(f"Cannot connect to Redis server: {e}")
@@ -47,16 +200,120 @@ except Exception as e:
 
 def load_config_ini():
     global control_host, collect_port
+    global redis_batch_max_size, redis_batch_max_latency_millisec, redis_mirror
+    global redis_key_expire_sec, redis_value_format
+    global history_segment_sec, history_retention_hours
+    global history_fsync_interval_sec, history_compaction_interval_sec
+    global ingest_queue_max_records, ingest_queue_policy, ingest_retry_after_sec
+    global result_max_body_MB, result_read_chunk_KB
+    global alarm_dedup_window_sec, alarm_ring_size
+    global anomaly_ewma_alpha, anomaly_warmup_samples, anomaly_z_threshold
+    global anomaly_cusum_threshold, anomaly_failure_ratio_delta
+    global snapshot_interval_sec, snapshot_max_age_sec
 
     try:
         config.read(CONFIG_PATH)
         control_host = config["controller"]["host"]
         collect_port = int(config["controller"]["port_collect"])
+        redis_mirror = config["controller"].getboolean("redis_mirror", fallback=True)
+        redis_batch_max_size = config["controller"].getint(
+            "redis_batch_max_size", fallback=10000
+        )
+        redis_batch_max_latency_millisec = config["controller"].getint(
+            "redis_batch_max_latency_millisec", fallback=0
+        )
+        redis_key_expire_sec = config["controller"].getint(
+            "redis_key_expire_sec", fallback=600
+        )
+        redis_value_format = config["controller"].get(
+            "redis_value_format", fallback="text"
+        )
+        if redis_value_format not in REDIS_VALUE_FORMATS:
+            logger.error(f"Unknown redis_value_format {redis_value_format}. Use text.")
+            redis_value_format = "text"
+        history_segment_sec = config["controller"].getint(
+            "history_segment_sec", fallback=3600
+        )
+        history_retention_hours = config["controller"].getint(
+            "history_retention_hours", fallback=168
+        )
+        history_fsync_interval_sec = config["controller"].getint(
+            "history_fsync_interval_sec", fallback=5
+        )
+        history_compaction_interval_sec = config["controller"].getint(
+            "history_compaction_interval_sec", fallback=600
+        )
+        ingest_queue_max_records = config["controller"].getint(
+            "ingest_queue_max_records", fallback=1000000
+        )
+        ingest_queue_policy = config["controller"].get(
+            "ingest_queue_policy", fallback="reject"
+        )
+        if ingest_queue_policy not in INGEST_QUEUE_POLICIES:
+            logger.error(f"Unknown ingest_queue_policy {ingest_queue_policy}. Use reject.")
+            ingest_queue_policy = "reject"
+        ingest_retry_after_sec = config["controller"].getint(
+            "ingest_retry_after_sec", fallback=5
+        )
+        result_max_body_MB = config["controller"].getint(
+            "result_max_body_MB", fallback=256
+        )
+        result_read_chunk_KB = config["controller"].getint(
+            "result_read_chunk_KB", fallback=64
+        )
+        alarm_dedup_window_sec = config["controller"].getint(
+            "alarm_dedup_window_sec", fallback=300
+        )
+        alarm_ring_size = config["controller"].getint("alarm_ring_size", fallback=10000)
+        anomaly_ewma_alpha = config["controller"].getfloat(
+            "anomaly_ewma_alpha", fallback=0.1
+        )
+        anomaly_warmup_samples = config["controller"].getint(
+            "anomaly_warmup_samples", fallback=10
+        )
+        anomaly_z_threshold = config["controller"].getfloat(
+            "anomaly_z_threshold", fallback=6.0
+        )
+        anomaly_cusum_threshold = config["controller"].getfloat(
+            "anomaly_cusum_threshold", fallback=5.0
+        )
+        anomaly_failure_ratio_delta = config["controller"].getfloat(
+            "anomaly_failure_ratio_delta", fallback=0.2
+        )
+        snapshot_interval_sec = config["controller"].getint(
+            "snapshot_interval_sec", fallback=60
+        )
+        snapshot_max_age_sec = config["controller"].getint(
+            "snapshot_max_age_sec", fallback=600
+        )
         logger.debug("Configuration loaded successfully from config file.")
     except Exception as e:
         logger.error(f"Error reading configuration: {e}")
         control_host = "0.0.0.0"
         collect_port = 8080
+        redis_mirror = True
+        redis_batch_max_size = 10000
+        redis_batch_max_latency_millisec = 0
+        redis_key_expire_sec = 600
+        redis_value_format = "text"
+        history_segment_sec = 3600
+        history_retention_hours = 168
+        history_fsync_interval_sec = 5
+        history_compaction_interval_sec = 600
+        ingest_queue_max_records = 1000000
+        ingest_queue_policy = "reject"
+        ingest_retry_after_sec = 5
+        result_max_body_MB = 256
+        result_read_chunk_KB = 64
+        alarm_dedup_window_sec = 300
+        alarm_ring_size = 10000
+        anomaly_ewma_alpha = 0.1
+        anomaly_warmup_samples = 10
+        anomaly_z_threshold = 6.0
+        anomaly_cusum_threshold = 5.0
+        anomaly_failure_ratio_delta = 0.2
+        snapshot_interval_sec = 60
+        snapshot_max_age_sec = 600
 
 
 def check_ip_active(target_ip):
@@ -82,52 +339,549 @@ def check_ip_active(target_ip):
         return False
 
 
-async def handle_result_rdma_post(request):
+class RedisWriteBatcher:
+    """
+    Coalesces Redis writes of concurrent POST handlers into pipelined MSETs.
+
+    Handlers only stage their key/value pairs and return. A single writer task
+    flushes everything staged within one event-loop tick (or within
+    `max_latency_sec`, if set) as MSET commands of at most `max_batch_size`
+    keys, so the event loop never blocks on a per-key Redis round trip.
+    A key staged twice before a flush keeps only its newest value.
+
+    Staged items are key -> (value, ts_end in ns). Each flush also ZADDs the
+    pairs to their protocol's update index (see redis_reader.py).
+    """
+
+    def __init__(self, client, max_batch_size: int, max_latency_sec: float):
+        self.client = client
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_latency_sec = max(0.0, max_latency_sec)
+        self.pending = {}
+        self.wakeup = asyncio.Event()
+        self.full = asyncio.Event()
+        self.n_flush = 0
+        self.n_keys = 0
+
+    def submit(self, items: dict):
+        if not items:
+            return
+        self.pending.update(items)
+        self.wakeup.set()
+        if len(self.pending) >= self.max_batch_size:
+            self.full.set()
+
+    async def flush(self):
+        batch, self.pending = self.pending, {}
+        self.full.clear()
+        if not batch:
+            return
+
+        keys = list(batch)
+        updated = {}  # proto -> {"src,dst": ts_end}
+        for key, (_, ts_end) in batch.items():
+            proto, pair = key.split(",", 1)
+            updated.setdefault(proto, {})[pair] = ts_end
+
+        with REDIS_FLUSH.time():
+            async with self.client.pipeline(transaction=False) as pipe:
+                for i in range(0, len(keys), self.max_batch_size):
+                    pipe.mset({k: batch[k][0] for k in keys[i : i + self.max_batch_size]})
+                for proto, scores in updated.items():
+                    pairs = list(scores)
+                    for i in range(0, len(pairs), self.max_batch_size):
+                        pipe.zadd(
+                            update_index_key(proto),
+                            {pair: scores[pair] for pair in pairs[i : i + self.max_batch_size]},
+                        )
+                await pipe.execute()
+        self.n_flush += 1
+        self.n_keys += len(batch)
+        REDIS_FLUSH_KEYS.inc(len(batch))
+
+    async def expire(self, max_age_sec: float, max_keys_per_call: int = 1000) -> int:
+        """
+        Deletes the keys of pairs not updated for `max_age_sec`, in atomic
+        chunks of `max_keys_per_call` so that Redis is never blocked for long.
+        """
+        script = self.client.register_script(EXPIRE_SCRIPT)
+        cutoff_ns = time.time_ns() - int(max_age_sec * 1e9)
+        n_expired = 0
+        for proto in RESULT_PROTOCOLS:
+            while True:
+                n = await script(
+                    keys=[update_index_key(proto)],
+                    args=[f"{proto},", cutoff_ns, max_keys_per_call],
+                )
+                n_expired += n
+                if n < max_keys_per_call:
+                    break
+        REDIS_EXPIRED_KEYS.inc(n_expired)
+        return n_expired
+
+    async def run(self):
+        while True:
+            await self.wakeup.wait()
+            if self.max_latency_sec > 0 and not self.full.is_set():
+                # wait for more writes, up to the latency budget
+                try:
+                    await asyncio.wait_for(self.full.wait(), self.max_latency_sec)
+                except asyncio.TimeoutError:
+                    pass
+            else:
+                # yield once so that handlers of this tick can stage their writes
+                await asyncio.sleep(0)
+            self.wakeup.clear()
+
+            try:
+                await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Failed to flush staged results to Redis: {e}")
+
+
+def create_ingest_counters(n_workers: int):
+    """
+    Allocates lock-free per-worker counters. Called by the parent process
+    before forking the collector workers; each worker only writes its own row.
+    """
+    global ingest_counters
+    ingest_counters = multiprocessing.RawArray("Q", n_workers * len(INGEST_COUNTERS))
+    return ingest_counters
+
+
+def count_ingest(**counts):
+    if ingest_counters is None:
+        return
+    base = worker_id * len(INGEST_COUNTERS)
+    for i, name in enumerate(INGEST_COUNTERS):
+        ingest_counters[base + i] += counts.get(name, 0)
+
+
+def set_ingest_gauge(name: str, value: int):
+    if ingest_counters is None:
+        return
+    ingest_counters[worker_id * len(INGEST_COUNTERS) + INGEST_COUNTERS.index(name)] = value
+
+
+def records_to_redis_items(proto: str, records) -> dict:
+    """
+    Redis items of records for RedisWriteBatcher.submit(),
+    e.g., "rdma,192.168.0.1,192.168.0.2" -> ("ts_start,...", ts_end), with
+    values encoded as redis_value_format. Redis keeps one value per pair, so
+    only the newest record of each pair is encoded.
+    Builds a string per record: run it in an executor.
+    """
+    records = latest_records(records)
+    keys = [
+        f"{proto},{int_to_ip(src)},{int_to_ip(dst)}"
+        for src, dst in zip(records["src"].tolist(), records["dst"].tolist())
+    ]
+    return dict(
+        zip(
+            keys,
+            zip(REDIS_VALUE_FORMATS[redis_value_format](proto, records), records["ts_end"].tolist()),
+        )
+    )
+
+
+def raise_anomaly_alarms(proto: str, records, rows, kinds, cells):
+    detector = get_anomaly_detector(proto)
+    for row, kind in zip(rows.tolist(), kinds.tolist()):
+        record = records[row]
+        src, dst = int_to_ip(record["src"]), int_to_ip(record["dst"])
+        baseline = detector.baseline(cells[row])
+        for bit, alarm_type, what in [
+            (ANOMALY_LATENCY, "latency_anomaly", "network latency"),
+            (ANOMALY_FAILURE, "failure_anomaly", "failure ratio"),
+        ]:
+            if not kind & bit:
+                continue
+            logger.warning(
+                f"(ANOMALY) {proto} {src} -> {dst}: {what} deviates from baseline. "
+                f"p50={record['network_p50']}, p99={record['network_p99']}, "
+                f"n_failure={record['n_failure']}, baseline={baseline}"
+            )
+            if alarm_store != None:
+                alarm_store.add(
+                    src,
+                    f"{proto} {src} -> {dst}: {what} deviates from baseline",
+                    alarm_type=alarm_type,
+                )
+
+
+def log_shm_overflow(proto: str, n_overflow: int):
+    """
+    Warns, at most every SHM_OVERFLOW_LOG_INTERVAL_SEC, about results whose
+    pair has no cell in the shared-memory matrix. They are still stored in
+    Redis and the history; the plotter reads their groups from Redis.
+    """
+    now = time.time()
+    last_time, last_count = shm_overflow_logged.get(proto, (0, 0))
+    if now - last_time < SHM_OVERFLOW_LOG_INTERVAL_SEC:
+        return
+    shm_overflow_logged[proto] = (now, n_overflow)
+    logger.warning(
+        f"{n_overflow - last_count} {proto} results of pairs outside the shared-memory "
+        f"matrix (not in the pinglist, or shm_max_nodes/shm_max_pairs exceeded)"
+    )
+
+
+def log_history_dropped(n_dropped: int):
+    """
+    Warns, at most every SHM_OVERFLOW_LOG_INTERVAL_SEC, about results the
+    history writer could not keep up with. They are still stored in Redis.
+    """
+    global history_dropped_logged
+    now = time.time()
+    last_time, last_count = history_dropped_logged
+    if now - last_time < SHM_OVERFLOW_LOG_INTERVAL_SEC:
+        return
+    history_dropped_logged = (now, n_dropped)
+    logger.warning(
+        f"{n_dropped - last_count} results dropped from the history "
+        f"(writer queue full, disk too slow?)"
+    )
+
+
+def store_results(proto: str, records):
+    """
+    Storage writer: hands dequeued records to the shared-memory matrix, the
+    anomaly detector and the history. Redis is fed by the writer itself, see
+    run_storage_writer().
+    """
+    # latest values shared with the plotter, then per-pair anomaly detection
+    latest_matrix = get_latest_matrix(proto)
+    if latest_matrix != None:
+        latest = latest_records(records)
+        n_overflow = latest_matrix.n_overflow
+        cells = latest_matrix.update(latest)
+        if latest_matrix.n_overflow > n_overflow:
+            SHM_OVERFLOW[proto].inc(latest_matrix.n_overflow - n_overflow)
+            log_shm_overflow(proto, latest_matrix.n_overflow)
+
+        detector = get_anomaly_detector(proto)
+        if detector != None:
+            rows, kinds = detector.update(latest, cells)
+            if len(rows):
+                raise_anomaly_alarms(proto, latest, rows, kinds, cells)
+
+    # persistent database (fsync'ed by a background thread)
+    if history_store != None:
+        n_dropped = history_store.n_dropped
+        history_store.append(proto, records)
+        if history_store.n_dropped > n_dropped:
+            HISTORY_DROPPED[proto].inc(history_store.n_dropped - n_dropped)
+            log_history_dropped(history_store.n_dropped)
+
+
+def save_state_snapshots(writers_stopped: bool = False):
+    """
+    Writes the warm-restart snapshot (latest results and anomaly baselines)
+    of every protocol to SNAPSHOT_DIR. writers_stopped is set by the parent
+    after joining the collectors, so that a seqlock left odd by a killed
+    writer can be released instead of timing out.
+    """
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    for proto in RESULT_PROTOCOLS:
+        latest_matrix = get_latest_matrix(proto)
+        if latest_matrix == None:
+            continue
+        if writers_stopped and latest_matrix.recover_seqlock():
+            logger.warning(f"{proto} matrix was left mid-update by a stopped collector")
+        with SNAPSHOT_WRITE.time():
+            n_entries = write_state_snapshot(
+                snapshot_path(SNAPSHOT_DIR, proto), latest_matrix, get_anomaly_detector(proto)
+            )
+        logger.debug(f"Saved {n_entries} {proto} pairs to the snapshot")
+
+
+def restore_state_snapshots():
+    """
+    Loads the snapshots into the (still empty) shared state. Called by the
+    parent process before forking the collector workers and the plotter.
+    Entries older than snapshot_max_age_sec are discarded.
+    """
+    load_config_ini()
+    for proto in RESULT_PROTOCOLS:
+        path = snapshot_path(SNAPSHOT_DIR, proto)
+        latest_matrix = get_latest_matrix(proto)
+        if latest_matrix == None or not os.path.isfile(path):
+            continue
+        try:
+            start = time.perf_counter()
+            n_entries = restore_state_snapshot(
+                path, proto, latest_matrix, get_anomaly_detector(proto), snapshot_max_age_sec
+            )
+            logger.info(
+                f"Restored {n_entries} {proto} pairs from {path} in {time.perf_counter() - start:.3f} s"
+            )
+        except Exception as e:
+            logger.error(f"Cannot restore the snapshot {path}: {e}")
+
+
+def mirror_state_to_redis():
+    """
+    Writes the restored latest results to Redis, for the plotter's Redis path.
+    """
+    for proto in RESULT_PROTOCOLS:
+        latest_matrix = get_latest_matrix(proto)
+        if latest_matrix != None:
+            _, _, _, records = latest_matrix.snapshot()
+            redis_batcher.submit(records_to_redis_items(proto, records))
+
+
+async def run_snapshot_writer():
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(snapshot_interval_sec)
+        try:
+            await loop.run_in_executor(None, save_state_snapshots)
+        except Exception as e:
+            logger.error(f"Failed to write the snapshot: {e}")
+
+
+async def run_redis_expiry():
+    """
+    Deletes results of pairs that stopped reporting from Redis.
+    """
+    while True:
+        await asyncio.sleep(max(1, redis_key_expire_sec // 10))
+        try:
+            n_expired = await redis_batcher.expire(redis_key_expire_sec)
+            if n_expired > 0:
+                logger.info(f"Deleted {n_expired} stale results from Redis")
+        except Exception as e:
+            logger.error(f"Failed to expire stale results in Redis: {e}")
+
+
+async def run_alarm_sync():
+    """
+    Tails the alarm logs of the other collector workers in a thread, so
+    /alarms also answers with the alarms they received.
+    """
+    while True:
+        await asyncio.sleep(ALARM_SYNC_INTERVAL_SEC)
+        try:
+            events = await asyncio.get_running_loop().run_in_executor(None, alarm_store.read_events)
+            alarm_store.apply_events(events)
+        except Exception as e:
+            logger.error(f"Failed to sync alarms of other workers: {e}")
+
+
+async def run_storage_writer():
+    loop = asyncio.get_running_loop()
+    while True:
+        batches = await ingest_queue.get(STORE_RESULTS_MAX_RECORDS)
+        try:
+            with STORE_RESULTS.time():
+                for proto, records in batches:
+                    store_results(proto, records)
+                    if redis_batcher != None:
+                        # value strings are built in a thread, flushed by the batcher
+                        items = await loop.run_in_executor(
+                            None, records_to_redis_items, proto, records
+                        )
+                        redis_batcher.submit(items)
+        except Exception as e:
+            logger.error(f"Failed to store results: {e}")
+        set_ingest_gauge("queue_depth", ingest_queue.depth)
+        INGEST_QUEUE_DEPTH.set(ingest_queue.depth)
+        await asyncio.sleep(0)  # let handlers run between chunks
+
+
+async def read_result_records(request, proto: str):
+    """
+    Parses the body while it is received. A body with Content-Encoding
+    gzip/deflate (or zstd, if aiohttp has a zstd backend) arrives already
+    decompressed from request.content, chunk by chunk.
+    Returns (records, parser), or None if the decompressed body exceeds
+    result_max_body_MB. The parser holds the invalid line counts and the
+    decompressed size.
+    """
+    parser = ResultStreamParser(proto)
+    max_bytes = result_max_body_MB * 1024 * 1024
+    parse_time = 0.0
+    async for chunk in request.content.iter_chunked(result_read_chunk_KB * 1024):
+        start = time.perf_counter()
+        parser.feed(chunk)
+        parse_time += time.perf_counter() - start
+        if parser.n_bytes > max_bytes:
+            return None
+    start = time.perf_counter()
+    records, _ = parser.finish()
+    RESULT_PARSE[proto].observe(parse_time + time.perf_counter() - start)
+    return records, parser
+
+
+async def handle_result_post(request, proto: str):
     client_ip = request.remote
 
     try:
-        raw_data = await request.text()
-        logger.debug(f"Raw POST RESULT data from {client_ip}: {raw_data}")
+        encoding = request.headers.get("Content-Encoding", "identity").lower()
+        if encoding not in RESULT_CONTENT_ENCODINGS:
+            return web.Response(text=f"Unsupported Content-Encoding: {encoding}", status=415)
+        RESULT_ENCODED_REQUESTS[(proto, encoding)].inc()
 
-        results = raw_data.strip().split("\n")
+        result = await read_result_records(request, proto)
+        if result == None:
+            logger.warning(
+                f"Reject result_{proto} from {client_ip}: body exceeds {result_max_body_MB} MB"
+            )
+            return web.Response(text="Request body is too large", status=413)
+        records, parser = result
+        logger.debug(
+            f"POST RESULT from {client_ip}: {len(records)} records, {parser.n_bytes} bytes ({encoding})"
+        )
 
-        # TODO: add publish -> for persistent database
+        RESULT_RECORDS[proto].inc(len(records))
+        RESULT_DECODED_BYTES[proto].inc(parser.n_bytes)
+        count_ingest(
+            requests=1, records=len(records), invalid=parser.n_invalid, bytes=parser.n_bytes
+        )
+        if parser.n_invalid:
+            for reason, count in parser.rejected.items():
+                RESULT_REJECTED[(proto, reason)].inc(count)
+            logger.warning(
+                f"Ignore {parser.n_invalid} malformed result_{proto} lines from {client_ip}: {parser.rejected}"
+            )
 
-        if redis_server != None:
-            for result in results:
-                # send to redis server
-                data = result.strip().split(",")
-                key = "rdma," + ",".join(data[0:2])  # 192.168.0.1,192.168.0.2
-                value = ",".join(data[2:])  # ts_start, ts_end, #success, #fail, ...
-                redis_server.set(key, value)
+        # hand over to the storage writer, or shed load if the queue is full
+        n_rejected, n_dropped, n_merged = (
+            ingest_queue.n_rejected,
+            ingest_queue.n_dropped,
+            ingest_queue.n_merged,
+        )
+        accepted = ingest_queue.put(proto, records)
+        count_ingest(
+            shed_rejected=ingest_queue.n_rejected - n_rejected,
+            shed_dropped=ingest_queue.n_dropped - n_dropped,
+            shed_merged=ingest_queue.n_merged - n_merged,
+        )
+        set_ingest_gauge("queue_depth", ingest_queue.depth)
+        INGEST_QUEUE_DEPTH.set(ingest_queue.depth)
+        if not accepted:
+            logger.warning(f"Ingest queue is full. Reject result_{proto} from {client_ip}")
+            return web.Response(
+                text="Collector is overloaded",
+                status=503,
+                headers={"Retry-After": str(ingest_retry_after_sec)},
+            )
 
         return web.Response(text="Data processed successfully", status=200)
+    except RequestPayloadError as e:
+        logger.warning(f"Cannot read POST result_{proto} from {client_ip}: {e}")
+        return web.Response(text="Cannot decode request body", status=400)
     except Exception as e:
-        logger.error(f"Error processing POST result_rdma from {client_ip}: {e}")
+        logger.error(f"Error processing POST result_{proto} from {client_ip}: {e}")
         return web.Response(text="Internal server error", status=500)
 
+
+async def handle_result_rdma_post(request):
+    return await handle_result_post(request, "rdma")
+
+
 async def handle_result_udp_post(request):
+    return await handle_result_post(request, "udp")
+
+
+def query_history(proto, src, dst, ts_from_ns, ts_to_ns, limit):
+    """
+    Runs in an executor thread: reading the segments and converting the
+    records to JSON take too long for the event loop.
+    Returns (JSON body, number of records, next cursor or None).
+    """
+    records, next_cursor = history_store.query(proto, src, dst, ts_from_ns, ts_to_ns, limit)
+    return json.dumps(history_records_to_dict(records)), len(records), next_cursor
+
+
+async def handle_history_get(request):
+    """
+    GET /history?proto=rdma&src=<ip>&dst=<ip>&from=<epoch sec>&to=<epoch sec>&limit=<n>&cursor=<ns>
+    src and dst are optional. The range defaults to the last hour.
+    At most `limit` records (default HISTORY_QUERY_DEFAULT_LIMIT) are returned in
+    ts_end order. If more are left, the X-Next-Cursor header holds the `cursor`
+    to request the next page with, which replaces `from`.
+    """
     client_ip = request.remote
+    try:
+        proto = request.query.get("proto")
+        if proto not in RESULT_PROTOCOLS:
+            return web.Response(text=f"Invalid proto: {proto}", status=400)
+        src = request.query.get("src") or None
+        dst = request.query.get("dst") or None
+        ts_to = float(request.query.get("to", time.time()))
+        ts_from = float(request.query.get("from", ts_to - 3600))
+        ts_from_ns = int(request.query.get("cursor", int(ts_from * 1e9)))
+        limit = int(request.query.get("limit", HISTORY_QUERY_DEFAULT_LIMIT))
+        if not 0 < limit <= HISTORY_QUERY_MAX_LIMIT:
+            raise ValueError(f"limit must be between 1 and {HISTORY_QUERY_MAX_LIMIT}")
+    except ValueError as e:
+        return web.Response(text=f"Invalid query: {e}", status=400)
+
+    if history_store == None:
+        return web.Response(text="History store is not available", status=503)
 
     try:
-        raw_data = await request.text()
-        logger.debug(f"Raw POST RESULT data from {client_ip}: {raw_data}")
+        body, n_records, next_cursor = await asyncio.get_running_loop().run_in_executor(
+            None,
+            query_history,
+            proto,
+            src,
+            dst,
+            ts_from_ns,
+            int(ts_to * 1e9),
+            limit,
+        )
+        logger.debug(f"(SEND) {n_records} history records to client: {client_ip}")
+        headers = {} if next_cursor == None else {"X-Next-Cursor": str(next_cursor)}
+        return web.Response(text=body, content_type="application/json", headers=headers)
+    except OSError as e:
+        return web.Response(text=f"Invalid query: {e}", status=400)
+    except Exception as e:
+        logger.error(f"Error processing GET history from {client_ip}: {e}")
+        return web.Response(text="Internal server error", status=500)
 
-        results = raw_data.strip().split("\n")
 
-        # TODO: add publish -> for persistent database
+async def handle_collector_stats_get(request):
+    """
+    Ingest counters of all collector workers, whichever worker answers.
+    """
+    workers = []
+    if ingest_counters is not None:
+        n_counters = len(INGEST_COUNTERS)
+        for i in range(len(ingest_counters) // n_counters):
+            row = ingest_counters[i * n_counters : (i + 1) * n_counters]
+            workers.append({"worker_id": i, **dict(zip(INGEST_COUNTERS, row))})
+    total = {name: sum(w[name] for w in workers) for name in INGEST_COUNTERS}
+    return web.json_response({"responder": worker_id, "workers": workers, "total": total})
 
-        if redis_server != None:
-            for result in results:
-                # send to redis server
-                data = result.strip().split(",")
-                key = "udp," + ",".join(data[0:2])  # 192.168.0.1,192.168.0.2
-                value = ",".join(data[2:])  # ts_start, ts_end, #success, #fail, ...
-                redis_server.set(key, value)
 
-        return web.Response(text="Data processed successfully", status=200)
+async def handle_alarms_get(request):
+    """
+    GET /alarms?host=<ip>&type=<alarm type>&since=<epoch sec>&until=<epoch sec>&limit=<n>
+    All parameters are optional. `since` defaults to one hour ago.
+    Alarms received by other workers show up within ALARM_SYNC_INTERVAL_SEC.
+    """
+    try:
+        host = request.query.get("host") or None
+        alarm_type = request.query.get("type") or None
+        since = float(request.query.get("since", time.time() - 3600))
+        until = float(request.query["until"]) if "until" in request.query else None
+        limit = int(request.query.get("limit", 1000))
+    except ValueError as e:
+        return web.Response(text=f"Invalid query: {e}", status=400)
+
+    if alarm_store == None:
+        return web.Response(text="Alarm store is not available", status=503)
+
+    try:
+        return web.json_response(
+            alarm_store.query(host, since, until, alarm_type, limit)
+        )
     except Exception as e:
-        logger.error(f"Error processing POST result_rdma from {client_ip}: {e}")
+        logger.error(f"Error processing GET alarms from {request.remote}: {e}")
         return web.Response(text="Internal server error", status=500)
 
 
@@ -136,15 +890,82 @@ async def handle_alarm_post(request):
     try:
         raw_data = await request.text()
         logger.info(f"ALARM from {client_ip}: {raw_data}")
+        if alarm_store != None:
+            alarm_store.add(client_ip, raw_data.strip())
         return web.Response(text="Data processed successfully", status=200)
     except Exception as e:
         logger.error(f"Error processing POST alarm from {client_ip}: {e}")
         return web.Response(text="Internal server error", status=500)
 
 
-async def pingweave_collector():
+async def pingweave_collector(n_workers: int = 1):
+    global redis_batcher, history_store, ingest_queue, alarm_store
     load_config_ini()
 
+    try:
+        alarm_store = AlarmStore(
+            LOG_DIR,
+            logger,
+            writer_id=worker_id,
+            dedup_window_sec=alarm_dedup_window_sec,
+            ring_size=alarm_ring_size,
+        )
+        alarm_store.open()
+    except Exception as e:
+        logger.error(f"Cannot open the alarm store at {LOG_DIR}: {e}")
+        alarm_store = None
+
+    metrics.start_metrics_exporter(f"collector_{worker_id}", METRICS_DIR, logger)
+    ingest_queue = IngestQueue(ingest_queue_max_records, ingest_queue_policy)
+    for proto in RESULT_PROTOCOLS:
+        detector = get_anomaly_detector(proto)
+        if detector != None:
+            detector.configure(
+                anomaly_ewma_alpha,
+                anomaly_warmup_samples,
+                anomaly_z_threshold,
+                anomaly_cusum_threshold,
+                anomaly_failure_ratio_delta,
+            )
+    writer_task = asyncio.create_task(run_storage_writer())
+    alarm_sync_task = None
+    if alarm_store != None and n_workers > 1:
+        alarm_sync_task = asyncio.create_task(run_alarm_sync())
+
+    try:
+        history_store = HistoryStore(
+            HISTORY_DIR,
+            logger,
+            writer_id=worker_id,
+            segment_sec=history_segment_sec,
+            retention_sec=history_retention_hours * 3600,
+            fsync_interval_sec=history_fsync_interval_sec,
+            compaction_interval_sec=history_compaction_interval_sec,
+        )
+        history_store.start()
+    except Exception as e:
+        logger.error(f"Cannot start the history store at {HISTORY_DIR}: {e}")
+        history_store = None
+
+    batcher_task = None
+    expiry_task = None
+    if redis_server != None and redis_mirror:
+        redis_batcher = RedisWriteBatcher(
+            aioredis.StrictRedis(unix_socket_path=socket_path, decode_responses=True),
+            redis_batch_max_size,
+            redis_batch_max_latency_millisec / 1000,
+        )
+        batcher_task = asyncio.create_task(redis_batcher.run())
+        if worker_id == 0:
+            mirror_state_to_redis()
+            if redis_key_expire_sec > 0:
+                expiry_task = asyncio.create_task(run_redis_expiry())
+
+    # one writer for the state shared by all workers
+    snapshot_task = None
+    if worker_id == 0 and snapshot_interval_sec > 0:
+        snapshot_task = asyncio.create_task(run_snapshot_writer())
+
     try:
         while True:
             if not check_ip_active(control_host):
@@ -157,17 +978,24 @@ async def pingweave_collector():
 
             runner = None
             try:
-                app = web.Application()
+                app = web.Application(middlewares=[metrics.metrics_middleware])
                 app.router.add_post("/result_rdma", handle_result_rdma_post)
                 app.router.add_post("/result_udp", handle_result_udp_post)
                 app.router.add_post("/alarm", handle_alarm_post)
+                app.router.add_get("/alarms", handle_alarms_get)
+                app.router.add_get("/history", handle_history_get)
+                app.router.add_get("/collector_stats", handle_collector_stats_get)
+                app.router.add_get("/metrics", metrics.metrics_handler(METRICS_DIR))
                 runner = web.AppRunner(app)
                 await runner.setup()
-                site = web.TCPSite(runner, host="0.0.0.0", port=collect_port)
+                # workers share the port, the kernel balances connections
+                site = web.TCPSite(
+                    runner, host="0.0.0.0", port=collect_port, reuse_port=n_workers > 1
+                )
                 await site.start()
 
                 logger.info(
-                    f"Pingweave collector running on {control_host}:{collect_port}"
+                    f"Pingweave collector (worker {worker_id}/{n_workers}) running on {control_host}:{collect_port}"
                 )
                 await asyncio.Event().wait()
 
@@ -184,10 +1012,26 @@ async def pingweave_collector():
         logger.info("pingweave_collector received KeyboardInterrupt. Exiting.")
     except Exception as e:
         logger.error(f"Exception in pingweave_collector: {e}")
+    finally:
+        writer_task.cancel()
+        if alarm_sync_task:
+            alarm_sync_task.cancel()
+        if batcher_task:
+            batcher_task.cancel()
+        if expiry_task:
+            expiry_task.cancel()
+        if snapshot_task:
+            snapshot_task.cancel()
+        if history_store != None:
+            history_store.stop()
+        if alarm_store != None:
+            alarm_store.close()
 
 
-def run_pingweave_collector():
+def run_pingweave_collector(my_worker_id: int = 0, n_workers: int = 1):
+    global worker_id
+    worker_id = my_worker_id
     try:
-        asyncio.run(pingweave_collector())
+        asyncio.run(pingweave_collector(n_workers))
     except KeyboardInterrupt:
         logger.info("pingweave_collector process received KeyboardInterrupt. Exiting.")
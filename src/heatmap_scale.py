@@ -0,0 +1,71 @@
+import numpy as np
+
+# Values and color scales of the heatmaps, shared by the plotter and the
+# live view of pingweave_server.
+colorscale = ["black", "purple", "green", "yellow", "orange", "red"]
+
+# heatmap color steps: (steps, tick labels of the color bar)
+HEATMAP_DELAY_STEPS = {
+    "udp": ([2000000, 5000000, 20000000], ["No Data", "Failure", "~2ms", "~5ms", "~20ms", ">20ms"]),
+    "rdma": ([100000, 500000, 5000000], ["No Data", "Failure", "~100µs", "~500µs", "~5ms", ">5ms"]),
+}
+HEATMAP_RATIO_STEPS = ([0.1, 0.5, 0.9], ["No Data", "Failure", "~10%", "~50%", "~90%", "All failed"])
+HEATMAP_DELAY_VALUES = ["network_mean", "network_p50", "network_p99"]
+HEATMAP_RATIO_VALUES = ["failure_ratio", "weird_ratio"]
+
+
+# value to color index mapping for ping results:
+# black (<= -1), purple (<= 0), green (<= steps[0]), yellow (<= steps[1]),
+# orange (<= steps[2]), red (> steps[2])
+def map_value_to_color_index_ping_delay(values: np.ndarray, steps: list) -> np.ndarray:
+    assert(len(steps) == 3)
+    edges = np.array([-1, 0] + [int(step) for step in steps], dtype=np.float64)
+    return np.searchsorted(edges, values, side="left")
+
+
+# value to color index mapping for ratios:
+# black (<= -1), purple (< 0), green (< steps[0]), yellow (< steps[1]),
+# orange (< steps[2]), red (<= 1)
+def map_value_to_color_index_ratio(values: np.ndarray, steps: list) -> np.ndarray:
+    assert(len(steps) == 3)
+    if (values > 1).any():
+        raise ValueError(f"map_value error: ratio above 1 ({steps})")
+    edges = np.array([0] + [float(step) for step in steps], dtype=np.float64)
+    color_index = np.searchsorted(edges, values, side="right") + 1
+    color_index[values <= -1] = 0
+    return color_index
+
+
+def heatmap_steps(proto: str, value_name: str):
+    """
+    (color steps, tick labels, value-to-color function) of a heatmap value.
+    """
+    if value_name in HEATMAP_DELAY_VALUES:
+        steps, tick_steps = HEATMAP_DELAY_STEPS[proto]
+        return steps, tick_steps, map_value_to_color_index_ping_delay
+    steps, tick_steps = HEATMAP_RATIO_STEPS
+    return steps, tick_steps, map_value_to_color_index_ratio
+
+
+def result_heatmap_values(records) -> dict:
+    """
+    Heatmap values of result records (any shape): -1 where there is no
+    (fresh) result or no ping was counted.
+    """
+    has_data = records["ts_end"] > 0
+    n_success = records["n_success"].astype(np.float64)
+    n_failure = records["n_failure"].astype(np.float64)
+    n_weird = records["n_weird"].astype(np.float64)
+    n_total = n_success + n_failure
+    n_total_weird = n_total + n_weird
+
+    values = {
+        name: np.where(has_data, records[name], -1).astype(np.float64)
+        for name in HEATMAP_DELAY_VALUES
+    }
+    with np.errstate(invalid="ignore", divide="ignore"):
+        values["failure_ratio"] = np.where(has_data & (n_total > 0), n_failure / n_total, -1)
+        values["weird_ratio"] = np.where(
+            has_data & (n_total_weird > 0), n_weird / n_total_weird, -1
+        )
+    return values
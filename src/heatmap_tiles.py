@@ -0,0 +1,236 @@
+import json
+import os
+import shutil
+import struct
+import numpy as np
+
+# Multi-resolution heatmap of a large group, written by the plotter and
+# served per tile by pingweave_server (/heatmap_tiles):
+#   <dir>/<name>/meta.json                  created (ns), values, sizes, tile size, factor
+#   <dir>/<name>/<level>/<ty>_<tx>.tile     one tile of a level
+# Level 0 has one cell per (dst, src) pair, in ascending IP order (subnets
+# are contiguous); a cell of level l + 1 aggregates TILE_FACTOR x TILE_FACTOR
+# cells of level l: the worst value and the oldest report time. The worst is
+# the max, except that a Failure (0) of a latency value outranks any latency
+# and only No Data (-1) ranks below it. The top level fits in one tile. A tile is at most TILE_SIZE x TILE_SIZE cells:
+#   header (24 bytes), time int64[rows * cols]  (local wall-clock ns, 0: no data),
+#   values float32[n_values][rows * cols] (-1: no data), colors uint8[n_values][rows * cols]
+TILE_MAGIC = b"PWTL"
+TILE_VERSION = 1
+# magic, version, n_values, rows, cols, created (ns)
+TILE_HEADER = struct.Struct("<4sHHIIq")
+TILE_SIZE = 256
+TILE_FACTOR = 4
+NO_TIME = np.iinfo(np.int64).max
+
+
+def level_sizes(n: int) -> list:
+    """
+    Number of rows (= columns) of each level, finest first.
+    """
+    sizes = [n]
+    while sizes[-1] > TILE_SIZE:
+        sizes.append(-(-sizes[-1] // TILE_FACTOR))
+    return sizes
+
+
+def tile_path(directory: str, name: str, level: int, ty: int, tx: int) -> str:
+    return os.path.join(directory, name, str(level), f"{ty}_{tx}.tile")
+
+
+def meta_path(directory: str, name: str) -> str:
+    return os.path.join(directory, name, "meta.json")
+
+
+def _aggregate(values: np.ndarray, times: np.ndarray, zero_is_failure: np.ndarray = None):
+    """
+    Rows of the next level from values (n_values, rows, cols) and times
+    (rows, cols). Missing rows and columns (at the end) count as no data.
+    zero_is_failure (bool[n_values]) marks the values whose 0 is a Failure.
+    """
+    _, rows, cols = values.shape
+    row_pad, col_pad = -rows % TILE_FACTOR, -cols % TILE_FACTOR
+    if row_pad or col_pad:
+        values = np.pad(values, ((0, 0), (0, row_pad), (0, col_pad)), constant_values=-1)
+        times = np.pad(times, ((0, row_pad), (0, col_pad)), constant_values=NO_TIME)
+    height, width = times.shape[0] // TILE_FACTOR, times.shape[1] // TILE_FACTOR
+    blocks = values.reshape(len(values), height, TILE_FACTOR, width, TILE_FACTOR)
+    if zero_is_failure is not None and zero_is_failure.any():
+        failure = (blocks == 0) & zero_is_failure[:, None, None, None, None]
+        blocks = np.where(failure, np.inf, blocks)
+    value = blocks.max(axis=(2, 4))
+    value[value == np.inf] = 0
+    time = times.reshape(height, TILE_FACTOR, width, TILE_FACTOR).min(axis=(1, 3))
+    return value, time
+
+
+def _count_rows(pending: list) -> int:
+    return sum(len(times) for _, times in pending)
+
+
+def _take(pending: list, n_rows: int):
+    """
+    The first `n_rows` rows of a list of (values, times) row blocks, removed
+    from it.
+    """
+    taken = []
+    while pending and n_rows > 0:
+        values, times = pending[0]
+        if len(times) > n_rows:
+            taken.append((values[:, :n_rows], times[:n_rows]))
+            pending[0] = (values[:, n_rows:], times[n_rows:])
+        else:
+            taken.append(pending.pop(0))
+        n_rows -= len(taken[-1][1])
+    if len(taken) == 1:
+        return taken[0]
+    return (
+        np.concatenate([values for values, _ in taken], axis=1),
+        np.concatenate([times for _, times in taken], axis=0),
+    )
+
+
+class HeatmapTileWriter:
+    """
+    Builds the tile pyramid of an n x n group from its level-0 rows, given
+    in order and in blocks of any height (add_rows). Each level keeps only
+    the rows of its current tile row, so the memory is O(TILE_SIZE * n)
+    whatever the size of the group. The pyramid is written to a temporary
+    directory and swapped in by close().
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        name: str,
+        n: int,
+        value_names: list,
+        color_func,
+        created: int,
+        zero_is_failure: list = None,
+    ):
+        """
+        color_func(value index, float32 values) -> color indices (uint8).
+        zero_is_failure: per value, True if its 0 is a Failure (latencies).
+        """
+        self.directory = directory
+        self.name = name
+        self.value_names = value_names
+        self.color_func = color_func
+        self.zero_is_failure = np.array(zero_is_failure or [False] * len(value_names), dtype=bool)
+        self.created = created
+        self.sizes = level_sizes(n)
+        self.tmp_name = f".{name}.tmp"
+        self.tmp_dir = os.path.join(directory, self.tmp_name)
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+        for level in range(len(self.sizes)):
+            os.makedirs(os.path.join(self.tmp_dir, str(level)))
+        # per level: pending rows of the current tile row and of the next aggregate
+        self.tile_rows = [[] for _ in self.sizes]
+        self.tile_row_index = [0 for _ in self.sizes]
+        self.agg_rows = [[] for _ in self.sizes]
+        self.n_tiles = 0
+
+    def add_rows(self, values: np.ndarray, times: np.ndarray, level: int = 0):
+        """
+        values: float32 (n_values, rows, n) of -1 or worst value, times: int64
+        (rows, n) of local ns or NO_TIME.
+        """
+        self.tile_rows[level].append((values, times))
+        while _count_rows(self.tile_rows[level]) >= TILE_SIZE:
+            self._flush_tile_row(level)
+
+        if level + 1 < len(self.sizes):
+            self.agg_rows[level].append((values, times))
+            # all complete blocks of TILE_FACTOR rows at once
+            n_rows = _count_rows(self.agg_rows[level]) // TILE_FACTOR * TILE_FACTOR
+            if n_rows > 0:
+                rows = _take(self.agg_rows[level], n_rows)
+                self.add_rows(*_aggregate(*rows, self.zero_is_failure), level + 1)
+
+    def _flush_tile_row(self, level: int):
+        values, times = _take(self.tile_rows[level], TILE_SIZE)
+        ty = self.tile_row_index[level]
+        self.tile_row_index[level] += 1
+        for tx, first in enumerate(range(0, times.shape[1], TILE_SIZE)):
+            last = first + TILE_SIZE
+            self._write_tile(level, ty, tx, values[:, :, first:last], times[:, first:last])
+
+    def _write_tile(self, level: int, ty: int, tx: int, values: np.ndarray, times: np.ndarray):
+        rows, cols = times.shape
+        colors = np.stack([self.color_func(i, v) for i, v in enumerate(values)]).astype(np.uint8)
+        header = TILE_HEADER.pack(TILE_MAGIC, TILE_VERSION, len(values), rows, cols, self.created)
+        with open(tile_path(self.directory, self.tmp_name, level, ty, tx), "wb") as f:
+            f.write(header)
+            f.write(np.where(times == NO_TIME, 0, times).astype("<i8").tobytes())
+            f.write(values.astype("<f4").tobytes())
+            f.write(colors.tobytes())
+        self.n_tiles += 1
+
+    def close(self) -> int:
+        """
+        Writes the remaining (partial) rows of all levels and replaces the
+        group's previous pyramid. Returns the number of written tiles.
+        """
+        for level in range(len(self.sizes)):
+            if level + 1 < len(self.sizes):
+                if self.agg_rows[level]:
+                    rows = _take(self.agg_rows[level], _count_rows(self.agg_rows[level]))
+                    self.add_rows(*_aggregate(*rows, self.zero_is_failure), level + 1)
+            if self.tile_rows[level]:
+                self._flush_tile_row(level)
+
+        meta = dict(
+            created=str(self.created),  # exceeds the exact integers of JSON readers
+            values=self.value_names,
+            sizes=self.sizes,
+            tile=TILE_SIZE,
+            factor=TILE_FACTOR,
+        )
+        with open(os.path.join(self.tmp_dir, "meta.json"), "w") as f:
+            json.dump(meta, f)
+
+        # swap in the new pyramid (a tile request in between gets a 404)
+        path = os.path.join(self.directory, self.name)
+        old_path = os.path.join(self.directory, f".{self.name}.old")
+        shutil.rmtree(old_path, ignore_errors=True)
+        if os.path.isdir(path):
+            os.rename(path, old_path)
+        os.rename(self.tmp_dir, path)
+        shutil.rmtree(old_path, ignore_errors=True)
+        return self.n_tiles
+
+    def abort(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+
+def read_tile_value(
+    directory: str, name: str, level: int, ty: int, tx: int, value_name: str
+) -> bytes:
+    """
+    A tile reduced to one value: header (n_values = 1), times, values and
+    colors of `value_name`. Raises FileNotFoundError if the tile, the group
+    or the value does not exist, ValueError if the tile is malformed.
+    """
+    with open(meta_path(directory, name), "r") as f:
+        meta = json.load(f)
+    if value_name not in meta["values"]:
+        raise FileNotFoundError(f"No heatmap value {value_name}")
+    index = meta["values"].index(value_name)
+
+    with open(tile_path(directory, name, level, ty, tx), "rb") as f:
+        header = f.read(TILE_HEADER.size)
+        if len(header) != TILE_HEADER.size:
+            raise ValueError("Truncated heatmap tile")
+        magic, version, n_values, rows, cols, created = TILE_HEADER.unpack(header)
+        if magic != TILE_MAGIC or version != TILE_VERSION or index >= n_values:
+            raise ValueError("Not a heatmap tile")
+        n_cells = rows * cols
+        times = f.read(8 * n_cells)
+        f.seek(TILE_HEADER.size + 8 * n_cells + 4 * n_cells * index)
+        values = f.read(4 * n_cells)
+        f.seek(TILE_HEADER.size + 8 * n_cells + 4 * n_cells * n_values + n_cells * index)
+        colors = f.read(n_cells)
+    if len(times) + len(values) + len(colors) != 13 * n_cells:
+        raise ValueError("Truncated heatmap tile")
+    return TILE_HEADER.pack(magic, version, 1, rows, cols, created) + times + values + colors
@@ -0,0 +1,366 @@
+import os
+import queue
+import struct
+import threading
+import time
+import numpy as np
+from result_format import (
+    RESULT_DTYPES,
+    ip_to_int,
+    int_to_ip,
+    ns_to_timestamp_str,
+)
+
+# Segment file = 64-byte header + fixed-width records of RESULT_DTYPES[proto].
+# File name: <root>/<proto>/<partition_start_sec>_<partition_sec>_<writer_id>.seg
+SEGMENT_MAGIC = b"PWHS"
+SEGMENT_VERSION = 1
+SEGMENT_HEADER = struct.Struct("<4sHHI")  # magic, version, flags, record size
+SEGMENT_HEADER_SIZE = 64
+SEGMENT_FLAG_SORTED = 0x1  # records are sorted by (src, dst, ts_end)
+SEGMENT_FLAGS_OFFSET = 6
+
+
+def _segment_name(start_sec: int, span_sec: int, writer_id: int) -> str:
+    return f"{start_sec}_{span_sec}_{writer_id}.seg"
+
+
+def _parse_segment_name(filename: str):
+    """
+    Returns (start_sec, span_sec, writer_id) or None if not a segment file.
+    """
+    if not filename.endswith(".seg"):
+        return None
+    try:
+        start_sec, span_sec, writer_id = filename[:-4].split("_")
+        return int(start_sec), int(span_sec), int(writer_id)
+    except ValueError:
+        return None
+
+
+def read_segment_header(path: str):
+    with open(path, "rb") as f:
+        magic, version, flags, record_size = SEGMENT_HEADER.unpack(
+            f.read(SEGMENT_HEADER.size)
+        )
+    if magic != SEGMENT_MAGIC or version != SEGMENT_VERSION:
+        raise ValueError(f"Not a pingweave history segment: {path}")
+    return flags, record_size
+
+
+def map_segment(path: str, dtype: np.dtype):
+    """
+    Memory-maps the complete records of a segment (read-only).
+    A partially written trailing record is ignored.
+    """
+    flags, record_size = read_segment_header(path)
+    if record_size != dtype.itemsize:
+        raise ValueError(f"Record size mismatch in {path}: {record_size}")
+    n_records = (os.path.getsize(path) - SEGMENT_HEADER_SIZE) // record_size
+    if n_records <= 0:
+        return flags, np.empty(0, dtype=dtype)
+    records = np.memmap(
+        path, dtype=dtype, mode="r", offset=SEGMENT_HEADER_SIZE, shape=(n_records,)
+    )
+    return flags, records
+
+
+def write_segment(path: str, records: np.ndarray, flags: int):
+    """
+    Atomically (re)writes a whole segment via a temporary file and rename.
+    """
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        header = SEGMENT_HEADER.pack(
+            SEGMENT_MAGIC, SEGMENT_VERSION, flags, records.dtype.itemsize
+        )
+        f.write(header.ljust(SEGMENT_HEADER_SIZE, b"\0"))
+        f.write(records.tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class HistoryStore:
+    """
+    Append-only, time-partitioned on-disk store of ping results.
+
+    Ingest only enqueues parsed records; a background thread appends them to
+    the segment of each record's ts_end and fsyncs periodically, so request
+    handlers never wait for the disk.
+    The same thread enforces the retention and compacts closed segments
+    (sort by (src, dst, ts_end), drop duplicates), which lets range queries
+    binary-search a pair instead of scanning.
+    """
+
+    def __init__(
+        self,
+        root_dir: str,
+        logger,
+        writer_id: int = 0,
+        segment_sec: int = 3600,
+        retention_sec: int = 7 * 86400,
+        fsync_interval_sec: float = 5,
+        compaction_interval_sec: float = 600,
+        max_queue_size: int = 10000,
+    ):
+        self.root_dir = root_dir
+        self.logger = logger
+        self.writer_id = writer_id
+        self.segment_sec = max(1, segment_sec)
+        self.retention_sec = retention_sec
+        self.fsync_interval_sec = fsync_interval_sec
+        self.compaction_interval_sec = compaction_interval_sec
+        self.queue = queue.Queue(maxsize=max_queue_size)
+        self.files = {}  # (proto, start_sec) -> file object opened for append
+        self.thread = None
+        self.stop_event = threading.Event()
+        self.n_records = 0
+        self.n_dropped = 0  # records lost because the writer queue was full
+
+        for proto in RESULT_DTYPES:
+            os.makedirs(os.path.join(root_dir, proto), exist_ok=True)
+
+    def start(self):
+        self.thread = threading.Thread(
+            target=self._run, name="pingweave_history", daemon=True
+        )
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join()
+
+    def append(self, proto: str, records: np.ndarray):
+        """
+        Non-blocking: hands records (RESULT_DTYPES[proto]) to the writer thread.
+        Records that do not fit into the full queue are counted in n_dropped.
+        """
+        if len(records) == 0:
+            return
+        try:
+            self.queue.put_nowait((proto, records))
+        except queue.Full:
+            self.n_dropped += len(records)
+
+    def _run(self):
+        last_fsync = last_maintenance = time.monotonic()
+        while not self.stop_event.is_set() or not self.queue.empty():
+            try:
+                proto, records = self.queue.get(timeout=0.5)
+                self._write(proto, records)
+            except queue.Empty:
+                pass
+            except Exception as e:
+                self.logger.error(f"Failed to append results to history: {e}")
+
+            now = time.monotonic()
+            try:
+                if now - last_fsync >= self.fsync_interval_sec:
+                    last_fsync = now
+                    self._sync()
+                if now - last_maintenance >= self.compaction_interval_sec:
+                    last_maintenance = now
+                    self.enforce_retention()
+                    self.compact()
+            except Exception as e:
+                self.logger.error(f"History maintenance failed: {e}")
+        self._sync()
+        self._close_files(lambda key: True)
+
+    def _write(self, proto: str, records: np.ndarray):
+        partitions = records["ts_end"] // 1_000_000_000 // self.segment_sec
+        for partition in np.unique(partitions):
+            start_sec = int(partition) * self.segment_sec
+            f = self._open_segment(proto, start_sec)
+            f.write(records[partitions == partition].tobytes())
+        self.n_records += len(records)
+
+    def _segment_path(self, proto: str, start_sec: int) -> str:
+        name = _segment_name(start_sec, self.segment_sec, self.writer_id)
+        return os.path.join(self.root_dir, proto, name)
+
+    def _open_segment(self, proto: str, start_sec: int):
+        key = (proto, start_sec)
+        if key in self.files:
+            return self.files[key]
+
+        path = self._segment_path(proto, start_sec)
+        if not os.path.exists(path):
+            write_segment(path, np.empty(0, dtype=RESULT_DTYPES[proto]), 0)
+        else:
+            flags, _ = read_segment_header(path)
+            if flags & SEGMENT_FLAG_SORTED:
+                # late records arrived for a compacted segment
+                with open(path, "r+b") as f:
+                    f.seek(SEGMENT_FLAGS_OFFSET)
+                    f.write(struct.pack("<H", flags & ~SEGMENT_FLAG_SORTED))
+        self.files[key] = open(path, "ab")
+        return self.files[key]
+
+    def _sync(self):
+        for f in self.files.values():
+            f.flush()
+            os.fsync(f.fileno())
+
+        # keep only the current and the previous partition open
+        current_start = int(time.time()) // self.segment_sec * self.segment_sec
+        self._close_files(lambda key: key[1] < current_start - self.segment_sec)
+
+    def _close_files(self, predicate):
+        for key in [key for key in self.files if predicate(key)]:
+            f = self.files.pop(key)
+            f.flush()
+            os.fsync(f.fileno())
+            f.close()
+
+    def list_segments(self, proto: str, ts_from_ns: int = None, ts_to_ns: int = None):
+        """
+        Segment paths of a protocol whose partitions overlap [ts_from_ns, ts_to_ns).
+        """
+        segments = []
+        proto_dir = os.path.join(self.root_dir, proto)
+        for filename in os.listdir(proto_dir):
+            parsed = _parse_segment_name(filename)
+            if parsed is None:
+                continue
+            start_sec, span_sec, _ = parsed
+            if ts_to_ns is not None and start_sec * 1_000_000_000 >= ts_to_ns:
+                continue
+            if ts_from_ns is not None and (start_sec + span_sec) * 1_000_000_000 <= ts_from_ns:
+                continue
+            segments.append((start_sec, os.path.join(proto_dir, filename)))
+        return [path for _, path in sorted(segments)]
+
+    def enforce_retention(self):
+        """
+        Deletes segments of this writer whose whole partition is older than the retention.
+        """
+        deadline_sec = int(time.time()) - self.retention_sec
+        for proto in RESULT_DTYPES:
+            proto_dir = os.path.join(self.root_dir, proto)
+            for filename in os.listdir(proto_dir):
+                parsed = _parse_segment_name(filename)
+                if parsed is None or parsed[2] != self.writer_id:
+                    continue
+                if parsed[0] + parsed[1] > deadline_sec:
+                    continue
+                self._close_files(lambda key: key == (proto, parsed[0]))
+                os.remove(os.path.join(proto_dir, filename))
+                self.logger.info(f"(RETENTION) Removed history segment {proto}/{filename}")
+
+    def compact(self):
+        """
+        Sorts and deduplicates closed segments of this writer.
+        """
+        closed_before_sec = int(time.time()) - self.segment_sec
+        for proto, dtype in RESULT_DTYPES.items():
+            for path in self.list_segments(proto):
+                start_sec, span_sec, writer_id = _parse_segment_name(os.path.basename(path))
+                if writer_id != self.writer_id or start_sec + span_sec > closed_before_sec:
+                    continue
+                flags, records = map_segment(path, dtype)
+                if flags & SEGMENT_FLAG_SORTED:
+                    continue
+
+                self._close_files(lambda key: key == (proto, start_sec))
+                records = np.array(records)
+                order = np.lexsort((records["ts_end"], records["dst"], records["src"]))
+                records = records[order]
+                if len(records) > 1:
+                    unique = np.ones(len(records), dtype=bool)
+                    unique[1:] = records[1:] != records[:-1]
+                    records = records[unique]
+                write_segment(path, records, flags | SEGMENT_FLAG_SORTED)
+                self.logger.debug(f"Compacted history segment {path} ({len(records)} records)")
+
+    def query(
+        self,
+        proto: str,
+        src: str = None,
+        dst: str = None,
+        ts_from_ns: int = 0,
+        ts_to_ns: int = None,
+        limit: int = None,
+    ):
+        """
+        Records of [ts_from_ns, ts_to_ns) sorted by ts_end, optionally of one src and/or dst.
+        Returns (records, next_ts_from_ns). With a limit, partitions are read in time
+        order until it is reached; next_ts_from_ns is where the next page starts
+        (None if nothing is left). A page never splits records of equal ts_end.
+        """
+        dtype = RESULT_DTYPES[proto]
+        if ts_to_ns is None:
+            ts_to_ns = time.time_ns()
+        src_int = ip_to_int(src) if src else None
+        dst_int = ip_to_int(dst) if dst else None
+
+        # segments of all writers of one partition, in time order
+        partitions = {}
+        for path in self.list_segments(proto, ts_from_ns, ts_to_ns):
+            start_sec = _parse_segment_name(os.path.basename(path))[0]
+            partitions.setdefault(start_sec, []).append(path)
+
+        chunks = []
+        n_found = 0
+        for start_sec in sorted(partitions):
+            if limit is not None and n_found > limit:
+                break
+            for path in partitions[start_sec]:
+                records = self._query_segment(path, dtype, src_int, dst_int, ts_from_ns, ts_to_ns)
+                chunks.append(records)
+                n_found += len(records)
+
+        if not chunks:
+            return np.empty(0, dtype=dtype), None
+        result = np.concatenate(chunks)
+        result = result[np.argsort(result["ts_end"], kind="stable")]
+        if limit is None or len(result) <= limit:
+            return result, None
+
+        next_ts = int(result["ts_end"][limit])
+        page = result[result["ts_end"] < next_ts]
+        if len(page) == 0:  # more than `limit` records of the same ts_end
+            page = result[result["ts_end"] == next_ts]
+            next_ts += 1
+        return page, next_ts
+
+    def _query_segment(self, path, dtype, src_int, dst_int, ts_from_ns, ts_to_ns) -> np.ndarray:
+        try:
+            flags, records = map_segment(path, dtype)
+        except (OSError, ValueError) as e:
+            self.logger.warning(f"Skip unreadable history segment {path}: {e}")
+            return np.empty(0, dtype=dtype)
+
+        if flags & SEGMENT_FLAG_SORTED and src_int is not None:
+            lo = np.searchsorted(records["src"], src_int, side="left")
+            hi = np.searchsorted(records["src"], src_int, side="right")
+            records = records[lo:hi]
+            if dst_int is not None:
+                lo = np.searchsorted(records["dst"], dst_int, side="left")
+                hi = np.searchsorted(records["dst"], dst_int, side="right")
+                records = records[lo:hi]
+
+        mask = (records["ts_end"] >= ts_from_ns) & (records["ts_end"] < ts_to_ns)
+        if src_int is not None:
+            mask &= records["src"] == src_int
+        if dst_int is not None:
+            mask &= records["dst"] == dst_int
+        return np.array(records[mask])
+
+
+def history_records_to_dict(records: np.ndarray) -> dict:
+    """
+    Column-oriented, JSON-serializable view of query results.
+    """
+    columns = {
+        "src": [int_to_ip(v) for v in records["src"]],
+        "dst": [int_to_ip(v) for v in records["dst"]],
+        "ts_start": [ns_to_timestamp_str(v) for v in records["ts_start"]],
+        "ts_end": [ns_to_timestamp_str(v) for v in records["ts_end"]],
+    }
+    for name in records.dtype.names:
+        if name not in columns and name != "reserved":
+            columns[name] = records[name].tolist()
+    return columns
@@ -0,0 +1,129 @@
+import asyncio
+from collections import deque
+import numpy as np
+
+INGEST_QUEUE_POLICIES = ["reject", "drop_oldest", "merge"]
+
+
+class IngestQueue:
+    """
+    Bounded queue of parsed result records between the POST handlers and the
+    storage writer. Capacity is counted in records. When a batch does not fit:
+      - reject      : put() returns False and the handler answers 503
+      - drop_oldest : the oldest queued records are discarded
+      - merge       : queued records of the same (proto, src, dst) are merged,
+                      keeping the newest ts_end; rejected if still full
+    """
+
+    def __init__(self, max_records: int, policy: str = "reject"):
+        if policy not in INGEST_QUEUE_POLICIES:
+            raise ValueError(f"Unknown ingest queue policy: {policy}")
+        self.max_records = max(1, max_records)
+        self.policy = policy
+        self.batches = deque()  # (proto, records)
+        self.depth = 0  # number of queued records
+        self.not_empty = asyncio.Event()
+        self.n_rejected = 0  # batches
+        self.n_dropped = 0  # records
+        self.n_merged = 0  # records
+
+    def put(self, proto: str, records: np.ndarray) -> bool:
+        if len(records) == 0:
+            return True
+
+        if self.depth + len(records) > self.max_records:
+            if self.policy == "drop_oldest":
+                if len(records) > self.max_records:
+                    self.n_dropped += len(records) - self.max_records
+                    records = records[-self.max_records :]
+                self._drop_oldest(self.depth + len(records) - self.max_records)
+            elif self.policy == "merge":
+                if self._merge(proto, records):
+                    return True
+                self._merge()  # at least compact what is already queued
+                self.n_rejected += 1
+                return False
+            else:
+                self.n_rejected += 1
+                return False
+
+        self.batches.append((proto, records))
+        self.depth += len(records)
+        self.not_empty.set()
+        return True
+
+    async def get(self, max_records: int = None) -> list:
+        """
+        Waits until records are queued, then takes the oldest `max_records`
+        of them (all, if None). The rest stays queued and counted in depth.
+        """
+        await self.not_empty.wait()
+        if max_records is None or self.depth <= max_records:
+            self.not_empty.clear()
+            batches, self.batches = list(self.batches), deque()
+            self.depth = 0
+            return batches
+
+        batches = []
+        n_records = 0
+        while n_records < max_records:
+            proto, records = self.batches.popleft()
+            if n_records + len(records) > max_records:
+                n_taken = max_records - n_records
+                self.batches.appendleft((proto, records[n_taken:]))
+                records = records[:n_taken]
+            batches.append((proto, records))
+            n_records += len(records)
+        self.depth -= n_records
+        return batches
+
+    def _drop_oldest(self, n_records: int):
+        while n_records > 0 and self.batches:
+            proto, records = self.batches.popleft()
+            if len(records) > n_records:
+                # keep the newer tail of a partially dropped batch
+                self.batches.appendleft((proto, records[n_records:]))
+                self.depth -= n_records
+                self.n_dropped += n_records
+                return
+            self.depth -= len(records)
+            self.n_dropped += len(records)
+            n_records -= len(records)
+
+    def _merge(self, proto: str = None, records: np.ndarray = None) -> bool:
+        """
+        Merges the queued records (plus a new batch, if given) per (proto, src, dst).
+        The queue is only replaced if the result fits into the capacity.
+        """
+        chunks = {}
+        for queued_proto, queued in self.batches:
+            chunks.setdefault(queued_proto, []).append(queued)
+        if proto is not None:
+            chunks.setdefault(proto, []).append(records)
+
+        batches = deque()
+        depth = 0
+        for merged_proto, merged in chunks.items():
+            merged = latest_records(np.concatenate(merged))
+            batches.append((merged_proto, merged))
+            depth += len(merged)
+        if depth > self.max_records:
+            return False
+
+        depth_before = self.depth + (len(records) if proto is not None else 0)
+        self.n_merged += depth_before - depth
+        self.batches = batches
+        self.depth = depth
+        if depth:
+            self.not_empty.set()
+        return True
+
+
+def latest_records(records: np.ndarray) -> np.ndarray:
+    """
+    Keeps the newest record (by ts_end) of each (src, dst), in arrival order.
+    """
+    keys = (records["src"].astype(np.uint64) << np.uint64(32)) | records["dst"]
+    newest_first = np.argsort(-records["ts_end"], kind="stable")
+    _, first = np.unique(keys[newest_first], return_index=True)
+    return records[np.sort(newest_first[first])]
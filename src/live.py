@@ -0,0 +1,454 @@
+import asyncio
+import json
+import time
+import numpy as np
+from aiohttp import web
+from heatmap_scale import (
+    HEATMAP_DELAY_STEPS,
+    HEATMAP_DELAY_VALUES,
+    HEATMAP_RATIO_VALUES,
+    colorscale,
+    heatmap_steps,
+    result_heatmap_values,
+)
+from result_format import ip_to_int, ns_to_timestamp_strs
+from shm_matrix import get_latest_matrix
+from macro import *
+
+# Live view of the latest results, served by pingweave_server:
+#   GET /live                             single page (canvas heatmap of a group)
+#   GET /live/events?proto=..&group=..    server-sent events of that group
+# A subscriber first gets a "snapshot" event (the IPs of the group and all of
+# its fresh cells), then "cells" events with only the cells that changed,
+# read from the change log of the shared-memory latest-value matrix every poll.
+# A cell is [src index, dst index, time, values of LIVE_METRICS, color indices,
+# ts_end in epoch ms], indices into the snapshot's IPs. Every event carries the
+# server's epoch ms as "now"; the page blanks cells older than max_age_ms.
+# A subscriber that falls behind gets a new snapshot instead of an unbounded backlog.
+# Snapshots are built in an executor thread, once per (proto, group) for all
+# subscribers waiting for one, reading LIVE_SNAPSHOT_BLOCK_IPS src rows at a time.
+LIVE_METRICS = HEATMAP_DELAY_VALUES + HEATMAP_RATIO_VALUES
+LIVE_HEARTBEAT_SEC = 15
+LIVE_MAX_IPS = 2048  # larger groups are only plotted as heatmap pages
+LIVE_SNAPSHOT_BLOCK_IPS = 256
+LIVE_MAX_AGE_SEC = INTERVAL_PLOTTER_FILTER_OLD_DATA_SEC
+
+
+def fresh_records(records: np.ndarray) -> np.ndarray:
+    """
+    Mask of the records not older than LIVE_MAX_AGE_SEC.
+    """
+    return records["ts_end"] >= time.time_ns() - LIVE_MAX_AGE_SEC * 1_000_000_000
+
+
+class LiveSubscriber:
+    def __init__(self, proto: str, group: str, max_queued: int):
+        self.proto = proto
+        self.group = group
+        self.queue = asyncio.Queue(maxsize=max_queued)
+        self.ips = None
+        self.stale = True  # waits for a snapshot, gets no cells events until then
+
+    def replace_queued(self, event: str, data: str):
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait((event, data))
+
+    def set_ips(self, ips: list):
+        self.ips = list(ips)
+        ip_ints = np.array([ip_to_int(ip) for ip in self.ips], dtype=np.uint32)
+        self.order = np.argsort(ip_ints, kind="stable")
+        self.sorted_ints = ip_ints[self.order]
+
+    def index(self, ip_ints: np.ndarray) -> np.ndarray:
+        """
+        Index of each IPv4 in the group's IPs, -1 if not in the group.
+        """
+        if len(self.ips) == 0:
+            return np.full(len(ip_ints), -1, np.int64)
+        pos = np.minimum(np.searchsorted(self.sorted_ints, ip_ints), len(self.ips) - 1)
+        return np.where(self.sorted_ints[pos] == ip_ints, self.order[pos], -1)
+
+
+def snapshot_message(proto: str, group: str, ips: list) -> str:
+    """
+    "snapshot" event data of a group: its IPs and fresh cells.
+    Runs in an executor thread; reads the shared memory block by block.
+    """
+    matrix = get_latest_matrix(proto)
+    slots = matrix.slots(np.array([ip_to_int(ip) for ip in ips], dtype=np.uint32))
+    rows = []
+    for first in range(0, len(ips), LIVE_SNAPSHOT_BLOCK_IPS):
+        cells = matrix.read_block(slots[first : first + LIVE_SNAPSHOT_BLOCK_IPS], slots)
+        src, dst = np.nonzero(fresh_records(cells))
+        rows += live_cells(proto, cells[src, dst], src + first, dst)
+    message = dict(
+        proto=proto,
+        group=group,
+        ips=ips,
+        cells=rows,
+        now=time.time_ns() // 1_000_000,
+        max_age_ms=LIVE_MAX_AGE_SEC * 1000,
+    )
+    return json.dumps(message)
+
+
+def live_cells(proto: str, records: np.ndarray, src: np.ndarray, dst: np.ndarray) -> list:
+    """
+    Event rows of result records, whose pairs are (src, dst) indices.
+    """
+    if len(records) == 0:
+        return []
+    values = result_heatmap_values(records)
+    columns = [src.tolist(), dst.tolist(), ns_to_timestamp_strs(records["ts_end"]).tolist()]
+    columns += [values[name].tolist() for name in LIVE_METRICS]
+    for name in LIVE_METRICS:
+        steps, _, map_func = heatmap_steps(proto, name)
+        columns.append(map_func(values[name], steps).tolist())
+    columns.append((records["ts_end"] // 1_000_000).tolist())
+    return [list(row) for row in zip(*columns)]
+
+
+class LiveFeed:
+    """
+    Pushes the changed cells of the shared-memory latest-value matrices to
+    the subscribers of a (proto, group). Polls only the protocols that have
+    subscribers; a poll reads the matrix's change log since the last poll,
+    so it costs O(cells written since then).
+    New subscribers, subscribers whose queue is full and, if the log has been
+    overwritten in between, all subscribers of the protocol are marked stale
+    and resynced with a snapshot after the poll, never inside it.
+    """
+
+    def __init__(self, get_pinglist, logger, interval_sec: float = 1, max_queued: int = 100):
+        self.get_pinglist = get_pinglist  # -> {proto: {group: [ip, ...]}}
+        self.logger = logger
+        self.interval_sec = interval_sec
+        self.max_queued = max_queued
+        self.subscribers = set()
+        self.last_written = {}  # proto -> n_written of the matrix at the last poll
+        self.wakeup = asyncio.Event()  # a new subscriber waits for its snapshot
+
+    def group_ips(self, proto: str, group: str):
+        return (self.get_pinglist() or {}).get(proto, {}).get(group)
+
+    def subscribe(self, proto: str, group: str) -> LiveSubscriber:
+        """
+        Returns None if the group is not in the pinglist or there is no
+        shared-memory matrix of the protocol. The snapshot follows from run().
+        """
+        matrix = get_latest_matrix(proto)
+        ips = self.group_ips(proto, group)
+        if ips == None or matrix == None:
+            return None
+        if len(ips) > LIVE_MAX_IPS:
+            raise ValueError(f"{proto}/{group} has {len(ips)} IPs, the live view shows at most {LIVE_MAX_IPS}")
+        if proto not in self.last_written:
+            self.last_written[proto] = matrix.n_written
+        subscriber = LiveSubscriber(proto, group, self.max_queued)
+        self.subscribers.add(subscriber)
+        self.wakeup.set()
+        return subscriber
+
+    def unsubscribe(self, subscriber: LiveSubscriber):
+        self.subscribers.discard(subscriber)
+        if not any(s.proto == subscriber.proto for s in self.subscribers):
+            self.last_written.pop(subscriber.proto, None)
+
+    async def resync(self):
+        """
+        Sends a snapshot to the stale subscribers, built once per (proto, group).
+        """
+        stale = {}
+        for subscriber in self.subscribers:
+            if subscriber.stale:
+                stale.setdefault((subscriber.proto, subscriber.group), []).append(subscriber)
+        loop = asyncio.get_running_loop()
+        for (proto, group), subscribers in stale.items():
+            ips = list(self.group_ips(proto, group) or [])
+            if len(ips) > LIVE_MAX_IPS:
+                for subscriber in subscribers:
+                    subscriber.replace_queued("close", f"{proto}/{group} grew beyond {LIVE_MAX_IPS} IPs")
+                    self.unsubscribe(subscriber)
+                continue
+            data = await loop.run_in_executor(None, snapshot_message, proto, group, ips)
+            for subscriber in subscribers:
+                subscriber.set_ips(ips)
+                subscriber.replace_queued("snapshot", data)
+                subscriber.stale = False
+            self.logger.debug(
+                f"Live snapshot of {proto}/{group}: {len(ips)} IPs, {len(subscribers)} subscribers"
+            )
+
+    def poll(self):
+        for proto in list(self.last_written):
+            matrix = get_latest_matrix(proto)
+            subscribers = [s for s in self.subscribers if s.proto == proto and not s.stale]
+            changed = matrix.changed_cells(self.last_written[proto])
+            if changed == None:
+                self.logger.debug(f"Live feed of {proto} fell behind the change log")
+                self.last_written[proto] = matrix.n_written
+                for subscriber in subscribers:
+                    subscriber.stale = True
+                continue
+            self.last_written[proto], records = changed
+            records = records[fresh_records(records)]
+
+            by_group = {}
+            for subscriber in subscribers:
+                if self.group_ips(proto, subscriber.group) != subscriber.ips:
+                    subscriber.stale = True  # the pinglist changed
+                    continue
+                by_group.setdefault(subscriber.group, []).append(subscriber)
+
+            for group_subscribers in by_group.values():
+                first = group_subscribers[0]
+                src, dst = first.index(records["src"]), first.index(records["dst"])
+                rows = np.flatnonzero((src >= 0) & (dst >= 0))
+                if len(rows) == 0:
+                    continue
+                cells = live_cells(proto, np.take(records, rows), src[rows], dst[rows])
+                data = json.dumps({"cells": cells, "now": time.time_ns() // 1_000_000})
+                for subscriber in group_subscribers:
+                    try:
+                        subscriber.queue.put_nowait(("cells", data))
+                    except asyncio.QueueFull:
+                        subscriber.stale = True  # too slow a reader
+
+    async def run(self):
+        while True:
+            try:
+                if self.subscribers:
+                    self.poll()
+                    await self.resync()
+            except Exception as e:
+                self.logger.error(f"Live feed poll failed: {e}")
+            self.wakeup.clear()
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), self.interval_sec)
+            except asyncio.TimeoutError:
+                pass
+
+
+def live_events_handler(feed: LiveFeed):
+    async def handle_live_events(request):
+        proto = request.query.get("proto", "")
+        group = request.query.get("group", "")
+        try:
+            subscriber = feed.subscribe(proto, group)
+        except ValueError as e:
+            raise web.HTTPBadRequest(text=str(e))
+        if subscriber == None:
+            raise web.HTTPNotFound(text=f"No live results of {proto}/{group}")
+
+        response = web.StreamResponse(
+            headers={
+                "Content-Type": "text/event-stream",
+                "Cache-Control": "no-cache",
+                "X-Accel-Buffering": "no",
+            }
+        )
+        try:
+            await response.prepare(request)
+            while True:
+                try:
+                    event, data = await asyncio.wait_for(subscriber.queue.get(), LIVE_HEARTBEAT_SEC)
+                except asyncio.TimeoutError:
+                    await response.write(b": heartbeat\n\n")
+                    continue
+                await response.write(f"event: {event}\ndata: {data}\n\n".encode())
+                if event == "close":
+                    break
+        except (ConnectionResetError, ConnectionError):
+            pass  # the browser went away
+        finally:
+            feed.unsubscribe(subscriber)
+        return response
+
+    return handle_live_events
+
+
+def live_page_handler(feed: LiveFeed, events_url: str):
+    async def handle_live_page(request):
+        pinglist = feed.get_pinglist() or {}
+        spec = dict(
+            url=events_url,
+            groups={proto: list(groups) for proto, groups in pinglist.items()},
+            metrics=LIVE_METRICS,
+            colorscale=colorscale,
+            ticktext={
+                proto: {name: heatmap_steps(proto, name)[1] for name in LIVE_METRICS}
+                for proto in pinglist
+                if proto in HEATMAP_DELAY_STEPS
+            },
+        )
+        page = LIVE_HTML.replace("__SPEC__", json.dumps(spec).replace("</", "<\\/"))
+        return web.Response(text=page, content_type="text/html")
+
+    return handle_live_page
+
+
+LIVE_HTML = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>pingweave live</title>
+<style>
+body { margin: 10px; background: white; font-family: sans-serif; font-size: 13px; }
+#bar > * { margin-right: 8px; }
+#legend span { display: inline-block; margin-right: 10px; }
+#legend i { display: inline-block; width: 12px; height: 12px; margin-right: 3px; vertical-align: middle; }
+canvas { margin-top: 8px; border: 1px solid #ccc; image-rendering: pixelated; }
+#hover { position: fixed; display: none; pointer-events: none; padding: 4px 6px;
+         background: white; border: 1px solid #444; font-size: 12px; }
+</style>
+</head>
+<body>
+<div id="bar">
+<select id="group"></select>
+<select id="metric"></select>
+<span id="status">Connecting...</span>
+</div>
+<div id="legend"></div>
+<canvas id="heatmap" width="0" height="0"></canvas>
+<div id="hover"></div>
+<script>
+const spec = __SPEC__;
+const M = spec.metrics.length;
+const groupSelect = document.getElementById("group");
+const metricSelect = document.getElementById("metric");
+const status = document.getElementById("status");
+const canvas = document.getElementById("heatmap");
+const context = canvas.getContext("2d");
+const hover = document.getElementById("hover");
+let source = null;
+let state = null;  // proto, ips, n, cell (px), values, colors, times, ends, maxAge
+let updates = 0;
+let skew = 0;  // server clock - browser clock (ms)
+
+for (const [proto, groups] of Object.entries(spec.groups)) {
+  for (const group of groups) groupSelect.add(new Option(`${proto} / ${group}`, `${proto}\\n${group}`));
+}
+spec.metrics.forEach((name, i) => metricSelect.add(new Option(name, i)));
+
+function paint(k) {
+  const metric = Number(metricSelect.value);
+  context.fillStyle = spec.colorscale[state.colors[k * M + metric]];
+  context.fillRect((k % state.n) * state.cell, Math.floor(k / state.n) * state.cell, state.cell, state.cell);
+}
+
+function clear(k) {
+  context.fillStyle = spec.colorscale[0];
+  context.fillRect((k % state.n) * state.cell, Math.floor(k / state.n) * state.cell, state.cell, state.cell);
+}
+
+// blank the cells without a result for longer than maxAge
+function expire() {
+  if (!state) return;
+  const oldest = Date.now() + skew - state.maxAge;
+  for (let k = 0; k < state.n * state.n; k++) {
+    if (state.times[k] !== undefined && state.ends[k] < oldest) {
+      state.times[k] = undefined;
+      clear(k);
+    }
+  }
+}
+
+function paintAll() {
+  context.fillStyle = spec.colorscale[0];
+  context.fillRect(0, 0, canvas.width, canvas.height);
+  for (let k = 0; k < state.n * state.n; k++) if (state.times[k] !== undefined) paint(k);
+  const ticks = spec.ticktext[state.proto][spec.metrics[Number(metricSelect.value)]];
+  document.getElementById("legend").innerHTML = ticks.map(
+    (tick, i) => `<span><i style="background:${spec.colorscale[i]}"></i>${tick}</span>`).join("");
+}
+
+// row: src, dst, time, values (M), colors (M), ts_end (ms); cell k = dst * n + src
+function apply(rows, repaint) {
+  for (const row of rows) {
+    const k = row[1] * state.n + row[0];
+    state.times[k] = row[2];
+    state.ends[k] = row[3 + 2 * M];
+    for (let m = 0; m < M; m++) {
+      state.values[k * M + m] = row[3 + m];
+      state.colors[k * M + m] = row[3 + M + m];
+    }
+    if (repaint) paint(k);
+  }
+}
+
+function selection() {
+  const [proto, group] = groupSelect.value.split("\\n");
+  location.hash = `${encodeURIComponent(proto)}/${encodeURIComponent(group)}/${metricSelect.value}`;
+  return [proto, group];
+}
+
+function connect() {
+  if (source) source.close();
+  const [proto, group] = selection();
+  source = new EventSource(`${spec.url}?proto=${encodeURIComponent(proto)}&group=${encodeURIComponent(group)}`);
+  source.addEventListener("snapshot", (event) => {
+    const message = JSON.parse(event.data);
+    const n = message.ips.length;
+    const cell = Math.max(1, Math.floor(Math.min(800, window.innerHeight - 80) / Math.max(n, 1)));
+    state = {
+      proto: message.proto, ips: message.ips, n: n, cell: cell, maxAge: message.max_age_ms,
+      values: new Float64Array(n * n * M), colors: new Uint8Array(n * n * M), times: new Array(n * n),
+      ends: new Float64Array(n * n),
+    };
+    skew = message.now - Date.now();
+    canvas.width = canvas.height = n * cell;
+    apply(message.cells, false);
+    paintAll();
+    status.textContent = `${n} IPs, ${message.cells.length} pairs with data`;
+  });
+  source.addEventListener("cells", (event) => {
+    const message = JSON.parse(event.data);
+    const rows = message.cells;
+    skew = message.now - Date.now();
+    apply(rows, true);
+    updates += rows.length;
+    status.textContent = `${state.n} IPs, ${updates} cell updates, last at ${new Date().toLocaleTimeString()}`;
+  });
+  source.addEventListener("close", (event) => {
+    source.close();
+    status.textContent = event.data;
+  });
+  source.onerror = () => { status.textContent = "Disconnected, reconnecting..."; };
+}
+
+canvas.onmousemove = (event) => {
+  if (!state) return;
+  const rect = canvas.getBoundingClientRect();
+  const col = Math.floor((event.clientX - rect.left) / state.cell);
+  const row = Math.floor((event.clientY - rect.top) / state.cell);
+  if (col < 0 || row < 0 || col >= state.n || row >= state.n) return;
+  const k = row * state.n + col;
+  const time = state.times[k];
+  hover.innerHTML = `Src: ${state.ips[col]}<br>Dst: ${state.ips[row]}<br>` +
+    `Value: ${time === undefined ? -1 : state.values[k * M + Number(metricSelect.value)]}` +
+    `<br>Time: ${time === undefined ? "N/A" : time}`;
+  hover.style.left = `${event.clientX + 12}px`;
+  hover.style.top = `${event.clientY + 12}px`;
+  hover.style.display = "block";
+};
+canvas.onmouseleave = () => { hover.style.display = "none"; };
+groupSelect.onchange = connect;
+metricSelect.onchange = () => {
+  selection();
+  if (state) paintAll();
+};
+
+// #proto/group/metric
+const [proto, group, metric] = location.hash.slice(1).split("/").map(decodeURIComponent);
+if (group !== undefined) groupSelect.value = `${proto}\\n${group}`;
+if (metric !== undefined) metricSelect.value = metric;
+if (groupSelect.selectedIndex < 0) groupSelect.selectedIndex = 0;
+if (metricSelect.selectedIndex < 0) metricSelect.selectedIndex = 0;
+setInterval(expire, 5000);
+if (groupSelect.options.length) connect();
+else status.textContent = "No groups in the pinglist";
+</script>
+</body>
+</html>
+"""
@@ -9,7 +9,16 @@ LOG_DIR = os.path.join(SCRIPT_DIR, "../logs")
 UPLOAD_PATH = os.path.join(SCRIPT_DIR, "../upload")
 DOWNLOAD_PATH = os.path.join(SCRIPT_DIR, "../download")
 HTML_DIR = os.path.join(SCRIPT_DIR, "../html")
+HISTORY_DIR = os.path.join(SCRIPT_DIR, "../history")
+METRICS_DIR = os.path.join(SCRIPT_DIR, "../metrics")
+SNAPSHOT_DIR = os.path.join(SCRIPT_DIR, "../snapshot")
+TILE_DIR = os.path.join(SCRIPT_DIR, "../tiles")
 WEBSERVER_DIR = os.path.join(SCRIPT_DIR, "../webserver")
 
+# plotly.js bundle served by pingweave_server for the compact heatmap pages
+PLOTLY_JS_URL = "/plotly.min.js"
+# tiles of the heatmaps of large groups (see heatmap_tiles.py)
+HEATMAP_TILE_URL = "/heatmap_tiles"
+
 # filter out in plotting if a data is too old
 INTERVAL_PLOTTER_FILTER_OLD_DATA_SEC = 60 
\ No newline at end of file
@@ -0,0 +1,309 @@
+import asyncio
+import json
+import os
+import time
+from bisect import bisect_left
+from aiohttp import web
+
+# Self-instrumentation shared by pingweave_server, collector and plotter.
+#
+# Recording is a plain attribute update on a pre-created metric object,
+# e.g., `REQUESTS.inc()` or `with LATENCY.time(): ...`. Every process
+# periodically dumps its registry as JSON to METRICS_DIR, and /metrics
+# merges the snapshots of all processes (with a "process" label) into
+# the Prometheus text format.
+
+DEFAULT_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+    0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+)
+
+# name -> {"type", "help", "metrics": {labels (sorted tuple) -> metric}}
+registry = {}
+process_name = None
+
+
+class Counter:
+    __slots__ = ["value"]
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def snapshot(self):
+        return self.value
+
+
+class Gauge(Counter):
+    __slots__ = []
+
+    def set(self, value):
+        self.value = value
+
+    def dec(self, amount=1):
+        self.value -= amount
+
+
+class _Timer:
+    __slots__ = ["histogram", "start"]
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start)
+        return False
+
+
+class Histogram:
+    __slots__ = ["bounds", "counts", "sum", "count"]
+
+    def __init__(self, bounds=DEFAULT_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # last: +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def time(self):
+        return _Timer(self)
+
+    def merge(self, snapshot: dict):
+        """
+        Adds the observations of a snapshot() with the same bounds, e.g.,
+        recorded in a worker process.
+        """
+        for i, count in enumerate(snapshot["counts"]):
+            self.counts[i] += count
+        self.sum += snapshot["sum"]
+        self.count += snapshot["count"]
+
+    def snapshot(self):
+        return {
+            "bounds": list(self.bounds),
+            "counts": list(self.counts),
+            "sum": self.sum,
+            "count": self.count,
+        }
+
+
+def _get_or_create(cls, metric_type, name, help_text, labels, **kwargs):
+    family = registry.setdefault(
+        name, {"type": metric_type, "help": help_text, "metrics": {}}
+    )
+    key = tuple(sorted(labels.items()))
+    metric = family["metrics"].get(key)
+    if metric is None:
+        metric = family["metrics"][key] = cls(**kwargs)
+    return metric
+
+
+def counter(name: str, help_text: str = "", **labels) -> Counter:
+    return _get_or_create(Counter, "counter", name, help_text, labels)
+
+
+def gauge(name: str, help_text: str = "", **labels) -> Gauge:
+    return _get_or_create(Gauge, "gauge", name, help_text, labels)
+
+
+def histogram(name: str, help_text: str = "", buckets=DEFAULT_BUCKETS, **labels) -> Histogram:
+    return _get_or_create(Histogram, "histogram", name, help_text, labels, bounds=buckets)
+
+
+def snapshot_registry() -> dict:
+    return {
+        name: {
+            "type": family["type"],
+            "help": family["help"],
+            "samples": [
+                [dict(key), metric.snapshot()] for key, metric in family["metrics"].items()
+            ],
+        }
+        for name, family in registry.items()
+    }
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    escaped = [
+        f'{k}="' + str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+        for k, v in sorted(labels.items())
+    ]
+    return "{" + ",".join(escaped) + "}"
+
+
+def render_prometheus(snapshots: dict) -> str:
+    """
+    snapshots: process name -> snapshot_registry() of that process.
+    """
+    families = {}
+    for process, snapshot in sorted(snapshots.items()):
+        for name, family in snapshot.items():
+            merged = families.setdefault(
+                name, {"type": family["type"], "help": family["help"], "samples": []}
+            )
+            for labels, value in family["samples"]:
+                merged["samples"].append(({**labels, "process": process}, value))
+
+    lines = []
+    for name, family in sorted(families.items()):
+        lines.append(f"# HELP {name} {family['help']}")
+        lines.append(f"# TYPE {name} {family['type']}")
+        for labels, value in family["samples"]:
+            if family["type"] != "histogram":
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+                continue
+            cumulative = 0
+            for bound, count in zip(value["bounds"] + ["+Inf"], value["counts"]):
+                cumulative += count
+                lines.append(
+                    f"{name}_bucket{_format_labels({**labels, 'le': bound})} {cumulative}"
+                )
+            lines.append(f"{name}_sum{_format_labels(labels)} {value['sum']}")
+            lines.append(f"{name}_count{_format_labels(labels)} {value['count']}")
+    return "\n".join(lines) + "\n"
+
+
+def _snapshot_path(directory: str, name: str) -> str:
+    return os.path.join(directory, f"{name}.json")
+
+
+def write_snapshot(directory: str):
+    os.makedirs(directory, exist_ok=True)
+    path = _snapshot_path(directory, process_name)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(snapshot_registry(), f)
+    os.replace(tmp_path, path)
+
+
+def read_snapshots(directory: str, max_age_sec: float) -> dict:
+    """
+    Latest snapshots of all processes, skipping those of dead processes.
+    Our own registry is read live.
+    """
+    snapshots = {}
+    now = time.time()
+    if os.path.isdir(directory):
+        for filename in os.listdir(directory):
+            if not filename.endswith(".json"):
+                continue
+            path = os.path.join(directory, filename)
+            try:
+                if now - os.path.getmtime(path) > max_age_sec:
+                    continue
+                with open(path, "r") as f:
+                    snapshots[filename[: -len(".json")]] = json.load(f)
+            except (OSError, ValueError):
+                continue  # being replaced
+    if process_name is not None:
+        snapshots[process_name] = snapshot_registry()
+    return snapshots
+
+
+async def export_snapshots_periodically(directory: str, interval_sec: float, logger):
+    while True:
+        try:
+            write_snapshot(directory)
+        except Exception as e:
+            logger.error(f"Failed to write metrics snapshot: {e}")
+        await asyncio.sleep(interval_sec)
+
+
+def start_metrics_exporter(name: str, directory: str, logger, interval_sec: float = 5):
+    """
+    Names this process in the aggregated /metrics and starts dumping its
+    registry every `interval_sec`. Must be called from a running event loop.
+    """
+    global process_name
+    process_name = name
+    return asyncio.create_task(
+        export_snapshots_periodically(directory, interval_sec, logger)
+    )
+
+
+def metrics_handler(directory: str, max_age_sec: float = 30):
+    async def handle_metrics_get(request):
+        snapshots = read_snapshots(directory, max_age_sec)
+        return web.Response(
+            text=render_prometheus(snapshots), content_type="text/plain", charset="utf-8"
+        )
+
+    return handle_metrics_get
+
+
+# routes whose responses stay open (long polls, server-sent events): their
+# lifetime goes to pingweave_http_stream_duration_seconds, not the latency histogram
+LONG_LIVED_ROUTES = {"/watch", "/live/events"}
+LONG_LIVED_BUCKETS = (0.1, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0, 3600.0, 14400.0)
+
+# route -> [duration histogram, {status: requests counter}, request bytes counter or None]
+_route_metrics = {}
+
+
+def _request_metrics(route: str) -> list:
+    cached = _route_metrics.get(route)
+    if cached is None:
+        if route in LONG_LIVED_ROUTES:
+            duration = histogram(
+                "pingweave_http_stream_duration_seconds",
+                "Lifetime of a long-poll or streaming HTTP response",
+                buckets=LONG_LIVED_BUCKETS,
+                route=route,
+            )
+        else:
+            duration = histogram(
+                "pingweave_http_request_duration_seconds",
+                "Time to handle an HTTP request",
+                route=route,
+            )
+        cached = _route_metrics[route] = [duration, {}, None]
+    return cached
+
+
+@web.middleware
+async def metrics_middleware(request, handler):
+    """
+    Counts and times every request per route and response status.
+    The metric objects of a route are looked up once and cached.
+    """
+    resource = request.match_info.route.resource
+    route = resource.canonical if resource is not None else "unmatched"
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await handler(request)
+        status = response.status
+        return response
+    except web.HTTPException as e:
+        status = e.status
+        raise
+    finally:
+        cached = _request_metrics(route)
+        cached[0].observe(time.perf_counter() - start)
+        requests = cached[1].get(status)
+        if requests is None:
+            requests = cached[1][status] = counter(
+                "pingweave_http_requests_total",
+                "Number of handled HTTP requests",
+                route=route,
+                status=status,
+            )
+        requests.inc()
+        if request.content_length:
+            if cached[2] is None:
+                cached[2] = counter(
+                    "pingweave_http_request_bytes_total", "Bytes of HTTP request bodies", route=route
+                )
+            cached[2].inc(request.content_length)
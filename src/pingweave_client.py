@@ -5,9 +5,12 @@ import time
 import json
 import socket
 import random
+import gzip
+import threading
 import yaml  # python3 -m pip install pyyaml
 import urllib.request  # python3 -m pip install urllib
 import urllib.error
+import urllib.parse
 from logger import initialize_pingweave_logger
 from macro import *
 
@@ -22,6 +25,17 @@ control_port = None
 collect_port = None
 interval_sync_pinglist_sec = None
 interval_read_pinglist_sec = None
+watch_timeout_sec = None
+
+# data_type -> ETag of the saved YAML file (only fetched again if changed)
+saved_etags = {}
+
+# after a change, the next /watch waits at least this long (coalesces bursts)
+WATCH_MIN_INTERVAL_SEC = 1
+
+# address_store as saved, and its version at the server (for delta sync)
+address_store_cache = None
+address_store_version = None
 
 python_version = sys.version_info
 if python_version < (3, 6):
@@ -34,6 +48,7 @@ def load_config_ini():
     Reads the configuration file and updates global variables.
     """
     global control_host, control_port, collect_port, interval_sync_pinglist_sec, interval_read_pinglist_sec
+    global watch_timeout_sec
 
     try:
         config.read(CONFIG_PATH)
@@ -45,6 +60,7 @@ def load_config_ini():
 
         interval_sync_pinglist_sec = int(config["param"]["interval_sync_pinglist_sec"])
         interval_read_pinglist_sec = int(config["param"]["interval_read_pinglist_sec"])
+        watch_timeout_sec = max(0, config["param"].getint("watch_timeout_sec", fallback=60))
 
         logger.debug(f"Configuration reloaded successfully from {CONFIG_PATH}.")
     except Exception as e:
@@ -54,9 +70,39 @@ def load_config_ini():
         )
         interval_sync_pinglist_sec = 60
         interval_read_pinglist_sec = 60
+        watch_timeout_sec = 60
 
 
-def fetch_data(ip, port, data_type):
+def get_local_ips():
+    """
+    IPv4 addresses of this node (except loopback), via psutil if installed.
+    """
+    try:
+        import psutil
+
+        ips = [
+            addr.address
+            for addrs in psutil.net_if_addrs().values()
+            for addr in addrs
+            if addr.family == socket.AF_INET
+        ]
+    except ImportError:
+        import fcntl
+        import struct
+
+        ips = []
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            for _, ifname in socket.if_nameindex():
+                try:
+                    ifreq = struct.pack("256s", ifname.encode()[:15])
+                    # SIOCGIFADDR: primary IPv4 address of the interface
+                    ips.append(socket.inet_ntoa(fcntl.ioctl(sock.fileno(), 0x8915, ifreq)[20:24]))
+                except OSError:
+                    continue
+    return sorted(set(ip for ip in ips if not ip.startswith("127.")))
+
+
+def fetch_data(ip, port, data_type, query=None):
     """
     Fetches data from the server and saves it as a YAML file.
     """
@@ -64,10 +110,18 @@ def fetch_data(ip, port, data_type):
     is_error = False
     try:
         url = f"http://{ip}:{port}/{data_type}"
+        if query:
+            url += "?" + urllib.parse.urlencode(query)
         logger.debug(f"Requesting {url}")
         request = urllib.request.Request(url)
+        request.add_header("Accept-Encoding", "gzip")
+        etag = saved_etags.pop(data_type, None)
+        if etag != None and os.path.isfile(yaml_file_path):
+            request.add_header("If-None-Match", etag)
         with urllib.request.urlopen(request) as response:
             data = response.read()
+            if response.headers.get("Content-Encoding") == "gzip":
+                data = gzip.decompress(data)
             logger.debug(f"Received {data_type} data.")
 
             # Parse JSON data
@@ -77,8 +131,17 @@ def fetch_data(ip, port, data_type):
             with open(yaml_file_path, "w") as yaml_file:
                 yaml.dump(parsed_data, yaml_file, default_flow_style=False)
 
+            if response.headers.get("ETag") != None:
+                saved_etags[data_type] = response.headers.get("ETag")
             logger.debug(f"Saved {data_type} data to {yaml_file_path}.")
 
+    except urllib.error.HTTPError as e:
+        if e.code == 304:  # the saved file is up to date
+            saved_etags[data_type] = etag
+            logger.debug(f"{data_type} is not modified.")
+        else:
+            logger.error(f"HTTPError for {data_type} ({e.code}): {e.reason}")
+            is_error = True
     except (yaml.YAMLError, json.JSONDecodeError) as e:
         logger.error(f"Failed to parse or write {data_type} as YAML: {e}")
         is_error = True
@@ -98,12 +161,101 @@ def fetch_data(ip, port, data_type):
             yaml.dump({}, yaml_file, default_flow_style=False)
 
 
-def send_gid_files(ip, port):
+def fetch_address_store(ip, port):
     """
-    Sends GID files to the server via HTTP POST requests.
+    Fetches the changes of address_store since the last sync (everything at
+    first or if the server asks for a full resync), and saves the updated
+    address_store as a YAML file if anything changed.
+    """
+    global address_store_cache, address_store_version
+
+    yaml_file_path = os.path.join(DOWNLOAD_PATH, "address_store.yaml")
+    if not os.path.isfile(yaml_file_path):
+        address_store_cache = None
+    # version 0 is older than any at the server: everything
+    since = address_store_version if address_store_cache != None else 0
+    try:
+        url = f"http://{ip}:{port}/address_store?since={since}"
+        logger.debug(f"Requesting {url}")
+        with urllib.request.urlopen(urllib.request.Request(url)) as response:
+            data = json.loads(response.read().decode())
+
+        if "version" not in data or not isinstance(data.get("entries"), dict):
+            store, changed = data, True  # an older server: always everything
+            address_store_version = None
+        elif data["full"] or address_store_cache == None:
+            store, changed = dict(data["entries"]), True
+            address_store_version = data["version"]
+        else:
+            store = address_store_cache
+            store.update(data["entries"])
+            for removed_ip in data["removed"]:
+                store.pop(removed_ip, None)
+            changed = bool(data["entries"] or data["removed"])
+            address_store_version = data["version"]
+        logger.debug(
+            f"Received address_store since version {since}: {len(data.get('entries', data))} entries."
+        )
+
+        if changed:
+            with open(yaml_file_path, "w") as yaml_file:
+                yaml.dump(store, yaml_file, default_flow_style=False)
+            logger.debug(f"Saved address_store data to {yaml_file_path}.")
+        address_store_cache = store if address_store_version != None else None
+        return
+
+    except (yaml.YAMLError, json.JSONDecodeError, KeyError, TypeError) as e:
+        logger.error(f"Failed to parse or write address_store as YAML: {e}")
+    except urllib.error.URLError as e:
+        logger.error(
+            f"Failed to connect to the server at {ip}:{port} for address_store. Error: {e}"
+        )
+    except Exception as e:
+        logger.error(f"An unexpected error occurred while fetching address_store: {e}")
+
+    # If an error occurs, write an empty YAML file to prevent issues (and resync in full)
+    address_store_cache = None
+    logger.debug("Dumping an empty YAML for address_store.")
+    with open(yaml_file_path, "w") as yaml_file:
+        yaml.dump({}, yaml_file, default_flow_style=False)
+
+
+def watch_changes(ip, port, timeout):
+    """
+    Waits at the server (/watch) until this node's pinglist or address_store
+    differs from the saved ones, or for `timeout` seconds. Returns (pinglist
+    changed, address_store changed), or None if the server has no /watch or
+    the request failed.
+    """
+    query = {"node": ",".join(get_local_ips()), "timeout": timeout}
+    if saved_etags.get("pinglist") != None:
+        query["pinglist_version"] = saved_etags["pinglist"]
+    if address_store_cache != None:
+        query["address_version"] = address_store_version
+    try:
+        url = f"http://{ip}:{port}/watch?" + urllib.parse.urlencode(query)
+        logger.debug(f"Requesting {url}")
+        with urllib.request.urlopen(urllib.request.Request(url), timeout=timeout + 30) as response:
+            data = json.loads(response.read().decode())
+        return data["pinglist"], data["address_store"]
+    except urllib.error.HTTPError as e:
+        if e.code == 404:
+            logger.debug("The server does not support /watch. Polling instead.")
+        else:
+            logger.error(f"HTTPError for watch ({e.code}): {e.reason}")
+    except Exception as e:
+        logger.error(f"Failed to watch changes at the server at {ip}:{port}: {e}")
+    return None
+
+
+def send_gid_files(ip, port, filenames=None):
+    """
+    Sends GID files (or only `filenames` of them) to the server via HTTP POST requests.
     """
     for filename in os.listdir(UPLOAD_PATH):
         filepath = os.path.join(UPLOAD_PATH, filename)
+        if filenames != None and filename not in filenames:
+            continue
 
         if (
             os.path.isfile(filepath) and filename.count(".") == 3
@@ -173,20 +325,64 @@ def send_gid_files(ip, port):
             except Exception as e:
                 logger.error(f"Unexpected error with file {filename}: {e}")
         
+def send_gid_files_periodically():
+    """
+    Sends a GID file as soon as the agent rewrites it (a new QP, checked every
+    second), and all of them every watch_timeout_sec (interval_sync_pinglist_sec
+    without /watch) to keep them from expiring at the server.
+    """
+    sent_mtimes = {}
+    last_sent_all = 0
+    while True:
+        try:
+            mtimes = {
+                filename: os.stat(os.path.join(UPLOAD_PATH, filename)).st_mtime_ns
+                for filename in os.listdir(UPLOAD_PATH)
+            }
+            interval_sec = watch_timeout_sec if watch_timeout_sec > 0 else interval_sync_pinglist_sec
+            if last_sent_all + interval_sec <= time.time():
+                last_sent_all = time.time()
+                send_gid_files(control_host, control_port)
+            else:
+                changed = [f for f, mtime in mtimes.items() if sent_mtimes.get(f) != mtime]
+                if changed:
+                    send_gid_files(control_host, control_port, changed)
+            sent_mtimes = mtimes
+        except Exception as e:
+            logger.error(f"Failed to send GID files: {e}")
+        time.sleep(1)
+
+
 def main():
+    load_config_ini()
+    threading.Thread(target=send_gid_files_periodically, daemon=True).start()
+
+    sync_pinglist, sync_address_store = True, True
+    last_watch = 0
     while True:
         # Load the config file
         load_config_ini()
 
-        # Send gid files
-        send_gid_files(control_host, control_port)
-
-        # Fetch pinglist and address_store
-        fetch_data(control_host, control_port, "pinglist")
-        fetch_data(control_host, control_port, "address_store")
-
-        # Sleep to prevent high CPU usage + small delay
-        time.sleep(interval_sync_pinglist_sec + random.randint(0,10) * 0.01)
+        # Fetch pinglist and address_store (if changed)
+        # only the groups including this node's IPs
+        if sync_pinglist:
+            fetch_data(control_host, control_port, "pinglist", {"node": ",".join(get_local_ips())})
+        if sync_address_store:
+            fetch_address_store(control_host, control_port)
+
+        # Wait until either changes at the server (long poll), if both are in sync
+        changed = None
+        if watch_timeout_sec > 0 and saved_etags.get("pinglist") != None and address_store_cache != None:
+            # at most one sync per WATCH_MIN_INTERVAL_SEC during bursts of changes
+            time.sleep(max(0, last_watch + WATCH_MIN_INTERVAL_SEC - time.time()))
+            last_watch = time.time()
+            changed = watch_changes(control_host, control_port, watch_timeout_sec)
+        if changed == None:
+            # Sleep to prevent high CPU usage + small delay
+            time.sleep(interval_sync_pinglist_sec + random.randint(0,10) * 0.01)
+            sync_pinglist, sync_address_store = True, True
+        else:
+            sync_pinglist, sync_address_store = changed
 
 
 if __name__ == "__main__":
@@ -7,8 +7,24 @@ import time
 import socket
 import psutil
 import multiprocessing
+import importlib.util
+import re
+import gzip
+import hashlib
+import json
+import collections
 
 from logger import initialize_pingweave_logger
+import metrics
+from shm_matrix import (
+    create_latest_matrices,
+    matrix_sizes,
+    release_latest_matrices,
+    reserve_pinglist,
+)
+from anomaly import create_anomaly_detectors, release_anomaly_detectors
+from heatmap_tiles import read_tile_value
+from live import LiveFeed, live_events_handler, live_page_handler
 import yaml  # python3 -m pip install pyyaml
 from aiohttp import web  # requires python >= 3.7
 from macro import *
@@ -17,19 +33,83 @@ logger = initialize_pingweave_logger(socket.gethostname(), "server", 30, False)
 
 # Variables to save pinglist
 pinglist_in_memory = {}
-address_store = {}  # (for RDMA) ip -> (ip, gid, lid, qpn, dtime)
-address_store_checkpoint = 0
+pinglist_file_stat = None  # (mtime_ns, size) of the loaded pinglist.yaml
+pinglist_digest = None  # sha1 of the loaded pinglist.yaml
+pinglist_response = None  # (ETag, JSON body, gzipped body) of GET /pinglist
+pinglist_ip_groups = {}  # ip -> [(proto, group), ...] of the groups including the ip
+pinglist_slices = {}  # groups of a node -> its (ETag, JSON body, gzipped body)
+# (for RDMA) ip -> (ip, gid, lid, qpn, dtime, utime), least recently updated
+# (posted) first: expiry and eviction take entries from the front
+address_store = collections.OrderedDict()
+# Versions of address_store for delta sync (/address_store?since=<version>).
+# Every add, update (except utime) and removal of an entry bumps the version;
+# it starts at the server's start time (ns), above the versions of a previous run.
+address_store_version = time.time_ns()
+address_store_base_version = address_store_version  # deltas from older versions are incomplete
+address_store_changes = collections.OrderedDict()  # ip -> version of its last change, oldest first
 pinglist_lock = asyncio.Lock()
 address_store_lock = asyncio.Lock()
+# set (and replaced) at every change of the pinglist or address_store (/watch)
+watch_changed = asyncio.Event()
+
+# Self-instrumentation (see metrics.py)
+PINGLIST_LOCK_HOLD = metrics.histogram(
+    "pingweave_lock_hold_seconds", "Time a lock is held", lock="pinglist_lock"
+)
+ADDRESS_STORE_LOCK_HOLD = metrics.histogram(
+    "pingweave_lock_hold_seconds", "Time a lock is held", lock="address_store_lock"
+)
+PINGLIST_RELOAD = metrics.histogram(
+    "pingweave_pinglist_reload_seconds", "Time to reload pinglist.yaml"
+)
+PINGLIST_SENT = metrics.counter(
+    "pingweave_pinglist_responses_total", "Number of pinglist responses", status="200"
+)
+PINGLIST_NOT_MODIFIED = metrics.counter(
+    "pingweave_pinglist_responses_total", "Number of pinglist responses", status="304"
+)
+ADDRESS_STORE_SIZE = metrics.gauge(
+    "pingweave_address_store_entries", "Number of entries in address_store"
+)
+ADDRESS_STORE_EXPIRED = metrics.counter(
+    "pingweave_address_store_expired_total", "Number of expired address_store entries"
+)
+WATCHERS = metrics.gauge("pingweave_watchers", "Number of clients waiting in /watch")
+ADDRESS_STORE_EVICTED = metrics.counter(
+    "pingweave_address_store_evicted_total",
+    "Number of address_store entries evicted for capacity",
+)
 
 # ConfigParser object
 config = configparser.ConfigParser()
 
+# /watch: default and max time a client waits for a change
+WATCH_DEFAULT_TIMEOUT_SEC = 60
+WATCH_MAX_TIMEOUT_SEC = 300
+
+# how often expired address_store entries are removed
+ADDRESS_STORE_EXPIRE_INTERVAL_SEC = 5
+
+# max number of removed IPs remembered for delta sync of address_store
+ADDRESS_STORE_MAX_REMOVED = 10000
+
+# max number of cached per-node pinglists (distinct sets of groups)
+PINGLIST_MAX_SLICES = 4096
+
+# libyaml's loader is much faster than the pure-Python one, if pyyaml was built with it
+YAML_SAFE_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
 # Global variables
 control_host = None
 control_port = None
 interval_sync_pinglist_sec = None
 interval_read_pinglist_sec = None
+shm_max_nodes = None
+shm_max_pairs = None
+collector_workers = None
+live_poll_interval_ms = None
+address_store_max_entries = None
+address_store_expire_sec = None
 
 python_version = sys.version_info
 if python_version < (3, 7):
@@ -70,6 +150,8 @@ def load_config_ini():
     Reads the configuration file and updates global variables.
     """
     global control_host, control_port, interval_sync_pinglist_sec, interval_read_pinglist_sec
+    global shm_max_nodes, shm_max_pairs, collector_workers, live_poll_interval_ms
+    global address_store_max_entries, address_store_expire_sec
 
     try:
         config.read(CONFIG_PATH)
@@ -77,6 +159,20 @@ def load_config_ini():
         # Update variables
         control_host = config["controller"]["host"]
         control_port = int(config["controller"]["port_control"])
+        shm_max_nodes = max(0, config["controller"].getint("shm_max_nodes", fallback=0))
+        shm_max_pairs = max(0, config["controller"].getint("shm_max_pairs", fallback=0))
+        collector_workers = max(
+            1, config["controller"].getint("collector_workers", fallback=1)
+        )
+        live_poll_interval_ms = max(
+            100, config["controller"].getint("live_poll_interval_ms", fallback=1000)
+        )
+        address_store_max_entries = max(
+            1, config["controller"].getint("address_store_max_entries", fallback=10000)
+        )
+        address_store_expire_sec = config["controller"].getint(
+            "address_store_expire_sec", fallback=300
+        )
 
         interval_sync_pinglist_sec = int(config["param"]["interval_sync_pinglist_sec"])
         interval_read_pinglist_sec = int(config["param"]["interval_read_pinglist_sec"])
@@ -90,24 +186,138 @@ def load_config_ini():
         )
         interval_sync_pinglist_sec = 60
         interval_read_pinglist_sec = 60
+        shm_max_nodes = 0
+        shm_max_pairs = 0
+        collector_workers = 1
+        live_poll_interval_ms = 1000
+        address_store_max_entries = 10000
+        address_store_expire_sec = 300
+
+
+def encode_pinglist_response(pinglist) -> tuple:
+    """
+    (ETag, JSON body, gzipped JSON body) of a /pinglist response, encoded once.
+    """
+    body = json.dumps(pinglist).encode()
+    etag = f'"{hashlib.sha1(body).hexdigest()[:20]}"'
+    return etag, body, gzip.compress(body, compresslevel=9, mtime=0)
+
+
+def index_pinglist(pinglist) -> dict:
+    """
+    ip -> (proto, group) of all groups that include the ip, in pinglist order.
+    """
+    ip_groups = {}
+    if not isinstance(pinglist, dict):
+        return ip_groups
+    for proto, groups in pinglist.items():
+        if not isinstance(groups, dict):
+            continue
+        for group, ips in groups.items():
+            for ip in ips or []:
+                entries = ip_groups.setdefault(ip, [])
+                if not entries or entries[-1] != (proto, group):
+                    entries.append((proto, group))
+    return ip_groups
+
+
+def slice_pinglist(pinglist, groups) -> dict:
+    """
+    The pinglist reduced to `groups` (a set of (proto, group)). Every protocol
+    is kept, even without groups, so agents do not take a node without groups
+    for a failed download.
+    """
+    if not isinstance(pinglist, dict):
+        return pinglist
+    sliced = {}
+    for proto, proto_groups in pinglist.items():
+        if isinstance(proto_groups, dict):
+            sliced[proto] = {
+                group: ips for group, ips in proto_groups.items() if (proto, group) in groups
+            }
+        else:
+            sliced[proto] = proto_groups
+    return sliced
+
+
+def load_pinglist_file(data: bytes):
+    """
+    Parses pinglist.yaml, encodes its /pinglist response and indexes its
+    groups by IP: (pinglist, response, ip -> groups).
+    """
+    pinglist = yaml.load(data, Loader=YAML_SAFE_LOADER)
+    return pinglist, encode_pinglist_response(pinglist), index_pinglist(pinglist)
+
+
+async def set_pinglist(pinglist, response: tuple, ip_groups: dict, file_stat, digest):
+    global pinglist_in_memory, pinglist_file_stat, pinglist_digest
+    global pinglist_response, pinglist_ip_groups, pinglist_slices
+
+    async with pinglist_lock:
+        with PINGLIST_LOCK_HOLD.time():
+            pinglist_in_memory = pinglist
+            pinglist_file_stat = file_stat
+            pinglist_digest = digest
+            pinglist_response = response
+            pinglist_ip_groups = ip_groups
+            pinglist_slices = {}
+    notify_watchers()
 
 
 async def read_pinglist():
-    global pinglist_in_memory
+    """
+    Reloads pinglist.yaml only if its mtime/size and then its content changed.
+    """
+    global pinglist_file_stat
 
     try:
-        async with pinglist_lock:
-            pinglist_in_memory.clear()
-            if os.path.isfile(PINGLIST_PATH):
-                with open(PINGLIST_PATH, "r") as file:
-                    pinglist_in_memory = yaml.safe_load(file)
-                    logger.debug("Pinglist loaded successfully.")
-            else:
-                logger.error(f"Pinglist file not found at {PINGLIST_PATH}")
+        if not os.path.isfile(PINGLIST_PATH):
+            logger.error(f"Pinglist file not found at {PINGLIST_PATH}")
+            if pinglist_response != None and pinglist_digest == None:
+                return  # already empty, do not wake the watchers again
+            await set_pinglist({}, encode_pinglist_response({}), {}, None, None)
+            return
+
+        stat = os.stat(PINGLIST_PATH)
+        file_stat = (stat.st_mtime_ns, stat.st_size)
+        if file_stat == pinglist_file_stat:
+            return
+
+        with open(PINGLIST_PATH, "rb") as file:
+            data = file.read()
+        digest = hashlib.sha1(data).hexdigest()
+        if digest == pinglist_digest:  # touched, not changed
+            pinglist_file_stat = file_stat
+            return
+
+        # parse, encode and index off the event loop
+        loop = asyncio.get_running_loop()
+        with PINGLIST_RELOAD.time():
+            pinglist, response, ip_groups = await loop.run_in_executor(
+                None, load_pinglist_file, data
+            )
+        await set_pinglist(pinglist, response, ip_groups, file_stat, digest)
+        log_unreserved_groups(await loop.run_in_executor(None, reserve_pinglist, pinglist))
+        logger.info(
+            f"Pinglist loaded successfully (version {response[0]}, {len(response[1])} bytes, "
+            f"{len(response[2])} gzipped, {len(ip_groups)} IPs)."
+        )
     except Exception as e:
         logger.error(f"Error loading pinglist: {e}")
 
 
+def log_unreserved_groups(groups: list):
+    """
+    Warns about the groups without cells in the shared-memory matrices.
+    """
+    if groups:
+        logger.warning(
+            f"{len(groups)} groups do not fit in the shared-memory matrices "
+            f"(shm_max_nodes/shm_max_pairs), the plotter reads them from Redis: "
+            f"{', '.join(f'{proto}/{group}' for proto, group in groups[:10])}"
+        )
+
+
 async def read_pinglist_periodically():
     load_config_ini()
     try:
@@ -120,35 +330,232 @@ async def read_pinglist_periodically():
         logger.error(f"Exception in read_pinglist_periodically: {e}")
 
 
+def etag_matches(etag: str, if_none_match: str) -> bool:
+    """
+    True if an If-None-Match header ("*" or a list of (weak) ETags) matches `etag`.
+    """
+    if not if_none_match:
+        return False
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag == "*" or tag == etag:
+            return True
+    return False
+
+
+def notify_watchers():
+    """
+    Wakes up all clients waiting in /watch.
+    """
+    global watch_changed
+    watch_changed.set()
+    watch_changed = asyncio.Event()
+
+
+async def get_pinglist_response(nodes: str):
+    """
+    (ETag, JSON body, gzipped body) of the pinglist, or of the groups
+    including `nodes` ("<ip>,<ip>,..."), if not None. None until loaded.
+    """
+    async with pinglist_lock:
+        with PINGLIST_LOCK_HOLD.time():
+            pinglist, response = pinglist_in_memory, pinglist_response
+            ip_groups, slices = pinglist_ip_groups, pinglist_slices
+    if response == None or nodes == None:
+        return response
+
+    groups = frozenset(
+        group for ip in nodes.split(",") for group in ip_groups.get(ip.strip(), [])
+    )
+    response = slices.get(groups)
+    if response == None:
+        response = encode_pinglist_response(slice_pinglist(pinglist, groups))
+        if len(slices) >= PINGLIST_MAX_SLICES:
+            slices.clear()
+        slices[groups] = response
+    return response
+
+
 async def get_pinglist(request):
+    # ?node=<ip>,<ip>,...: only the groups including the node's IPs
     client_ip = request.remote
-    async with pinglist_lock:
-        response_data = pinglist_in_memory
-    logger.debug(f"(SEND) pinglist.yaml to client: {client_ip}")
-    return web.json_response(response_data)
+    response = await get_pinglist_response(request.query.get("node"))
+    if response == None:
+        raise web.HTTPServiceUnavailable(text="Pinglist is not loaded yet")
+    etag, body, body_gzip = response
+
+    headers = {"Cache-Control": "no-cache", "Vary": "Accept-Encoding", "ETag": etag}
+    if etag_matches(etag, request.headers.get("If-None-Match")):
+        PINGLIST_NOT_MODIFIED.inc()
+        logger.debug(f"(SEND) pinglist.yaml not modified to client: {client_ip}")
+        return web.Response(status=304, headers=headers)
+
+    if "gzip" in request.headers.get("Accept-Encoding", "").lower():
+        headers["Content-Encoding"] = "gzip"
+        body = body_gzip
+    PINGLIST_SENT.inc()
+    logger.debug(f"(SEND) pinglist.yaml to client: {client_ip} ({len(body)} bytes)")
+    return web.Response(body=body, content_type="application/json", headers=headers)
+
+
+async def get_watch(request):
+    # ?node=&pinglist_version=<ETag>&address_version=<version>&timeout=<sec>:
+    # waits until the node's pinglist or address_store differs from the given
+    # versions (each optional) or the timeout expires, then returns the
+    # current versions and what changed
+    client_ip = request.remote
+    nodes = request.query.get("node")
+    pinglist_version = request.query.get("pinglist_version")
+    try:
+        address_version = request.query.get("address_version")
+        address_version = int(address_version) if address_version != None else None
+        timeout = float(request.query.get("timeout", WATCH_DEFAULT_TIMEOUT_SEC))
+    except ValueError:
+        raise web.HTTPBadRequest(text="Invalid watch parameters")
+    timeout = min(max(0, timeout), WATCH_MAX_TIMEOUT_SEC)
+
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    WATCHERS.inc()
+    try:
+        while True:
+            changed = watch_changed  # before reading the versions: no missed change
+            response = await get_pinglist_response(nodes)
+            current_pinglist_version = response[0] if response != None else None
+            current_address_version = address_store_version
+            pinglist_changed = (
+                pinglist_version != None
+                and current_pinglist_version != None  # (not loaded yet)
+                and current_pinglist_version != pinglist_version
+            )
+            address_changed = (
+                address_version != None and current_address_version != address_version
+            )
+            remaining = deadline - loop.time()
+            if pinglist_changed or address_changed or remaining <= 0:
+                break
+            try:
+                await asyncio.wait_for(changed.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        WATCHERS.dec()
+
+    logger.debug(
+        f"(SEND) watch to client: {client_ip} (pinglist: {pinglist_changed}, address_store: {address_changed})"
+    )
+    return web.json_response(
+        dict(
+            pinglist_version=current_pinglist_version,
+            address_version=current_address_version,
+            pinglist=pinglist_changed,
+            address_store=address_changed,
+        )
+    )
+
+
+def record_address_change(ip: str):
+    """
+    Stamps a change of address_store[ip] (added, updated or removed) with a
+    new version. Call under address_store_lock, after the change.
+    """
+    global address_store_version, address_store_base_version
+
+    address_store_version += 1
+    address_store_changes[ip] = address_store_version
+    address_store_changes.move_to_end(ip)
+    notify_watchers()
+
+    # forget removed IPs beyond the limit (older versions get a full resync)
+    if len(address_store_changes) - len(address_store) > ADDRESS_STORE_MAX_REMOVED:
+        for removed_ip, version in list(address_store_changes.items()):
+            if removed_ip not in address_store:
+                address_store_base_version = max(address_store_base_version, version)
+                address_store_changes.pop(removed_ip)
+
+
+def address_store_delta(since: int):
+    """
+    (entries, removed IPs) changed after version `since`, or None if the
+    changes since then are unknown (a full resync is needed). Call under
+    address_store_lock.
+    """
+    if since < address_store_base_version or since > address_store_version:
+        return None
+    entries, removed = {}, []
+    for ip in reversed(address_store_changes):
+        if address_store_changes[ip] <= since:
+            break
+        if ip in address_store:
+            entries[ip] = address_store[ip]
+        else:
+            removed.append(ip)
+    return entries, removed
 
 
 async def get_address_store(request):
-    current_time = int(time.time())
+    # ?since=<version>: {"version", "full", "entries", "removed"}, the changes
+    # after `version` (or all entries if full); without it, all entries as before
     client_ip = request.remote
+    try:
+        since = int(request.query["since"]) if "since" in request.query else None
+    except ValueError:
+        raise web.HTTPBadRequest(text="Invalid address_store version")
+
     async with address_store_lock:
-        global address_store_checkpoint
-
-        # condition to filter old entries (every 1 minute)
-        if address_store_checkpoint + 60 < current_time:
-            # get keys which was not updated in last 5 minutes
-            keys_old_entries = [
-                key
-                for key, value in address_store.items()
-                if value[5] + 300 < current_time
-            ]
-            for key in keys_old_entries:
-                logger.error(f"(EXPIRED) Remove old address information: {key}")
-                address_store.pop(key)
-            address_store_checkpoint = current_time
-        response_data = address_store
+        with ADDRESS_STORE_LOCK_HOLD.time():
+            if since == None:
+                response_data = address_store
+            else:
+                delta = address_store_delta(since)
+                if delta == None:
+                    entries, removed = dict(address_store), []
+                else:
+                    entries, removed = delta
+                response_data = dict(
+                    version=address_store_version,
+                    full=delta == None,
+                    entries=entries,
+                    removed=removed,
+                )
+            response = web.json_response(response_data)
     logger.debug(f"(SEND) address_store to client: {client_ip}")
-    return web.json_response(response_data)
+    return response
+
+
+def expire_address_store(current_time: int) -> int:
+    """
+    Removes the entries not updated for address_store_expire_sec, from the
+    front (least recently updated) of address_store: O(expired entries).
+    Call under address_store_lock. Returns the number of removed entries.
+    """
+    n_expired = 0
+    while address_store:
+        key, value = next(iter(address_store.items()))
+        if value[5] + address_store_expire_sec >= current_time:
+            break
+        logger.error(f"(EXPIRED) Remove old address information: {key}")
+        address_store.popitem(last=False)
+        record_address_change(key)
+        n_expired += 1
+    return n_expired
+
+
+async def expire_address_store_periodically():
+    try:
+        while True:
+            await asyncio.sleep(ADDRESS_STORE_EXPIRE_INTERVAL_SEC)
+            async with address_store_lock:
+                with ADDRESS_STORE_LOCK_HOLD.time():
+                    n_expired = expire_address_store(int(time.time()))
+                    ADDRESS_STORE_EXPIRED.inc(n_expired)
+                    ADDRESS_STORE_SIZE.set(len(address_store))
+    except asyncio.CancelledError:
+        logger.info("expire_address_store_periodically task was cancelled.")
+    except Exception as e:
+        logger.error(f"Exception in expire_address_store_periodically: {e}")
 
 
 async def post_address(request):
@@ -164,26 +571,37 @@ async def post_address(request):
 
         if all([ip_address, gid, lid, qpn, dtime]):
             async with address_store_lock:
-                address_store[ip_address] = [
-                    ip_address,
-                    gid,
-                    int(lid),
-                    int(qpn),
-                    str(dtime),
-                    int(utime),
-                ]
-                logger.debug(
-                    f"(RECV) POST from {client_ip}. Updated address store (size: {len(address_store)})."
-                )
-
-                if len(address_store) > 10000:
-                    logger.critical(
-                        f"Too many entries in address_store: {len(address_store)}"
-                    )
-                    logger.error(
-                        "Cleaning up address_store. Check your configuration."
+                with ADDRESS_STORE_LOCK_HOLD.time():
+                    entry = [
+                        ip_address,
+                        gid,
+                        int(lid),
+                        int(qpn),
+                        str(dtime),
+                        int(utime),
+                    ]
+                    old_entry = address_store.pop(ip_address, None)
+                    address_store[ip_address] = entry  # most recently updated
+                    # a refreshed utime alone is not a change for clients
+                    if old_entry == None or old_entry[:5] != entry[:5]:
+                        record_address_change(ip_address)
+                    logger.debug(
+                        f"(RECV) POST from {client_ip}. Updated address store (size: {len(address_store)})."
                     )
-                    address_store.clear()
+
+                    # evict the least recently updated entries beyond the capacity
+                    n_evicted = 0
+                    while len(address_store) > address_store_max_entries:
+                        key, _ = address_store.popitem(last=False)
+                        record_address_change(key)
+                        n_evicted += 1
+                    if n_evicted > 0:
+                        ADDRESS_STORE_EVICTED.inc(n_evicted)
+                        logger.critical(
+                            f"address_store is full ({address_store_max_entries} entries). "
+                            f"Evicted {n_evicted} least recently updated entries. Check your configuration."
+                        )
+                    ADDRESS_STORE_SIZE.set(len(address_store))
             return web.Response(text="Address updated", status=200)
         else:
             logger.warning(f"(RECV) Incorrect POST format from {client_ip}")
@@ -205,6 +623,7 @@ async def index(request):
         <head><title>Available HTML Files</title></head>
         <body>
             <h1>Available pingmesh list</h1>
+            <p><a href="/live">Live view</a> (updated as results arrive)</p>
             <ul>
                 {''.join(file_links)}
             </ul>
@@ -214,6 +633,52 @@ async def index(request):
     return web.Response(text=content, content_type="text/html")
 
 
+def find_plotly_js():
+    """
+    plotly.js bundled with the plotly package (used by the plotter), or None.
+    """
+    spec = importlib.util.find_spec("plotly")
+    if spec == None or not spec.submodule_search_locations:
+        return None
+    path = os.path.join(spec.submodule_search_locations[0], "package_data", "plotly.min.js")
+    return path if os.path.isfile(path) else None
+
+
+async def get_plotly_js(request):
+    # one cached copy of plotly.js for all compact heatmap pages
+    path = find_plotly_js()
+    if path == None:
+        raise web.HTTPNotFound(text="plotly.js is not installed")
+    return web.FileResponse(path, headers={"Cache-Control": "public, max-age=86400"})
+
+
+async def get_heatmap_tile(request):
+    # one tile of a large group's heatmap pyramid, reduced to one value
+    name = request.match_info["name"]
+    value_name = request.query.get("value", "")
+    if not re.fullmatch(r"[\w-][\w.-]*", name):
+        raise web.HTTPBadRequest(text="Invalid heatmap name")
+    try:
+        body = read_tile_value(
+            TILE_DIR,
+            name,
+            int(request.match_info["level"]),
+            int(request.match_info["ty"]),
+            int(request.match_info["tx"]),
+            value_name,
+        )
+    except FileNotFoundError:
+        raise web.HTTPNotFound(text="No such heatmap tile")
+    except ValueError as e:
+        logger.error(f"Invalid heatmap tile {request.path}: {e}")
+        raise web.HTTPInternalServerError(text="Invalid heatmap tile")
+    return web.Response(
+        body=body,
+        content_type="application/octet-stream",
+        headers={"Cache-Control": "no-cache"},
+    )
+
+
 async def pingweave_server():
     load_config_ini()
 
@@ -228,12 +693,24 @@ async def pingweave_server():
                 continue
 
             try:
-                app = web.Application()
+                app = web.Application(middlewares=[metrics.metrics_middleware])
                 app.router.add_get("/", index)  # indexing for html files
+                app.router.add_get("/metrics", metrics.metrics_handler(METRICS_DIR))
+                app.router.add_get(PLOTLY_JS_URL, get_plotly_js)  # before the static route
+                app.router.add_get(
+                    HEATMAP_TILE_URL + r"/{name}/{level:\d+}/{ty:\d+}/{tx:\d+}", get_heatmap_tile
+                )
+                # live view: changed cells pushed as server-sent events
+                live_feed = LiveFeed(
+                    lambda: pinglist_in_memory, logger, live_poll_interval_ms / 1000
+                )
+                app.router.add_get("/live", live_page_handler(live_feed, "/live/events"))
+                app.router.add_get("/live/events", live_events_handler(live_feed))
                 app.router.add_static("/", HTML_DIR)  # static route for html
                 app.router.add_get("/pinglist", get_pinglist)
                 app.router.add_get("/address_store", get_address_store)
                 app.router.add_post("/address", post_address)
+                app.router.add_get("/watch", get_watch)
 
                 runner = web.AppRunner(app)
                 await runner.setup()
@@ -245,6 +722,9 @@ async def pingweave_server():
                 )
 
                 asyncio.create_task(read_pinglist_periodically())
+                asyncio.create_task(expire_address_store_periodically())
+                asyncio.create_task(live_feed.run())
+                metrics.start_metrics_exporter("server", METRICS_DIR, logger)
 
                 await asyncio.Event().wait()
 
@@ -269,19 +749,34 @@ def run_pingweave_server():
         logger.info("pingweave_server process received KeyboardInterrupt. Exiting.")
 
 
-def terminate_all(processes):
+def terminate_all(processes, timeout_sec: float = 10):
     """
-    Terminates all running processes gracefully.
+    Terminates all running processes gracefully and waits for them to exit.
+    Processes still alive after timeout_sec are killed.
     """
-    for process in processes:
+    started = [process for process in processes if process.pid != None]
+    for process in started:
         if process.is_alive():
             process.terminate()
             logger.warning(f"Terminated process: {process.name}")
 
+    deadline = time.time() + timeout_sec
+    for process in started:
+        process.join(max(deadline - time.time(), 0))
+        if process.is_alive():
+            logger.error(f"{process.name} did not exit in {timeout_sec}s, killing it")
+            process.kill()
+            process.join()
+
 
 if __name__ == "__main__":
     try:
-        from collector import run_pingweave_collector  # Import the collector function
+        from collector import (
+            run_pingweave_collector,
+            create_ingest_counters,
+            restore_state_snapshots,
+            save_state_snapshots,
+        )
     except ImportError as e:
         logger.error(f"Could not import run_pingweave_collector from collector.py: {e}")
         sys.exit(1)
@@ -296,18 +791,53 @@ if __name__ == "__main__":
     processes = []
 
     try:
+        # Shared-memory latest-value matrices (collector -> plotter)
+        # sized by the groups of the pinglist (unless configured)
+        load_config_ini()
+        pinglist = {}
+        try:
+            with open(PINGLIST_PATH, "rb") as file:
+                pinglist = load_pinglist_file(file.read())[0]
+        except Exception as e:
+            logger.error(f"Cannot read the pinglist to size the shared-memory matrices: {e}")
+        try:
+            sizes = matrix_sizes(pinglist, shm_max_nodes, shm_max_pairs)
+            matrices = create_latest_matrices(sizes, multiprocessing.Lock())
+            create_anomaly_detectors(
+                {proto: len(matrix.cells) for proto, matrix in matrices.items()},
+                multiprocessing.Lock(),
+            )
+            for proto, (nodes, pairs) in sizes.items():
+                logger.info(f"Shared-memory {proto} matrix: {nodes} IPs, {pairs} pairs")
+        except Exception as e:
+            logger.error(f"Cannot create shared-memory result matrices: {e}")
+
+        # warm restart: the latest results and baselines of the previous run,
+        # then the slots of the pinglist's groups
+        restore_state_snapshots()
+        log_unreserved_groups(reserve_pinglist(pinglist))
+
         # Define processes
         process_server = multiprocessing.Process(
             target=run_pingweave_server, name="pingweave_server", daemon=True
         )
-        process_collector = multiprocessing.Process(
-            target=run_pingweave_collector, name="pingweave_collector", daemon=True
-        )
         process_plotter = multiprocessing.Process(
             target=run_pingweave_plotter, name="pingweave_plotter", daemon=True
         )
 
-        processes = [process_server, process_collector, process_plotter]
+        # Collector workers share port_collect with SO_REUSEPORT
+        create_ingest_counters(collector_workers)
+        process_collectors = [
+            multiprocessing.Process(
+                target=run_pingweave_collector,
+                args=(worker_id, collector_workers),
+                name=f"pingweave_collector_{worker_id}",
+                daemon=True,
+            )
+            for worker_id in range(collector_workers)
+        ]
+
+        processes = [process_server, *process_collectors, process_plotter]
 
         # Start processes
         for process in processes:
@@ -336,4 +866,11 @@ if __name__ == "__main__":
     except Exception as e:
         logger.error(f"Main loop exception: {e}. Exiting cleanly...")
     finally:
-        terminate_all(processes)
\ No newline at end of file
+        terminate_all(processes)
+        try:
+            # all children are joined, no writer can touch the state anymore
+            save_state_snapshots(writers_stopped=True)
+        except Exception as e:
+            logger.error(f"Cannot save the snapshot: {e}")
+        release_latest_matrices()
+        release_anomaly_detectors()
\ No newline at end of file
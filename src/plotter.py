@@ -1,14 +1,29 @@
 import redis  # in-memory key-value storage
 from datetime import datetime, timedelta
-import pandas as pd
-import copy
+import base64
+import hashlib
+import json
 import numpy as np
 import socket
 import psutil
 import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 import yaml
-import plotly.graph_objects as go
+import plotly.io as pio
 from logger import initialize_pingweave_logger
+from result_format import ip_to_int, ns_to_local_ns, ns_to_timestamp_strs
+from shm_matrix import get_latest_matrix
+from redis_reader import RedisBulkReader, group_cells
+from heatmap_scale import (
+    HEATMAP_DELAY_VALUES,
+    HEATMAP_RATIO_VALUES,
+    colorscale,
+    heatmap_steps,
+    result_heatmap_values,
+)
+from heatmap_tiles import NO_TIME, TILE_FACTOR, TILE_SIZE, HeatmapTileWriter
+import metrics
 import os
 import time
 import configparser
@@ -20,53 +35,262 @@ logger = initialize_pingweave_logger(socket.gethostname(), "plotter", 5, False)
 control_host = None
 collect_port = None
 interval_report_ping_result_millisec = None
-colorscale = ["black", "purple", "green", "yellow", "orange", "red"]
+redis_read_batch_size = 10000
+plotter_html_mode = "compact"
+plotter_workers = 1
+heatmap_tile_min_nodes = 1000
 
 # Variables to save pinglist
 pinglist_in_memory = {}
 
+# (proto, group) -> (content hash of its fresh cells, HTML files) of the last render
+rendered_groups = {}
+rendered_files = None  # forces a cleanup at the first cycle
+rendered_tiles = None  # groups with a tile pyramid (TILE_DIR)
+
+# worker processes rendering groups in parallel (plotter_workers > 1)
+render_pool = None
+
 # ConfigParser object
 config = configparser.ConfigParser()
 
+# Self-instrumentation (see metrics.py)
+PLOT_PHASE = {
+    phase: metrics.histogram(
+        "pingweave_plotter_phase_seconds", "Time spent per plotting phase", phase=phase
+    )
+    for phase in ["read", "heatmap", "write_html", "cleanup"]
+}
+PLOT_CYCLE = metrics.histogram(
+    "pingweave_plotter_cycle_seconds", "Time of a whole plotting cycle"
+)
+PLOT_GROUPS = {
+    result: metrics.counter(
+        "pingweave_plotter_groups_total", "Number of groups per plotting outcome", result=result
+    )
+    for result in ["rendered", "unchanged"]
+}
+
 
-# value to color index mapping for ping results
-def map_value_to_color_index_ping_delay(value, steps: list):
-    assert(len(steps) == 3)
-    if value <= -1:
-        return 0  # black
-    elif -1 < value <= 0:
-        return 1  # purple
-    elif 0 < value <= int(steps[0]):
-        return 2  # green
-    elif int(steps[0]) < value <= int(steps[1]):
-        return 3  # yellow
-    elif int(steps[1]) < value <= int(steps[2]):
-        return 4  # orange
-    elif value > int(steps[2]):
-        return 5  # red
-    else:
-        logger.error(f"map_value error: {steps}")
-        exit(1)
-
-
-# value to color index mapping for ping results
-def map_value_to_color_index_ratio(value, steps: list):
-    assert(len(steps) == 3)
-    if value <= -1:
-        return 0  # black
-    elif -1 < value < 0:
-        return 1  # purple
-    elif 0 <= value < float(steps[0]):
-        return 2 # green
-    elif float(steps[0]) <= value < float(steps[1]):
-        return 3 # yellow
-    elif float(steps[1]) <= value < float(steps[2]):
-        return 4 # orange
-    elif float(steps[2]) <= value <= 1:
-        return 5 # red
-    else:
-        logger.error(f"map_value error: {steps}")
-        exit(1)
+def group_render_histogram(proto: str, group: str) -> metrics.Histogram:
+    return metrics.histogram(
+        "pingweave_plotter_group_render_seconds",
+        "Time to render all heatmaps of a group",
+        proto=proto,
+        group=group,
+    )
+
+
+# compact: numeric matrices only, hover text formatted by the browser, plotly.js
+#          loaded from pingweave_server (PLOTLY_JS_URL)
+# standalone: self-contained plotly HTML (per-cell hover strings, inlined plotly.js)
+PLOTTER_HTML_MODES = ["compact", "standalone"]
+
+# formatTime(local wall-clock ns as BigInt): "YYYY-MM-DD HH:MM:SS.nnnnnnnnn"
+FORMAT_TIME_JS = """function formatTime(ns) {
+  if (ns === 0n) return "N/A";
+  const seconds = ns / 1000000000n;
+  const date = new Date(Number(seconds) * 1000).toISOString();
+  const fraction = String(ns - seconds * 1000000000n).padStart(9, "0");
+  return `${date.slice(0, 10)} ${date.slice(11, 19)}.${fraction}`;
+}
+"""
+
+# Page of plotter_html_mode = compact. The matrices are base64 typed arrays
+# ([dst, src], row-major) and only the hovered cell's text is formatted. The
+# report times are shared by the pages of a group: one raw int64 file
+# (<group>_times.bin, see COMPACT_TIMES_SUFFIX), fetched (and cached) once.
+COMPACT_HEATMAP_HTML = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>__TITLE__</title>
+<script src="__PLOTLY_JS_URL__"></script>
+<style>
+body { margin: 0; background: white; font-family: sans-serif; }
+#heatmap { width: 100vw; height: 100vh; }
+#hover { position: fixed; display: none; pointer-events: none; padding: 4px 6px;
+         background: white; border: 1px solid #444; font-size: 12px; }
+</style>
+</head>
+<body>
+<div id="heatmap"></div>
+<div id="hover"></div>
+<script>
+const spec = __SPEC__;
+const data = __DATA__;
+function decode(b64, type) {
+  const bin = atob(b64);
+  const bytes = new Uint8Array(bin.length);
+  for (let i = 0; i < bin.length; i++) bytes[i] = bin.charCodeAt(i);
+  return new type(bytes.buffer);
+}
+const n = spec.ips.length;
+const colors = decode(data.colors, Uint8Array);
+const values = decode(data.values, Float32Array);  // -1: no data
+let times = null;  // local wall-clock ns, 0: no data
+fetch(spec.times).then((response) => response.arrayBuffer()).then((buffer) => {
+  times = new BigInt64Array(buffer);
+});
+const z = [];
+for (let i = 0; i < n; i++) z.push(colors.subarray(i * n, (i + 1) * n));
+Object.assign(spec.trace, { z: z, x: spec.ips, y: spec.ips, hoverinfo: "none" });
+
+__FORMAT_TIME_JS__
+const div = document.getElementById("heatmap");
+const hover = document.getElementById("hover");
+Plotly.newPlot(div, [spec.trace], spec.layout, { responsive: true }).then(() => {
+  div.on("plotly_hover", (event) => {
+    const [row, col] = event.points[0].pointNumber;
+    const k = row * n + col;
+    hover.innerHTML = `Src: ${spec.ips[col]}<br>Dst: ${spec.ips[row]}` +
+      `<br>Value: ${Number(values[k].toPrecision(7))}` +
+      `<br>Time: ${times ? formatTime(times[k]) : "(loading)"}`;
+    hover.style.left = `${event.event.clientX + 12}px`;
+    hover.style.top = `${event.event.clientY + 12}px`;
+    hover.style.display = "block";
+  });
+  div.on("plotly_unhover", () => { hover.style.display = "none"; });
+});
+</script>
+</body>
+</html>
+""".replace("__FORMAT_TIME_JS__", FORMAT_TIME_JS)
+COMPACT_TIMES_SUFFIX = "_times.bin"
+
+# groups with more IPs than heatmap_tile_min_nodes: a page per value that
+# shows one tile (<= TILE_SIZE x TILE_SIZE cells) of the pyramid at a time,
+# starting at the top level; clicking a cell zooms into its block
+TILED_HEATMAP_HTML = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>__TITLE__</title>
+<script src="__PLOTLY_JS_URL__"></script>
+<style>
+body { margin: 0; background: white; font-family: sans-serif; }
+#bar { height: 28px; padding: 6px 10px 0; font-size: 13px; }
+#heatmap { width: 100vw; height: calc(100vh - 34px); }
+#hover { position: fixed; display: none; pointer-events: none; padding: 4px 6px;
+         background: white; border: 1px solid #444; font-size: 12px; }
+</style>
+</head>
+<body>
+<div id="bar">
+<button id="zoom-out">Zoom out</button>
+<button id="west">&larr;</button><button id="east">&rarr;</button>
+<button id="north">&uarr;</button><button id="south">&darr;</button>
+<span id="status"></span>
+</div>
+<div id="heatmap"></div>
+<div id="hover"></div>
+<script>
+const spec = __SPEC__;
+const n = spec.ips.length;
+const topLevel = spec.sizes.length - 1;
+const div = document.getElementById("heatmap");
+const hover = document.getElementById("hover");
+const status = document.getElementById("status");
+let view = null;  // level, ty, tx, rows, cols, times, values
+
+__FORMAT_TIME_JS__
+// IPs (ascending) of cell i of a level
+function label(level, i) {
+  const block = spec.factor ** level;
+  const first = i * block;
+  const last = Math.min(first + block, n) - 1;
+  if (first === last) return spec.ips[first];
+  return `${spec.ips[first]} - ${spec.ips[last]} (${last - first + 1} IPs)`;
+}
+
+function tiles(level) {
+  return Math.ceil(spec.sizes[level] / spec.tile);
+}
+
+async function show(level, ty, tx) {
+  if (level < 0 || level > topLevel || ty < 0 || tx < 0 || ty >= tiles(level) || tx >= tiles(level)) return;
+  let response;
+  try {
+    response = await fetch(`${spec.url}/${spec.name}/${level}/${ty}/${tx}?value=${spec.value}`,
+                           { cache: "no-cache" });
+  } catch (e) {
+    response = { ok: false, status: e };
+  }
+  if (!response.ok) {
+    status.textContent = `Tile not available (${response.status}), try again later.`;
+    return;
+  }
+  // header (24 bytes), times int64, values float32, colors uint8
+  const buffer = await response.arrayBuffer();
+  const header = new DataView(buffer);
+  if (header.getBigInt64(16, true) !== BigInt(spec.created)) {
+    location.reload();  // rendered again since this page was loaded
+    return;
+  }
+  const rows = header.getUint32(8, true);
+  const cols = header.getUint32(12, true);
+  const cells = rows * cols;
+  const colors = new Uint8Array(buffer, 24 + 12 * cells, cells);
+  const z = [];
+  for (let i = 0; i < rows; i++) z.push(colors.subarray(i * cols, (i + 1) * cols));
+  view = {
+    level: level, ty: ty, tx: tx, rows: rows, cols: cols,
+    times: new BigInt64Array(buffer, 24, cells),
+    values: new Float32Array(buffer, 24 + 8 * cells, cells),
+  };
+  const trace = Object.assign({}, spec.trace, {
+    z: z,
+    x: Array.from({ length: cols }, (_, j) => tx * spec.tile + j),
+    y: Array.from({ length: rows }, (_, i) => ty * spec.tile + i),
+    hoverinfo: "none",
+  });
+  await Plotly.react(div, [trace], spec.layout, { responsive: true });
+  const block = spec.factor ** level;
+  status.textContent = `Level ${level} of ${topLevel}, tile (${ty}, ${tx}) of ${tiles(level)} x ${tiles(level)}: ` +
+    (level > 0 ? `worst value and oldest time of ${block} x ${block} pairs per cell. Click a cell to zoom in.`
+               : "one pair per cell.");
+}
+
+function bind() {
+  div.on("plotly_hover", (event) => {
+    const [row, col] = event.points[0].pointNumber;
+    const k = row * view.cols + col;
+    const value = view.values[k];
+    hover.innerHTML = `Src: ${label(view.level, view.tx * spec.tile + col)}` +
+      `<br>Dst: ${label(view.level, view.ty * spec.tile + row)}` +
+      `<br>Value: ${Number(value.toPrecision(7))}<br>Time: ${formatTime(view.times[k])}`;
+    hover.style.left = `${event.event.clientX + 12}px`;
+    hover.style.top = `${event.event.clientY + 12}px`;
+    hover.style.display = "block";
+  });
+  div.on("plotly_unhover", () => { hover.style.display = "none"; });
+  div.on("plotly_click", (event) => {
+    if (view.level === 0) return;
+    const [row, col] = event.points[0].pointNumber;
+    const first_row = (view.ty * spec.tile + row) * spec.factor;
+    const first_col = (view.tx * spec.tile + col) * spec.factor;
+    hover.style.display = "none";
+    show(view.level - 1, Math.floor(first_row / spec.tile), Math.floor(first_col / spec.tile));
+  });
+}
+
+document.getElementById("zoom-out").onclick = () =>
+  show(view.level + 1, Math.floor(view.ty / spec.factor), Math.floor(view.tx / spec.factor));
+document.getElementById("west").onclick = () => show(view.level, view.ty, view.tx - 1);
+document.getElementById("east").onclick = () => show(view.level, view.ty, view.tx + 1);
+document.getElementById("north").onclick = () => show(view.level, view.ty + 1, view.tx);
+document.getElementById("south").onclick = () => show(view.level, view.ty - 1, view.tx);
+Plotly.newPlot(div, [], spec.layout, { responsive: true }).then(() => {
+  bind();
+  show(topLevel, 0, 0);
+});
+</script>
+</body>
+</html>
+""".replace("__FORMAT_TIME_JS__", FORMAT_TIME_JS)
+
+# cells read at once when building heatmap tiles (bounds the memory of a read)
+HEATMAP_TILE_READ_CELLS = 1 << 20
 
 
 # global logics
@@ -78,21 +302,28 @@ try:
     )
     logger.info(f"Redis server running - {redis_server.ping()}")  # 출력: True
     assert redis_server.ping()
+    # raw bytes for the bulk reader (parsed without decoding)
+    redis_bulk_client = redis.StrictRedis(unix_socket_path=socket_path)
 except redis.exceptions.ConnectionError as e:
     logger.error(f"Cannot connect to Redis server: {e}")
     if not os.path.exists(socket_path):
         logger.error(f"Socket file does not exist: {socket_path}")
     redis_server = None
+    redis_bulk_client = None
 except FileNotFoundError as e:
     logger.error(f"Redis socket file does not exist: {e}")
     redis_server = None
+    redis_bulk_client = None
 except Exception as e:
     logger.error(f"Unexpected error of Redis server: {e}")
     redis_server = None
+    redis_bulk_client = None
 
 
 def load_config_ini():
     global control_host, collect_port, interval_report_ping_result_millisec
+    global redis_read_batch_size, plotter_html_mode, plotter_workers
+    global heatmap_tile_min_nodes
 
     try:
         config.read(CONFIG_PATH)
@@ -101,11 +332,26 @@ def load_config_ini():
         interval_report_ping_result_millisec = int(
             config["param"]["interval_report_ping_result_millisec"]
         )
+        redis_read_batch_size = config["controller"].getint(
+            "redis_read_batch_size", fallback=10000
+        )
+        plotter_html_mode = config["controller"].get("plotter_html_mode", fallback="compact")
+        if plotter_html_mode not in PLOTTER_HTML_MODES:
+            logger.error(f"Unknown plotter_html_mode {plotter_html_mode}. Use compact.")
+            plotter_html_mode = "compact"
+        plotter_workers = max(1, config["controller"].getint("plotter_workers", fallback=1))
+        heatmap_tile_min_nodes = config["controller"].getint(
+            "heatmap_tile_min_nodes", fallback=1000
+        )
         logger.debug("Configuration loaded successfully from config file.")
     except Exception as e:
         logger.error(f"Error reading configuration: {e}")
         control_host = None
         collect_port = None
+        redis_read_batch_size = 10000
+        plotter_html_mode = "compact"
+        plotter_workers = 1
+        heatmap_tile_min_nodes = 1000
 
 
 def check_ip_active(target_ip):
@@ -181,15 +427,58 @@ def clear_directory_conditional(directory_path: str, except_files: list):
 
 
 
+def heatmap_figure(num_cells: int, value_name: str, tick_steps: list, title: str):
+    """
+    Heatmap trace and layout (without data) of `num_cells` x `num_cells`
+    cells, as plain dicts: written without validation, since go.Figure()
+    deep-copies every per-cell hover string.
+    """
+    # dynamic xgap and ygap
+    xgap = max(1, int(20 / num_cells))
+    ygap = max(1, int(20 / num_cells))
+
+    heatmap = dict(
+        type="heatmap",
+        colorscale=[[i / (len(colorscale) - 1), color] for i, color in enumerate(colorscale)],
+        zmin=0,  # setting min
+        zmax=len(tick_steps) - 1,  # setting max
+        xgap=xgap,  # dynamic horizontal space
+        ygap=ygap,  # dynamic vertical space
+        name="",  # empty trace name
+        colorbar=dict(
+            tickmode="array",
+            tickvals=list(range(len(tick_steps))),
+            ticktext=tick_steps,
+            title=dict(text=value_name),
+        ),
+    )
+    # one category per IP, axis labels hidden
+    axis = dict(type="category", visible=True, showticklabels=False)
+    layout = dict(
+        xaxis=dict(axis, title=dict(text="Source IP")),
+        yaxis=dict(axis, title=dict(text="Destination IP")),
+        title=dict(text=title),
+        plot_bgcolor="white",
+        paper_bgcolor="white",
+    )
+    return heatmap, layout
+
+
 def plot_heatmap_value(
-    records: list,
+    ip_list: list,
+    z_values: np.ndarray,
+    hover_time: np.ndarray,
     value_name: str,
-    time_name: str,
     steps: list,
     tick_steps: list,
     map_func,
     outname: str,
 ):
+    """
+    Writes the heatmap of one value matrix ([dst, src], -1 if no data).
+    hover_time: time strings (standalone) or the URL of the group's times
+    file (compact), shared by the heatmaps of a group.
+    """
     try:
         # sanity check
         if len(tick_steps) != len(colorscale):
@@ -198,95 +487,35 @@ def plot_heatmap_value(
             )
             raise RuntimeError("plotter tick_steps and colorscale mismatch")
 
-        # dataframe
-        df = pd.DataFrame(records)
-
-        # index mapping to ip address
-        source_ips = df["source"].unique()
-        destination_ips = df["destination"].unique()
-        source_ip_to_index = {ip: idx for idx, ip in enumerate(source_ips)}
-        destination_ip_to_index = {ip: idx for idx, ip in enumerate(destination_ips)}
-        df["source_idx"] = df["source"].map(source_ip_to_index)
-        df["destination_idx"] = df["destination"].map(destination_ip_to_index)
-
-        # create pivot table
-        pivot_table = df.pivot(
-            index="destination_idx", columns="source_idx", values=value_name
-        ).fillna(-1)
-        z_values = pivot_table.values
-
-        # time-series pivot table
-        time_pivot = df.pivot(
-            index="destination_idx", columns="source_idx", values=time_name
-        ).fillna("N/A")
-        time_values = time_pivot.values
-
-        # create text matrix
-        text_matrix = []
-        for i in range(z_values.shape[0]):
-            row = []
-            for j in range(z_values.shape[1]):
-                src = source_ips[j]
-                dst = destination_ips[i]
-                val = z_values[i][j]
-                time = time_values[i][j]
-                text = f"Src: {src}<br>Dst: {dst}<br>Value: {val}<br>Time: {time}"
-                row.append(text)
-            text_matrix.append(row)
-
-        # function vectorize
-        vectorized_map_func = np.vectorize(lambda x: map_func(x, steps))
-        z_colors = vectorized_map_func(z_values)
-
-        # cell number calc
-        num_x = len(pivot_table.columns)
-        num_y = len(pivot_table.index)
-
-        # dynamic xgap and ygap
-        xgap = max(1, int(20 / num_x))
-        ygap = max(1, int(20 / num_y))
-
-        # create a heatmap
-        fig = go.Figure(
-            data=go.Heatmap(
-                z=z_colors,
-                colorscale=colorscale,
-                x=pivot_table.columns.values,
-                y=pivot_table.index.values,
-                zmin=0,  # setting min
-                zmax=len(tick_steps) - 1,  # setting max
-                xgap=xgap,  # dynamic horizontal space
-                ygap=ygap,  # dynamic vertical space
-                customdata=text_matrix,  # customdata <- text matrix
-                hovertemplate="%{customdata}",  # mouse cursor
-                hoverinfo="text",  # hover info
-                name="",  # empty trace name
-                colorbar=dict(
-                    tickmode="array",
-                    tickvals=list(range(len(tick_steps))),
-                    ticktext=tick_steps,
-                    title=value_name,
-                ),
-            )
-        )
+        heatmap_start = time.perf_counter()
+        z_colors = map_func(z_values, steps).astype(np.uint8)
 
         current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-
-        # update layout
-        fig.update_layout(
-            xaxis_title="Source IP",
-            yaxis_title="Destination IP",
-            title=f"{outname} ({current_time})",
-            plot_bgcolor="white",
-            paper_bgcolor="white",
+        heatmap, layout = heatmap_figure(
+            len(ip_list), value_name, tick_steps, f"{outname} ({current_time})"
         )
-
-        # hide an axis label
-        fig.update_xaxes(visible=True, showticklabels=False)
-        fig.update_yaxes(visible=True, showticklabels=False)
-
-        # save to HTML file
-        fig.write_html(f"{HTML_DIR}/{outname}.html")
+        PLOT_PHASE["heatmap"].observe(time.perf_counter() - heatmap_start)
+
+        # save to HTML file, atomically for the web server
+        with PLOT_PHASE["write_html"].time():
+            tmp_path = f"{HTML_DIR}/.{outname}.html.tmp"
+            if plotter_html_mode == "standalone":
+                # hover: source/destination from the axes, the value, and the
+                # time strings shared by all heatmaps of the group
+                heatmap.update(
+                    z=z_colors,
+                    x=ip_list,
+                    y=ip_list,
+                    customdata=z_values,
+                    text=hover_time,
+                    hovertemplate="Src: %{x}<br>Dst: %{y}<br>Value: %{customdata}<br>Time: %{text}",
+                )
+                pio.write_html(dict(data=[heatmap], layout=layout), tmp_path, validate=False)
+            else:
+                write_compact_heatmap_html(
+                    tmp_path, heatmap, layout, ip_list, z_colors, z_values, hover_time
+                )
+            os.replace(tmp_path, f"{HTML_DIR}/{outname}.html")
 
         # return the path of HTML
         return f"{HTML_DIR}/{outname}.html"
@@ -295,254 +524,417 @@ def plot_heatmap_value(
         logger.error(f"Exception: {e}")
         return "" # return nothing if failure
 
-def plot_heatmap_udp(data, outname="result"):
-    delay_steps = [2000000, 5000000, 20000000]
-    delay_tick_steps = ["No Data", "Failure", "~2ms", "~5ms", "~20ms", ">20ms"]
-    
-    ratio_steps = [0.1, 0.5, 0.9]
-    ratio_tick_steps = ["No Data", "Failure", "~10%", "~50%", "~90%", "All failed"]
-    
-    output_files = []
-    records = []
-    for k, v in data.items():
-        src, dst = k.split(",")
-        if v:
-            ts_ping_start, ts_ping_end, n_success, n_failure, n_weird = v[0:5]
-            n_success = int(n_success)
-            n_failure = int(n_failure)
-            n_weird = int(n_weird)
-            if n_success + n_failure == 0:
-                failure_ratio = -1
-            else:
-                failure_ratio = 1.0 * n_failure / (n_success + n_failure)
-                
-            if n_success + n_failure + n_weird == 0:
-                weird_ratio = -1
+
+def output_path(name: str) -> str:
+    """
+    Path of an output file: an HTML page (`name` without ".html") or the
+    times file of a group's compact pages.
+    """
+    if name.endswith(COMPACT_TIMES_SUFFIX):
+        return f"{HTML_DIR}/{name}"
+    return f"{HTML_DIR}/{name}.html"
+
+
+def base64_array(array: np.ndarray) -> bytes:
+    return base64.b64encode(np.ascontiguousarray(array).tobytes())
+
+
+def write_compact_times(outname: str, ts_end: np.ndarray) -> str:
+    """
+    Writes the [dst, src] report times of a group's compact pages, as local
+    wall-clock ns (0: no data), to HTML_DIR. Returns their URL, relative to
+    the pages and versioned so that browsers do not reuse an old one.
+    """
+    name = f"{outname}{COMPACT_TIMES_SUFFIX}"
+    local_ns = np.where(ts_end > 0, ns_to_local_ns(ts_end), 0).astype("<i8")
+    tmp_path = f"{HTML_DIR}/.{name}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(np.ascontiguousarray(local_ns).data)
+    os.replace(tmp_path, f"{HTML_DIR}/{name}")
+    return f"{name}?v={time.time_ns()}"
+
+
+def write_compact_heatmap_html(
+    path: str, heatmap: dict, layout: dict, ip_list: list, z_colors, z_values, times_url: str
+):
+    """
+    Writes a COMPACT_HEATMAP_HTML page of [dst, src] matrices. The (large)
+    base64 arrays are written as they are, only the small spec is JSON.
+    """
+    spec = dict(trace=heatmap, layout=layout, ips=ip_list, times=times_url)
+    spec = json.dumps(spec).replace("</", "<\\/")
+    page = COMPACT_HEATMAP_HTML.replace("__TITLE__", layout["title"]["text"]).replace(
+        "__PLOTLY_JS_URL__", PLOTLY_JS_URL
+    )
+    head, rest = page.split("__SPEC__")
+    middle, tail = rest.split("__DATA__")
+    with open(path, "wb") as f:
+        f.write(head.encode())
+        f.write(spec.encode())
+        f.write(middle.encode())
+        f.write(b'{ colors: "' + base64_array(z_colors.astype(np.uint8)))
+        f.write(b'", values: "' + base64_array(z_values.astype("<f4")))
+        f.write(b'" }')
+        f.write(tail.encode())
+
+
+def heatmap_values(cells) -> dict:
+    """
+    Value matrices ([dst, src]) of the heatmaps from a group's [src, dst]
+    cells; -1 where there is no (fresh) result or no ping was counted.
+    """
+    return result_heatmap_values(cells.T)
+
+
+def use_heatmap_tiles(num_ips: int) -> bool:
+    return heatmap_tile_min_nodes > 0 and num_ips > heatmap_tile_min_nodes
+
+
+class ShmGroupCells:
+    """
+    The [src, dst] cells of a large group in its shared-memory matrix, read
+    in blocks of destinations when needed instead of as one n x n copy. It
+    is passed to render workers as is (they inherit or attach the matrix).
+    Each block is consistent on its own, not the group as a whole.
+    """
+
+    def __init__(self, proto: str, ip_list: list):
+        self.proto = proto
+        self.ip_list = ip_list
+
+    def dst_blocks(self, dst_order: np.ndarray, n_cols: int, ts_end_only: bool = False):
+        """
+        Yields the fresh [src, dst] cells (or only their ts_end) of all
+        sources and `n_cols` destinations at a time, in `dst_order`.
+        """
+        matrix = get_latest_matrix(self.proto)
+        slots = matrix.slots(np.array([ip_to_int(ip) for ip in self.ip_list], dtype=np.uint32))
+        for first in range(0, len(dst_order), n_cols):
+            dst_slots = slots[dst_order[first : first + n_cols]]
+            if ts_end_only:
+                block = matrix.read_block(slots, dst_slots, "ts_end")
+                block[block < fresh_after_ns()] = 0
+                yield block
             else:
-                weird_ratio = 1.0 * n_weird / (n_success + n_failure + n_weird)
-
-            _, network_mean, network_max, network_p50, network_p95, network_p99 = v[
-                5:11
-            ]
-            records.append(
-                {
-                    "source": src,
-                    "destination": dst,
-                    "failure_ratio": failure_ratio,
-                    "weird_ratio": weird_ratio,
-                    "network_mean": float(network_mean),
-                    "network_p50": float(network_p50),
-                    "network_p99": float(network_p99),
-                    "ping_start_time": ts_ping_start,
-                    "ping_end_time": ts_ping_end,
-                }
+                yield fresh_cells(matrix.read_block(slots, dst_slots))
+
+
+def dst_blocks(cells, dst_order: np.ndarray, n_cols: int):
+    """
+    The [src, dst] cells of a group (array or ShmGroupCells) in blocks of
+    `n_cols` destinations, in `dst_order`.
+    """
+    if isinstance(cells, ShmGroupCells):
+        yield from cells.dst_blocks(dst_order, n_cols)
+        return
+    for first in range(0, len(dst_order), n_cols):
+        # np.take: much faster than fancy indexing for wide records
+        yield np.take(cells, dst_order[first : first + n_cols], axis=1)
+
+
+def plot_heatmap_tiles(proto: str, ip_list: list, cells, outname: str) -> list:
+    """
+    Writes the tile pyramid of a large group (see heatmap_tiles.py), read
+    from its cells (array or ShmGroupCells) in blocks of destinations, and
+    one page per heatmap value that browses it. Returns the written HTML
+    files (without ".html").
+    """
+    value_names = HEATMAP_DELAY_VALUES + HEATMAP_RATIO_VALUES
+    value_steps = [heatmap_steps(proto, value_name) for value_name in value_names]
+    created = time.time_ns()
+    n = len(ip_list)
+
+    # ascending IP order, so that the aggregated blocks follow subnets
+    order = np.argsort(np.array([ip_to_int(ip) for ip in ip_list], dtype=np.uint32), kind="stable")
+    sorted_ips = [ip_list[i] for i in order]
+
+    heatmap_start = time.perf_counter()
+    writer = HeatmapTileWriter(
+        TILE_DIR,
+        outname,
+        n,
+        value_names,
+        lambda i, values: value_steps[i][2](values, value_steps[i][0]),
+        created,
+        [value_name in HEATMAP_DELAY_VALUES for value_name in value_names],
+    )
+    try:
+        rows_per_read = max(1, min(TILE_SIZE, HEATMAP_TILE_READ_CELLS // n))
+        for block in dst_blocks(cells, order, rows_per_read):
+            values = heatmap_values(block)
+            ts_end = block["ts_end"].T[:, order]
+            writer.add_rows(
+                np.stack([values[name][:, order] for name in value_names]).astype(np.float32),
+                np.where(ts_end > 0, ns_to_local_ns(ts_end), NO_TIME),
             )
-        else:
-            records.append(
-                {
-                    "source": src,
-                    "destination": dst,
-                    "failure_ratio": -1,
-                    "weird_ratio": -1,
-                    "network_mean": -1,
-                    "network_p50": -1,
-                    "network_p99": -1,
-                    "ping_start_time": "N/A",
-                    "ping_end_time": "N/A",
-                }
+        n_tiles = writer.close()
+    except Exception:
+        writer.abort()
+        raise
+    PLOT_PHASE["heatmap"].observe(time.perf_counter() - heatmap_start)
+    logger.debug(f"{outname}: {n_tiles} heatmap tiles of {n} IPs")
+
+    current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    output_files = []
+    with PLOT_PHASE["write_html"].time():
+        for value_name, (_, tick_steps, _) in zip(value_names, value_steps):
+            name = f"{outname}_{value_name}"
+            heatmap, layout = heatmap_figure(
+                TILE_SIZE, value_name, tick_steps, f"{name} ({current_time})"
             )
-    # network mean
-    if plot_heatmap_value(
-        records,
-        "network_mean",
-        "ping_end_time",
-        delay_steps,
-        delay_tick_steps,
-        map_value_to_color_index_ping_delay,
-        outname + "_network_mean",
-    ):
-        output_files.append(outname + "_network_mean")
-    # network p50
-    if plot_heatmap_value(
-        records,
-        "network_p50",
-        "ping_end_time",
-        delay_steps,
-        delay_tick_steps,
-        map_value_to_color_index_ping_delay,
-        outname + "_network_p50",
-    ):
-        output_files.append(outname + "_network_p50")
-    # network p99
-    if plot_heatmap_value(
-        records,
-        "network_p99",
-        "ping_end_time",
-        delay_steps,
-        delay_tick_steps,
-        map_value_to_color_index_ping_delay,
-        outname + "_network_p99",
-    ):
-        output_files.append(outname + "_network_p99")
-    # success ratio
-    if plot_heatmap_value(
-        records,
-        "failure_ratio",
-        "ping_end_time",
-        ratio_steps,
-        ratio_tick_steps,
-        map_value_to_color_index_ratio,
-        outname + "_failure_ratio",
-    ):
-        output_files.append(outname + "_failure_ratio")
-    # weird ratio
-    if plot_heatmap_value(
-        records,
-        "weird_ratio",
-        "ping_end_time",
-        ratio_steps,
-        ratio_tick_steps,
-        map_value_to_color_index_ratio,
-        outname + "_weird_ratio",
-    ):
-        output_files.append(outname + "_weird_ratio")
-    
-        
+            # tiles have numeric (global cell index) axes
+            layout["xaxis"]["type"] = layout["yaxis"]["type"] = "linear"
+            spec = dict(
+                trace=heatmap,
+                layout=layout,
+                url=HEATMAP_TILE_URL,
+                name=outname,
+                value=value_name,
+                created=str(created),
+                ips=sorted_ips,
+                sizes=writer.sizes,
+                tile=TILE_SIZE,
+                factor=TILE_FACTOR,
+            )
+            page = (
+                TILED_HEATMAP_HTML.replace("__TITLE__", layout["title"]["text"])
+                .replace("__PLOTLY_JS_URL__", PLOTLY_JS_URL)
+                .replace("__SPEC__", json.dumps(spec).replace("</", "<\\/"))
+            )
+            tmp_path = f"{HTML_DIR}/.{name}.html.tmp"
+            with open(tmp_path, "w") as f:
+                f.write(page)
+            os.replace(tmp_path, f"{HTML_DIR}/{name}.html")
+            output_files.append(name)
     return output_files
 
-def plot_heatmap_rdma(data, outname="result"):
-    delay_steps = [100000, 500000, 5000000]
-    delay_tick_steps = ["No Data", "Failure", "~100µs", "~500µs", "~5ms", ">5ms"]
-    
-    ratio_steps = [0.1, 0.5, 0.9]
-    ratio_tick_steps = ["No Data", "Failure", "~10%", "~50%", "~90%", "All failed"]
+
+def plot_heatmaps(proto: str, ip_list: list, cells, outname="result") -> list:
+    """
+    Writes all heatmaps of a group from its fresh [src, dst] cells, in one
+    pass over the cells, or its heatmap tiles if the group is large.
+    Returns the written HTML files (without ".html") and the group's times
+    file of compact pages (see output_path()).
+    """
+    if use_heatmap_tiles(len(ip_list)):
+        return plot_heatmap_tiles(proto, ip_list, cells, outname)
 
     output_files = []
-    records = []
-    for k, v in data.items():
-        src, dst = k.split(",")
-        if v:
-            ts_ping_start, ts_ping_end, n_success, n_failure, n_weird = v[0:5]
-            n_success = int(n_success)
-            n_failure = int(n_failure)
-            n_weird = int(n_weird)
-            if n_success + n_failure == 0:
-                failure_ratio = -1
+    heatmap_start = time.perf_counter()
+    values = heatmap_values(cells)
+    ts_end = cells["ts_end"].T
+    if plotter_html_mode == "standalone":
+        hover_time = np.where(ts_end > 0, ns_to_timestamp_strs(ts_end), "N/A")
+        PLOT_PHASE["heatmap"].observe(time.perf_counter() - heatmap_start)
+    else:
+        PLOT_PHASE["heatmap"].observe(time.perf_counter() - heatmap_start)
+        with PLOT_PHASE["write_html"].time():
+            hover_time = write_compact_times(outname, ts_end)
+        output_files.append(f"{outname}{COMPACT_TIMES_SUFFIX}")
+
+    for value_name in HEATMAP_DELAY_VALUES + HEATMAP_RATIO_VALUES:
+        steps, tick_steps, map_func = heatmap_steps(proto, value_name)
+        if plot_heatmap_value(
+            ip_list,
+            values[value_name],
+            hover_time,
+            value_name,
+            steps,
+            tick_steps,
+            map_func,
+            f"{outname}_{value_name}",
+        ):
+            output_files.append(f"{outname}_{value_name}")
+    return output_files
+
+
+def fresh_after_ns() -> int:
+    return time.time_ns() - INTERVAL_PLOTTER_FILTER_OLD_DATA_SEC * 1_000_000_000
+
+
+def fresh_cells(cells):
+    """
+    Empties the stale cells (ts_end == 0) of a group's [src, dst] cells, a
+    copy read from the shared memory or Redis, in place. Returns them.
+    """
+    cells[cells["ts_end"] < fresh_after_ns()] = np.zeros(1, dtype=cells.dtype)
+    return cells
+
+
+def cells_signature(ip_list: list, cells) -> bytes:
+    """
+    Content hash of a group's fresh cells; equal hashes render equal heatmaps.
+    The cells of a ShmGroupCells are hashed block by block, by their ts_end
+    only: a pair's report does not change without its ts_end.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(",".join(ip_list).encode())
+    if isinstance(cells, ShmGroupCells):
+        n_cols = max(1, HEATMAP_TILE_READ_CELLS // max(1, len(ip_list)))
+        for block in cells.dst_blocks(np.arange(len(ip_list)), n_cols, ts_end_only=True):
+            digest.update(block)
+    else:
+        digest.update(np.ascontiguousarray(cells).view(np.uint8))
+    return digest.digest()
+
+
+def read_cells_from_shm():
+    """
+    (proto, group) -> (ip_list, fresh cells) from the shared-memory matrices,
+    and the pinglist of the groups they do not hold (see reserve_pinglist()),
+    whose cells are None. Without Redis, those are read from the shared
+    memory as well. Returns None if the matrices are not available.
+    """
+    cells_by_group = {}
+    uncovered = {}
+    for proto, cat_data in pinglist_in_memory.items():
+        latest_matrix = get_latest_matrix(proto)
+        if latest_matrix == None:
+            return None
+
+        for group, ip_list in cat_data.items():
+            if redis_bulk_client != None and not latest_matrix.covers(ip_list):
+                uncovered.setdefault(proto, {})[group] = ip_list
+                cells_by_group[(proto, group)] = (ip_list, None)
+            elif use_heatmap_tiles(len(ip_list)):
+                # read by blocks when hashed and rendered
+                cells_by_group[(proto, group)] = (ip_list, ShmGroupCells(proto, ip_list))
             else:
-                failure_ratio = 1.0 * n_failure / (n_success + n_failure)
+                cells = latest_matrix.read_group(ip_list)
+                cells_by_group[(proto, group)] = (ip_list, fresh_cells(cells))
+    return cells_by_group, uncovered
 
-            if (n_success + n_failure + n_weird == 0):
-                weird_ratio = -1
+
+def read_cells_from_redis(pinglist: dict):
+    """
+    (proto, group) -> (ip_list, fresh cells) of the groups of a pinglist from
+    Redis (see redis_reader.py): only the pairs updated within the freshness
+    window, found via the update index, or, without an index, all keys of
+    each group.
+    """
+    cells_by_group = {}
+    reader = RedisBulkReader(redis_bulk_client, redis_read_batch_size)
+    for proto, cat_data in pinglist.items():
+        if proto not in ["udp", "rdma"]:
+            raise Exception(f"Not expected protocol type: {proto}")
+
+        fresh = reader.read_updated_since(proto, fresh_after_ns())
+        for group, ip_list in cat_data.items():
+            if fresh is None:
+                cells = reader.read_group(proto, ip_list)
             else:
-                weird_ratio = 1.0 * n_weird / (n_success + n_failure + n_weird)
-
-            _, client_mean, client_max, client_p50, client_p95, client_p99 = v[5:11]
-            _, network_mean, network_max, network_p50, network_p95, network_p99 = v[
-                11:17
-            ]
-            _, server_mean, server_max, server_p50, server_p95, server_p99 = v[17:23]
-            records.append(
-                {
-                    "source": src,
-                    "destination": dst,
-                    "failure_ratio": failure_ratio,
-                    "weird_ratio": weird_ratio,
-                    "network_mean": float(network_mean),
-                    "client_mean": float(client_mean),
-                    "server_mean": float(server_mean),
-                    "network_p50": float(network_p50),
-                    "client_p50": float(client_p50),
-                    "server_p50": float(server_p50),
-                    "network_p99": float(network_p99),
-                    "client_p99": float(client_p99),
-                    "server_p99": float(server_p99),
-                    "ping_start_time": ts_ping_start,
-                    "ping_end_time": ts_ping_end,
-                }
-            )
-        else:
-            records.append(
-                {
-                    "source": src,
-                    "destination": dst,
-                    "failure_ratio": -1,
-                    "weird_ratio": -1,
-                    "network_mean": -1,
-                    "client_mean": -1,
-                    "server_mean": -1,
-                    "network_p50": -1,
-                    "client_p50": -1,
-                    "server_p50": -1,
-                    "network_p99": -1,
-                    "client_p99": -1,
-                    "server_p99": -1,
-                    "ping_start_time": "N/A",
-                    "ping_end_time": "N/A",
-                }
+                cells = group_cells(proto, fresh, ip_list)
+            cells_by_group[(proto, group)] = (ip_list, fresh_cells(cells))
+    if reader.n_invalid > 0:
+        logger.warning(f"Ignored {reader.n_invalid} malformed results in Redis")
+    return cells_by_group
+
+
+def render_group(proto: str, ip_list: list, cells, outname: str):
+    """
+    Renders the heatmaps of a group; runs in a render_pool worker or inline.
+    The cells are a numpy record array, pickled as one buffer. Returns (HTML
+    files, render time, snapshots of the PLOT_PHASE histograms of this render).
+    """
+    global PLOT_PHASE
+
+    # record the phases of this render only, for the plotter process to merge
+    registered = PLOT_PHASE
+    PLOT_PHASE = {phase: metrics.Histogram() for phase in registered}
+    start = time.perf_counter()
+    try:
+        output_files = plot_heatmaps(proto, ip_list, cells, outname)
+        phases = {phase: histogram.snapshot() for phase, histogram in PLOT_PHASE.items()}
+    finally:
+        PLOT_PHASE = registered
+    return output_files, time.perf_counter() - start, phases
+
+
+def get_render_pool():
+    """
+    The pool of plotter_workers processes, or None to render inline.
+    """
+    global render_pool
+
+    if plotter_workers > 1 and render_pool == None:
+        render_pool = ProcessPoolExecutor(max_workers=plotter_workers, initializer=load_config_ini)
+        logger.info(f"Rendering heatmaps with {plotter_workers} worker processes")
+    return render_pool
+
+
+def shutdown_render_pool():
+    global render_pool
+
+    if render_pool != None:
+        render_pool.shutdown(wait=False, cancel_futures=True)
+        render_pool = None
+
+
+async def plot_changed_groups(cells_by_group: dict) -> list:
+    """
+    Renders the heatmaps of groups whose fresh cells changed since their
+    last render, in parallel if there is a render pool. Returns the HTML
+    files (see output_path()) of all groups once all renders finished.
+    """
+    global rendered_groups
+
+    rendered = {}
+    changed = []
+    for (proto, group), (ip_list, cells) in cells_by_group.items():
+        signature = cells_signature(ip_list, cells)
+        last = rendered_groups.get((proto, group))
+        if last != None and last[0] == signature and all(
+            os.path.isfile(output_path(name)) for name in last[1]
+        ):
+            rendered[(proto, group)] = last
+            PLOT_GROUPS["unchanged"].inc()
+            continue
+        changed.append((proto, group, ip_list, cells, signature))
+
+    pool = get_render_pool()
+    if pool == None:
+        results = [
+            render_group(proto, ip_list, cells, f"{proto}_{group}")
+            for proto, group, ip_list, cells, _ in changed
+        ]
+    else:
+        loop = asyncio.get_running_loop()
+        try:
+            results = await asyncio.gather(
+                *[
+                    loop.run_in_executor(
+                        pool, render_group, proto, ip_list, cells, f"{proto}_{group}"
+                    )
+                    for proto, group, ip_list, cells, _ in changed
+                ]
             )
-            
-    # network mean
-    if plot_heatmap_value(
-        records,
-        "network_mean",
-        "ping_end_time",
-        delay_steps,
-        delay_tick_steps,
-        map_value_to_color_index_ping_delay,
-        outname + "_network_mean",
-    ):
-        output_files.append(outname + "_network_mean")
-    # network p50
-    if plot_heatmap_value(
-        records,
-        "network_p50",
-        "ping_end_time",
-        delay_steps,
-        delay_tick_steps,
-        map_value_to_color_index_ping_delay,
-        outname + "_network_p50",
-    ):
-        output_files.append(outname + "_network_p50")
-    # network p99
-    if plot_heatmap_value(
-        records,
-        "network_p99",
-        "ping_end_time",
-        delay_steps,
-        delay_tick_steps,
-        map_value_to_color_index_ping_delay,
-        outname + "_network_p99",
-    ):
-        output_files.append(outname + "_network_p99")
-    # success ratio
-    if plot_heatmap_value(
-        records,
-        "failure_ratio",
-        "ping_end_time",
-        ratio_steps,
-        ratio_tick_steps,
-        map_value_to_color_index_ratio,
-        outname + "_failure_ratio",
-    ):
-        output_files.append(outname + "_failure_ratio")    
-    # weird ratio
-    if plot_heatmap_value(
-        records,
-        "weird_ratio",
-        "ping_end_time",
-        ratio_steps,
-        ratio_tick_steps,
-        map_value_to_color_index_ratio,
-        outname + "_weird_ratio",
-    ):
-        output_files.append(outname + "_weird_ratio")    
-    return output_files 
+        except BrokenProcessPool:
+            shutdown_render_pool()  # a worker died, start a new pool at the next cycle
+            raise
+
+    for (proto, group, _, _, signature), (output_files, elapsed, phases) in zip(changed, results):
+        rendered[(proto, group)] = (signature, output_files)
+        group_render_histogram(proto, group).observe(elapsed)
+        for phase, snapshot in phases.items():
+            PLOT_PHASE[phase].merge(snapshot)
+        PLOT_GROUPS["rendered"].inc()
+    if results:
+        slowest = max(range(len(results)), key=lambda i: results[i][1])
+        logger.debug(
+            f"Rendered {len(results)} groups, slowest: {changed[slowest][0]}_{changed[slowest][1]} "
+            f"({results[slowest][1]:.3f} s)"
+        )
+
+    # keep the order of the groups
+    rendered_groups = {key: rendered[key] for key in cells_by_group if key in rendered}
+    return [name for _, output_files in rendered_groups.values() for name in output_files]
 
 
 async def pingweave_plotter():
+    global rendered_files, rendered_tiles
     load_config_ini()
+    metrics.start_metrics_exporter("plotter", METRICS_DIR, logger)
     last_plot_time = int(time.time())
-    pinglist_protocol = ["udp", "rdma"]
 
     try:
         while True:
@@ -555,13 +947,14 @@ async def pingweave_plotter():
             try:
                 # plot the graph for every X seconds
                 now = int(time.time())
-                if (
-                    last_plot_time + int(interval_report_ping_result_millisec / 1000)
-                    < now
-                    and redis_server != None
+                if last_plot_time + int(
+                    interval_report_ping_result_millisec / 1000
+                ) < now and (
+                    redis_server != None or get_latest_matrix("rdma") != None
                 ):
                     # update the last plot time
                     last_plot_time = now
+                    cycle_start = time.perf_counter()
 
                     logger.info(
                         f"Pingweave plotter is running on {control_host}:{collect_port}"
@@ -571,85 +964,41 @@ async def pingweave_plotter():
                     # pinglist = {'udp': {'group1': ['192.168.1.1', '192.168.1.2', '192.168.1.3']}}
                     read_pinglist()
 
-                    # then, create template records
-                    records = copy.deepcopy(pinglist_in_memory)
-                    map_ip_to_groups = {}  # dict of set
-                    for proto, cat_data in pinglist_in_memory.items():
-                        for group, ip_list in cat_data.items():
-                            # make a template
-                            records[proto][group] = {
-                                f"{src},{dst}": None
-                                for src in ip_list
-                                for dst in ip_list
-                            }
-
-                            # make a mapping
-                            for ip in ip_list:
-                                if ip not in map_ip_to_groups:
-                                    map_ip_to_groups[ip] = set()
-                                map_ip_to_groups[ip].add(group)
-
-                    # Read data from redis in-memory storage.
-                    cursor = "0"
-                    while cursor != 0:
-                        current_time = datetime.now()
-                        cursor, keys = redis_server.scan(cursor=cursor)  # scan kv-store
-                        for key in keys:
-                            value = redis_server.get(key)
-                            if value is None:
+                    # Read the latest results: shared memory if the collector
+                    # maintains it, otherwise the Redis in-memory storage.
+                    with PLOT_PHASE["read"].time():
+                        shm_cells = read_cells_from_shm()
+                        if shm_cells == None:
+                            cells_by_group = read_cells_from_redis(pinglist_in_memory)
+                        else:
+                            cells_by_group, uncovered = shm_cells
+                            if uncovered:
                                 logger.warning(
-                                    f"Redis Key {key} not found in Redis. Skipping..."
-                                )
-                                continue
-
-                            value = value.split(",")
-
-                            # filter old information
-                            measure_time = datetime.strptime(
-                                value[1][:26], "%Y-%m-%d %H:%M:%S.%f"
-                            )
-                            # caclulate a time difference
-                            time_difference = abs(
-                                (current_time - measure_time).total_seconds()
-                            )
-
-                            # skip if the info is stale
-                            if time_difference > INTERVAL_PLOTTER_FILTER_OLD_DATA_SEC:
-                                logger.debug(
-                                    f"Ignore old data: {key} | Time: {measure_time} | T_Diff: {time_difference}"
+                                    f"{sum(map(len, uncovered.values()))} groups are not in "
+                                    f"the shared-memory matrices, reading them from Redis"
                                 )
-                                continue
-
-                            proto, src, dst = key.split(",")
-                            record_key = f"{src},{dst}"
-                            if proto not in pinglist_protocol:
-                                raise Exception(f"Not expected protocol type: {proto}")
-
-                            # check which groups to insert
-                            src_groups = map_ip_to_groups[src]
-                            dst_groups = map_ip_to_groups[dst]
-                            common_groups = list(set(src_groups) & set(dst_groups))
-
-                            # insertion
-                            for group in common_groups:
-                                if group in records[proto]:
-                                    if record_key not in records[proto][group]:
-                                        raise Exception(
-                                            f"{record_key} is not in records[{proto}][{group}]"
-                                        )
-                                    records[proto][group][record_key] = value
-
-                    # plot for each category/group
-                    new_file_list = []
-                    for category, data in records.items():
-                        for group, group_data in data.items():
-                            if category == "udp":
-                                new_file_list += plot_heatmap_udp(group_data, f"{category}_{group}")
-                            elif category == "rdma":
-                                new_file_list += plot_heatmap_rdma(group_data, f"{category}_{group}")
-                    
-                    # clear all HTML
-                    clear_directory_conditional(HTML_DIR, new_file_list)
+                                cells_by_group.update(read_cells_from_redis(uncovered))
+
+                    # plot the groups whose data changed
+                    new_file_list = await plot_changed_groups(cells_by_group)
+
+                    # clear HTML of removed groups (only if the set of files changed)
+                    if set(new_file_list) != rendered_files:
+                        with PLOT_PHASE["cleanup"].time():
+                            clear_directory_conditional(HTML_DIR, new_file_list)
+                        rendered_files = set(new_file_list)
+
+                    # and the tiles of groups that are gone or no longer tiled
+                    tiled_groups = [
+                        f"{proto}_{group}"
+                        for (proto, group), (ip_list, _) in cells_by_group.items()
+                        if use_heatmap_tiles(len(ip_list))
+                    ]
+                    if set(tiled_groups) != rendered_tiles and os.path.isdir(TILE_DIR):
+                        with PLOT_PHASE["cleanup"].time():
+                            clear_directory_conditional(TILE_DIR, tiled_groups)
+                        rendered_tiles = set(tiled_groups)
+                    PLOT_CYCLE.observe(time.perf_counter() - cycle_start)
 
             except KeyError as e:
                 logger.error(f"Plotter - Missing key error: {e}")
@@ -665,6 +1014,8 @@ async def pingweave_plotter():
         logger.info("pingweave_plotter received KeyboardInterrupt. Exiting.")
     except Exception as e:
         logger.error(f"Exception in pingweave_plotter: {e}")
+    finally:
+        shutdown_render_pool()
 
 
 def run_pingweave_plotter():
@@ -0,0 +1,231 @@
+import sys
+import time
+import numpy as np
+from result_format import (
+    RESULT_BINARY_TAG,
+    RESULT_DTYPES,
+    format_result_values,
+    int_to_ip,
+    ip_to_int,
+    pack_result_values,
+    unpack_result_values,
+)
+from result_parser import parse_result_block
+
+
+# Redis layout of the latest results:
+#   "<proto>,<src>,<dst>"  -> "ts_start,ts_end,..." or a packed record (see result_format.py)
+#   "<proto>:updated"      -> sorted set of "<src>,<dst>", scored by ts_end (epoch ns)
+# The sorted set lets readers fetch only recently updated pairs and lets the
+# collector delete pairs that stopped reporting (EXPIRE_SCRIPT).
+
+
+def update_index_key(proto: str) -> str:
+    return f"{proto}:updated"
+
+
+# KEYS[1]: update index, ARGV: key prefix ("<proto>,"), cutoff (ns), max entries.
+# Deletes the oldest pairs updated before the cutoff; returns their number.
+EXPIRE_SCRIPT = """
+local pairs = redis.call("ZRANGEBYSCORE", KEYS[1], "-inf", "(" .. ARGV[2], "LIMIT", 0, tonumber(ARGV[3]))
+for _, pair in ipairs(pairs) do
+    redis.call("DEL", ARGV[1] .. pair)
+end
+if #pairs > 0 then
+    redis.call("ZREMRANGEBYRANK", KEYS[1], 0, #pairs - 1)
+end
+return #pairs
+"""
+
+
+def group_cells(proto: str, records: np.ndarray, ips: list) -> np.ndarray:
+    """
+    [src, dst] cell matrix of the records between `ips`; other records are
+    ignored and pairs without a record are empty (ts_end == 0).
+    """
+    n = len(ips)
+    cells = np.zeros((n, n), dtype=RESULT_DTYPES[proto])
+    if n == 0 or len(records) == 0:
+        return cells
+
+    # IPv4 -> index in `ips`
+    ip_ints = np.array([ip_to_int(ip) for ip in ips], dtype=np.uint32)
+    order = np.argsort(ip_ints, kind="stable")
+    sorted_ints = ip_ints[order]
+    src_pos = np.minimum(np.searchsorted(sorted_ints, records["src"]), n - 1)
+    dst_pos = np.minimum(np.searchsorted(sorted_ints, records["dst"]), n - 1)
+    rows = np.flatnonzero(
+        (sorted_ints[src_pos] == records["src"]) & (sorted_ints[dst_pos] == records["dst"])
+    )
+    src, dst = order[src_pos[rows]], order[dst_pos[rows]]
+    np.put(cells.reshape(-1), src * n + dst, np.take(records, rows))
+    return cells
+
+
+class RedisBulkReader:
+    """
+    Reads the latest results of a group of IPs from Redis in a few round trips.
+
+    The keys ("<proto>,<src>,<dst>") are taken from the update index or built
+    from a group's IPs instead of SCANning the keyspace, and fetched with one
+    MGET per `batch_size` keys, `pipeline_depth` MGETs per round trip. Text
+    values are decoded at once by the columnar result parser, packed ones
+    with a single frombuffer; both may be mixed while the collector's
+    redis_value_format is migrated. The client must not decode responses.
+    """
+
+    def __init__(self, client, batch_size: int = 10000, pipeline_depth: int = 8):
+        self.client = client
+        self.batch_size = max(1, batch_size)
+        self.pipeline_depth = max(1, pipeline_depth)
+        self.n_invalid = 0  # values rejected by the parser
+
+    def _read_records(self, proto: str, blocks: list) -> np.ndarray:
+        """
+        Records of the existing keys of `blocks`, lists of b"<src>,<dst>"
+        (one MGET each).
+        """
+        prefix = proto.encode() + b","
+        lines = []  # "<src>,<dst>,<text value>"
+        packed = []
+        for start in range(0, len(blocks), self.pipeline_depth):
+            pipe = self.client.pipeline(transaction=False)
+            for block in blocks[start : start + self.pipeline_depth]:
+                pipe.mget([prefix + pair for pair in block])
+            for block, values in zip(blocks[start : start + self.pipeline_depth], pipe.execute()):
+                for pair, value in zip(block, values):
+                    if value == None:
+                        continue
+                    if value.startswith(RESULT_BINARY_TAG[:1]):
+                        packed.append(value)
+                    else:
+                        lines.append(pair + b"," + value)
+
+        records, n_invalid = parse_result_block(proto, b"\n".join(lines))
+        if packed:
+            unpacked, n_invalid_packed = unpack_result_values(proto, packed)
+            records = np.concatenate([records, unpacked])
+            n_invalid += n_invalid_packed
+        self.n_invalid += n_invalid
+        return records
+
+    def read_updated_since(self, proto: str, since_ns: int):
+        """
+        Records of all pairs updated at or after `since_ns`, found via the
+        update index. Returns None if the protocol has no update index
+        (e.g., written by an older collector, or everything expired).
+        """
+        index = update_index_key(proto)
+        pairs = self.client.zrangebyscore(index, since_ns, "+inf")
+        if not pairs and not self.client.exists(index):
+            return None
+        blocks = [pairs[i : i + self.batch_size] for i in range(0, len(pairs), self.batch_size)]
+        return self._read_records(proto, blocks)
+
+    def read_group(self, proto: str, ips: list) -> np.ndarray:
+        """
+        [src, dst] cells of all pairs of `ips`, like LatestValueMatrix.read_group();
+        pairs without a (valid) value are empty (ts_end == 0).
+        """
+        n = len(ips)
+        if n == 0:
+            return np.zeros((0, 0), dtype=RESULT_DTYPES[proto])
+
+        # a block of source rows against all destinations per MGET
+        encoded = [ip.encode() for ip in ips]
+        rows = max(1, self.batch_size // n)
+        blocks = [
+            [src + b"," + dst for src in encoded[first : first + rows] for dst in encoded]
+            for first in range(0, n, rows)
+        ]
+        records = self._read_records(proto, blocks)
+        return group_cells(proto, records, ips)
+
+
+def benchmark(socket_path: str, max_keys: int = 1000000, legacy_max_keys: int = 1000000):
+    """
+    Redis memory per pair, decode time and read time of the text and packed
+    value formats, and the per-key SCAN+GET loop of the old plotter (text
+    only), on a local Redis for 10^3 .. max_keys keys (one group of
+    sqrt(keys) nodes).
+    Run: python3 redis_reader.py <unix socket> [max_keys] [legacy_max_keys]
+    The database is flushed.
+    """
+    import redis
+    from datetime import datetime
+
+    client = redis.StrictRedis(unix_socket_path=socket_path)
+    text_client = redis.StrictRedis(unix_socket_path=socket_path, decode_responses=True)
+    proto = "rdma"
+    rng = np.random.default_rng(0)
+    n_keys = 1000
+    while n_keys <= max_keys:
+        n_nodes = int(round(n_keys**0.5))
+        n_pairs = n_nodes * n_nodes
+        ips = [int_to_ip(0x0A000000 + i) for i in range(n_nodes)]
+        keys = [f"{proto},{src},{dst}" for src in ips for dst in ips]
+        records = np.zeros(n_pairs, dtype=RESULT_DTYPES[proto])
+        records["src"] = 0x0A000000 + np.arange(n_pairs) // n_nodes
+        records["dst"] = 0x0A000000 + np.arange(n_pairs) % n_nodes
+        records["ts_start"] = time.time_ns()
+        records["ts_end"] = records["ts_start"] + rng.integers(1e9, 2e9, n_pairs)
+        records["n_success"] = 100
+        for name in RESULT_DTYPES[proto].names[8:]:
+            records[name] = rng.integers(1000, 5000000, n_pairs)
+
+        for value_format, encode in [("text", format_result_values), ("packed", pack_result_values)]:
+            client.flushdb()
+            used_memory = client.info("memory")["used_memory"]
+            values = encode(proto, records)
+            pipe = client.pipeline(transaction=False)
+            for i, (key, value) in enumerate(zip(keys, values)):
+                pipe.set(key, value)
+                if i % 10000 == 9999:
+                    pipe.execute()
+            pipe.execute()
+            bytes_per_pair = (client.info("memory")["used_memory"] - used_memory) / n_pairs
+
+            if value_format == "text":
+                lines = b"\n".join(
+                    key.split(",", 1)[1].encode() + b"," + value.encode()
+                    for key, value in zip(keys, values)
+                )
+                decode = lambda: parse_result_block(proto, lines)
+            else:
+                decode = lambda: unpack_result_values(proto, values)
+
+            def bulk():
+                cells = RedisBulkReader(client).read_group(proto, ips)
+                assert (cells["n_success"] == 100).all()
+
+            def legacy():  # the original plotter loop: SCAN (default COUNT) + GET per key
+                cursor = "0"
+                while cursor != 0:
+                    cursor, scanned = text_client.scan(cursor=cursor)
+                    for key in scanned:
+                        value = text_client.get(key).split(",")
+                        datetime.strptime(value[1][:26], "%Y-%m-%d %H:%M:%S.%f")
+
+            result = (
+                f"{n_pairs:>9,d} keys, {value_format:6s}: {bytes_per_pair:6.1f} B/pair, "
+                f"decode {_timeit(decode):7.3f} s, read {_timeit(bulk):7.3f} s"
+            )
+            if value_format == "text" and n_pairs <= legacy_max_keys:
+                result += f", SCAN+GET {_timeit(legacy):7.3f} s"
+            print(result)
+        n_keys *= 10
+    client.flushdb()
+
+
+def _timeit(func) -> float:
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    benchmark(
+        sys.argv[1],
+        int(sys.argv[2]) if len(sys.argv) > 2 else 1000000,
+        int(sys.argv[3]) if len(sys.argv) > 3 else 1000000,
+    )
@@ -0,0 +1,193 @@
+import socket
+import struct
+import time
+from datetime import datetime
+from functools import lru_cache
+import numpy as np
+
+# Layout of a result line produced by convert_rdma_result_to_str() and
+# convert_udp_result_to_str() in the C++ agent:
+#   src, dst, ts_start, ts_end, n_success, n_failure, n_weird,
+#   then for each stat group: "<group>", mean, max, p50, p95, p99
+RESULT_SCHEMA_VERSION = 1
+RESULT_STAT_NAMES = ["mean", "max", "p50", "p95", "p99"]
+RESULT_STAT_GROUPS = {
+    "rdma": ["client", "network", "server"],
+    "udp": ["network"],
+}
+RESULT_PROTOCOLS = list(RESULT_STAT_GROUPS.keys())
+# Binary value of a result (instead of the agent's text): tag, then one
+# packed RESULT_DTYPES record. A text value never starts with the tag.
+RESULT_BINARY_TAG = b"\x00" + bytes([RESULT_SCHEMA_VERSION])
+
+
+def result_stat_fields(proto: str) -> list:
+    """
+    Names of latency statistics of a protocol, e.g., ["network_mean", ...].
+    """
+    return [
+        f"{group}_{stat}"
+        for group in RESULT_STAT_GROUPS[proto]
+        for stat in RESULT_STAT_NAMES
+    ]
+
+
+def result_num_value_fields(proto: str) -> int:
+    """
+    Number of comma-separated fields after "src,dst" (RDMA: 23, UDP: 11).
+    """
+    return 5 + (1 + len(RESULT_STAT_NAMES)) * len(RESULT_STAT_GROUPS[proto])
+
+
+def _result_dtype(proto: str) -> np.dtype:
+    # 8-byte aligned fixed-width record; statistics are nanoseconds (uint64 in C++)
+    fields = [
+        ("ts_start", "<i8"),
+        ("ts_end", "<i8"),
+        ("src", "<u4"),
+        ("dst", "<u4"),
+        ("n_success", "<u4"),
+        ("n_failure", "<u4"),
+        ("n_weird", "<u4"),
+        ("reserved", "<u4"),
+    ]
+    fields += [(name, "<i8") for name in result_stat_fields(proto)]
+    return np.dtype(fields)
+
+
+RESULT_DTYPES = {proto: _result_dtype(proto) for proto in RESULT_PROTOCOLS}
+
+
+def ip_to_int(ip: str) -> int:
+    return struct.unpack("!I", socket.inet_aton(ip))[0]
+
+
+def int_to_ip(value: int) -> str:
+    return socket.inet_ntoa(struct.pack("!I", int(value)))
+
+
+@lru_cache(maxsize=4096)
+def _local_seconds_to_epoch(prefix: str) -> int:
+    return int(time.mktime(time.strptime(prefix, "%Y-%m-%d %H:%M:%S")))
+
+
+def timestamp_str_to_ns(ts: str) -> int:
+    """
+    Converts "%Y-%m-%d %H:%M:%S.%f" (local time, up to 9 fractional digits)
+    written by timestamp_ns_to_string() into epoch nanoseconds.
+    """
+    seconds = _local_seconds_to_epoch(ts[:19])
+    fraction = ts[20:29]
+    return seconds * 1_000_000_000 + (int(fraction.ljust(9, "0")) if fraction else 0)
+
+
+@lru_cache(maxsize=4096)
+def _epoch_to_local_seconds(seconds: int) -> str:
+    return datetime.fromtimestamp(seconds).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def ns_to_timestamp_str(ts_ns: int) -> str:
+    """
+    Inverse of timestamp_str_to_ns(), with nanosecond precision.
+    """
+    seconds, nanoseconds = divmod(int(ts_ns), 1_000_000_000)
+    return f"{_epoch_to_local_seconds(seconds)}.{nanoseconds:09d}"
+
+
+def ns_to_timestamp_strs(ts_ns: np.ndarray) -> np.ndarray:
+    """
+    ns_to_timestamp_str() of each element, as a string array of the same shape.
+    """
+    ts_ns = np.asarray(ts_ns, dtype=np.int64)
+    if ts_ns.size == 0:
+        return np.empty(ts_ns.shape, dtype="<U29")
+    seconds, nanoseconds = np.divmod(ts_ns.reshape(-1), 1_000_000_000)
+    unique_seconds, inverse = np.unique(seconds, return_inverse=True)
+    prefixes = np.array([_epoch_to_local_seconds(s) + "." for s in unique_seconds.tolist()])
+    strs = np.char.add(prefixes[inverse.reshape(-1)], np.char.zfill(nanoseconds.astype(str), 9))
+    return strs.reshape(ts_ns.shape)
+
+
+def ns_to_local_ns(ts_ns: np.ndarray) -> np.ndarray:
+    """
+    Epoch nanoseconds shifted by the local UTC offset of each timestamp: the
+    local wall-clock time as if it were UTC, for clients formatting in UTC.
+    """
+    ts_ns = np.asarray(ts_ns, dtype=np.int64)
+    if ts_ns.size == 0:
+        return ts_ns.copy()
+    unique_seconds, inverse = np.unique(ts_ns.reshape(-1) // 1_000_000_000, return_inverse=True)
+    offsets = np.array([time.localtime(s).tm_gmtoff for s in unique_seconds.tolist()], dtype=np.int64)
+    return ts_ns + (offsets[inverse.reshape(-1)] * 1_000_000_000).reshape(ts_ns.shape)
+
+
+def parse_result_line(proto: str, line: str):
+    """
+    Parses one result line into a tuple ordered as RESULT_DTYPES[proto].
+    Returns None if the line does not match the protocol's layout.
+    """
+    data = line.strip().split(",")
+    if len(data) != 2 + result_num_value_fields(proto):
+        return None
+    try:
+        record = [
+            timestamp_str_to_ns(data[2]),
+            timestamp_str_to_ns(data[3]),
+            ip_to_int(data[0]),
+            ip_to_int(data[1]),
+            int(data[4]),
+            int(data[5]),
+            int(data[6]),
+            0,
+        ]
+        for offset in range(7, len(data), 1 + len(RESULT_STAT_NAMES)):
+            record += [int(v) for v in data[offset + 1 : offset + 1 + len(RESULT_STAT_NAMES)]]
+    except (ValueError, OSError):
+        return None
+    return tuple(record)
+
+
+def format_result_values(proto: str, records: np.ndarray) -> list:
+    """
+    Formats records back to the "ts_start,ts_end,..." value strings (without
+    "src,dst") exactly as written by the C++ agent.
+    """
+    columns = [records[name].tolist() for name in result_stat_fields(proto)]
+    n_stats = len(RESULT_STAT_NAMES)
+    values = []
+    for i, (ts_start, ts_end, n_success, n_failure, n_weird) in enumerate(
+        zip(
+            ns_to_timestamp_strs(records["ts_start"]).tolist(),
+            ns_to_timestamp_strs(records["ts_end"]).tolist(),
+            records["n_success"].tolist(),
+            records["n_failure"].tolist(),
+            records["n_weird"].tolist(),
+        )
+    ):
+        fields = [ts_start, ts_end, str(n_success), str(n_failure), str(n_weird)]
+        for g, group in enumerate(RESULT_STAT_GROUPS[proto]):
+            fields.append(group)
+            fields += [str(columns[g * n_stats + k][i]) for k in range(n_stats)]
+        values.append(",".join(fields))
+    return values
+
+
+def pack_result_values(proto: str, records: np.ndarray) -> list:
+    """
+    Binary counterpart of format_result_values(): RESULT_BINARY_TAG + record bytes.
+    """
+    data = np.ascontiguousarray(records, dtype=RESULT_DTYPES[proto]).tobytes()
+    size = RESULT_DTYPES[proto].itemsize
+    return [RESULT_BINARY_TAG + data[i : i + size] for i in range(0, len(data), size)]
+
+
+def unpack_result_values(proto: str, values: list):
+    """
+    Decodes values of pack_result_values(). Returns (records, n_invalid);
+    values of another length or schema version are invalid.
+    """
+    size = len(RESULT_BINARY_TAG) + RESULT_DTYPES[proto].itemsize
+    valid = [v for v in values if len(v) == size and v.startswith(RESULT_BINARY_TAG)]
+    data = np.frombuffer(b"".join(valid), dtype=np.uint8).reshape(len(valid), size)
+    records = data[:, len(RESULT_BINARY_TAG) :].copy().view(RESULT_DTYPES[proto]).reshape(-1)
+    return records, len(values) - len(valid)
@@ -0,0 +1,376 @@
+import sys
+import time
+import numpy as np
+from result_format import (
+    RESULT_DTYPES,
+    RESULT_SCHEMA_VERSION,
+    RESULT_STAT_GROUPS,
+    RESULT_STAT_NAMES,
+    ip_to_int,
+    result_num_value_fields,
+    result_stat_fields,
+    timestamp_str_to_ns,
+)
+
+# Columnar parser of result lines (see the layout in result_format.py).
+#
+# A block of the body is tokenized as one uint8 array: the positions of all
+# newlines and commas give the (line, field) boundaries, and each column is
+# gathered into a fixed-width byte matrix and validated/converted with array
+# operations, without a Python object per field. A line that does not match
+# the schema is rejected individually (counted per reason, see REJECT_REASONS)
+# and never reaches Redis, the history or the plotter.
+
+NEWLINE, CARRIAGE_RETURN, COMMA, ZERO = ord("\n"), ord("\r"), ord(","), ord("0")
+# stripped from both ends of a line, like str.strip() of the line-based parser
+BLANKS = np.frombuffer(b" \t\v\f", np.uint8)
+REJECT_REASONS = ["n_fields", "ip", "timestamp", "group", "number"]
+
+# "%Y-%m-%d %H:%M:%S.%09d" of timestamp_ns_to_string() in the C++ agent
+TIMESTAMP_LEN = 29
+TIMESTAMP_SECONDS_LEN = 19
+TIMESTAMP_SEPARATORS = {4: "-", 7: "-", 10: " ", 13: ":", 16: ":", 19: "."}
+IP_MAX_LEN = 15
+NUMBER_MAX_DIGITS = 19  # fits int64 after the range check in _parse_numbers()
+U32_MAX = 2**32 - 1
+I64_MAX = 2**63 - 1
+I64_MAX_DIGITS = np.array([int(digit) for digit in str(I64_MAX)], np.int16)
+
+
+class ResultSchema:
+    """
+    Column layout of a protocol's result line, for RESULT_SCHEMA_VERSION.
+    """
+
+    def __init__(self, proto: str):
+        self.proto = proto
+        self.version = RESULT_SCHEMA_VERSION
+        self.dtype = RESULT_DTYPES[proto]
+        self.n_fields = 2 + result_num_value_fields(proto)  # RDMA: 25, UDP: 13
+        self.count_columns = {"n_success": 4, "n_failure": 5, "n_weird": 6}
+        self.group_columns = {}  # group label -> column
+        self.stat_columns = {}  # "network_p99" -> column
+        column = 7
+        for group in RESULT_STAT_GROUPS[proto]:
+            self.group_columns[group] = column
+            for stat in RESULT_STAT_NAMES:
+                column += 1
+                self.stat_columns[f"{group}_{stat}"] = column
+            column += 1
+        self.number_columns = {**self.count_columns, **self.stat_columns}
+
+
+RESULT_SCHEMAS = {proto: ResultSchema(proto) for proto in RESULT_DTYPES}
+
+
+def _gather(buf: np.ndarray, starts: np.ndarray, lengths: np.ndarray, width: int) -> np.ndarray:
+    """
+    (n, width) bytes of the fields starting at `starts`, zero-padded after their length.
+    """
+    offsets = np.arange(width)
+    index = np.minimum(starts[:, None] + offsets, len(buf) - 1)
+    chars = buf[index]
+    chars[offsets >= lengths[:, None]] = 0
+    return chars
+
+
+def _parse_numbers(buf: np.ndarray, starts: np.ndarray, lengths: np.ndarray) -> tuple:
+    """
+    Decimal fields -> (int64 array, valid mask). The fields are gathered
+    right-aligned into a (..., width) digit matrix and converted by a dot
+    product with powers of ten, in halves of at most 9 digits. Numbers above
+    I64_MAX are invalid.
+    """
+    valid = (lengths >= 1) & (lengths <= NUMBER_MAX_DIGITS)
+    lengths = np.where(valid, lengths, 0)
+    width = max(int(lengths.max(initial=0)), 1)
+    offsets = np.arange(-width, 0)
+    # left padding may index before the buffer (wraps around), it is zeroed anyway
+    chars = buf.take((starts + lengths)[..., None] + offsets, mode="wrap")
+    digits = (chars - np.uint8(ZERO)) * (offsets >= -lengths[..., None])
+    valid &= (digits <= 9).all(axis=-1)
+    if width >= NUMBER_MAX_DIGITS:
+        # 19 digits: compare with the digits of I64_MAX at the first difference
+        diff = digits[..., -NUMBER_MAX_DIGITS:].astype(np.int16) - I64_MAX_DIGITS
+        first = np.argmax(diff != 0, axis=-1)[..., None]
+        too_large = np.take_along_axis(diff, first, axis=-1)[..., 0] > 0
+        valid &= ~((lengths == NUMBER_MAX_DIGITS) & too_large)
+
+    values = np.zeros(starts.shape, np.int64)
+    for low in range(0, width, 9):  # from the least significant digits
+        half = digits[..., max(0, width - low - 9) : width - low]
+        powers = 10.0 ** np.arange(half.shape[-1] - 1, -1, -1)
+        values += (half @ powers).astype(np.int64) * (10 ** low)
+    return values, valid
+
+
+def _parse_ips(buf: np.ndarray, starts: np.ndarray, lengths: np.ndarray) -> tuple:
+    """
+    Dotted IPv4 fields -> (uint32 array, valid mask). Each distinct address is
+    converted once.
+    """
+    valid = (lengths >= 7) & (lengths <= IP_MAX_LEN)
+    chars = _gather(buf, starts, np.where(valid, lengths, 0), IP_MAX_LEN)
+    uniques, inverse = np.unique(chars.view(f"S{IP_MAX_LEN}").ravel(), return_inverse=True)
+    converted = np.zeros(len(uniques), np.uint32)
+    converted_ok = np.zeros(len(uniques), bool)
+    for i, ip in enumerate(uniques.tolist()):
+        try:
+            converted[i] = ip_to_int(ip.decode())
+            converted_ok[i] = True
+        except (OSError, UnicodeDecodeError):
+            continue
+    return converted[inverse], valid & converted_ok[inverse]
+
+
+def _parse_timestamps(buf: np.ndarray, starts: np.ndarray, lengths: np.ndarray) -> tuple:
+    """
+    Timestamp fields -> (epoch ns array, valid mask). Fixed-width ones are
+    checked and converted as a byte matrix; the local-time conversion runs
+    once per distinct second. Other widths fall back to timestamp_str_to_ns().
+    """
+    n = len(starts)
+    parsed = np.zeros(n, np.int64)
+    valid = np.zeros(n, bool)
+    fixed = np.flatnonzero(lengths == TIMESTAMP_LEN)
+
+    if len(fixed):
+        chars = _gather(buf, starts[fixed], lengths[fixed], TIMESTAMP_LEN)
+        digits = chars.astype(np.int64) - ZERO
+        ok = np.ones(len(fixed), bool)
+        for position in range(TIMESTAMP_LEN):
+            if position in TIMESTAMP_SEPARATORS:
+                ok &= chars[:, position] == ord(TIMESTAMP_SEPARATORS[position])
+            else:
+                ok &= (digits[:, position] >= 0) & (digits[:, position] <= 9)
+
+        nanoseconds = digits[:, TIMESTAMP_SECONDS_LEN + 1 :] @ (
+            10 ** np.arange(8, -1, -1, dtype=np.int64)
+        )
+        prefixes, inverse = np.unique(
+            np.ascontiguousarray(chars[:, :TIMESTAMP_SECONDS_LEN]).view(f"S{TIMESTAMP_SECONDS_LEN}").ravel(),
+            return_inverse=True,
+        )
+        seconds = np.zeros(len(prefixes), np.int64)
+        for i, prefix in enumerate(prefixes.tolist()):
+            try:
+                seconds[i] = timestamp_str_to_ns(prefix.decode())
+            except (ValueError, OverflowError, OSError, UnicodeDecodeError):
+                seconds[i] = -1
+        ok &= seconds[inverse] >= 0
+        parsed[fixed] = seconds[inverse] + nanoseconds
+        valid[fixed] = ok
+
+    for i in np.flatnonzero(lengths != TIMESTAMP_LEN).tolist():
+        try:
+            text = buf[starts[i] : starts[i] + lengths[i]].tobytes().decode()
+            parsed[i] = timestamp_str_to_ns(text)
+            valid[i] = True
+        except (ValueError, OverflowError, OSError, UnicodeDecodeError):
+            continue
+    return parsed, valid
+
+
+def parse_result_block(proto: str, data: bytes, rejected: dict = None):
+    """
+    Parses a block of complete result lines into records of RESULT_DTYPES[proto].
+    Returns (records, number of rejected lines). If given, `rejected` counts
+    the rejected lines per reason (first failing check of a line).
+    Empty lines are skipped.
+    """
+    schema = RESULT_SCHEMAS[proto]
+    buf = np.frombuffer(data, np.uint8)
+    if len(buf) and (buf == CARRIAGE_RETURN).any():
+        buf = buf[buf != CARRIAGE_RETURN]
+    if len(buf) == 0 or buf[-1] != NEWLINE:
+        buf = np.append(buf, np.uint8(NEWLINE))
+
+    # line boundaries (without leading/trailing blanks) and number of commas per line
+    newlines = np.flatnonzero(buf == NEWLINE)
+    line_starts = np.concatenate(([0], newlines[:-1] + 1))
+    line_ends = newlines
+    edges = np.concatenate((buf[line_starts], buf[np.maximum(line_ends - 1, 0)]))
+    if np.isin(edges, BLANKS).any():
+        blank = np.isin(buf, BLANKS)
+        content = np.append(np.flatnonzero(~blank & (buf != NEWLINE)), len(buf))
+        first = content[np.searchsorted(content, line_starts)]
+        last = content[np.maximum(np.searchsorted(content, line_ends) - 1, 0)]
+        has_content = first < line_ends
+        line_starts = np.where(has_content, first, line_starts)
+        line_ends = np.where(has_content, last + 1, line_starts)
+    commas = np.flatnonzero(buf == COMMA)
+    commas_before = np.searchsorted(commas, line_starts)
+    n_commas = np.diff(np.append(commas_before, len(commas)))
+    nonempty = line_ends > line_starts
+    good = nonempty & (n_commas == schema.n_fields - 1)
+    reasons = {"n_fields": int((nonempty & ~good).sum())}
+
+    n = int(good.sum())
+    if n == 0:
+        _count_rejected(rejected, reasons)
+        return np.zeros(0, dtype=schema.dtype), reasons["n_fields"]
+
+    # (n, n_fields) start/end of every field
+    line_commas = commas[commas_before[good][:, None] + np.arange(schema.n_fields - 1)]
+    starts = np.column_stack((line_starts[good], line_commas + 1))
+    ends = np.column_stack((line_commas, line_ends[good]))
+    lengths = ends - starts
+
+    src, src_ok = _parse_ips(buf, starts[:, 0], lengths[:, 0])
+    dst, dst_ok = _parse_ips(buf, starts[:, 1], lengths[:, 1])
+    ts_start, ts_start_ok = _parse_timestamps(buf, starts[:, 2], lengths[:, 2])
+    ts_end, ts_end_ok = _parse_timestamps(buf, starts[:, 3], lengths[:, 3])
+
+    group_ok = np.ones(n, bool)
+    for group, column in schema.group_columns.items():
+        label = np.frombuffer(group.encode(), np.uint8)
+        chars = _gather(buf, starts[:, column], lengths[:, column], len(label))
+        group_ok &= (lengths[:, column] == len(label)) & (chars == label).all(axis=1)
+
+    number_columns = list(schema.number_columns.values())
+    numbers, numbers_ok = _parse_numbers(buf, starts[:, number_columns], lengths[:, number_columns])
+    n_counts = len(schema.count_columns)
+    numbers_ok[:, :n_counts] &= numbers[:, :n_counts] <= U32_MAX
+    numbers_ok = numbers_ok.all(axis=1)
+
+    valid = np.ones(n, bool)
+    for reason, ok in [
+        ("ip", src_ok & dst_ok),
+        ("timestamp", ts_start_ok & ts_end_ok),
+        ("group", group_ok),
+        ("number", numbers_ok),
+    ]:
+        reasons[reason] = int((valid & ~ok).sum())
+        valid &= ok
+
+    records = np.zeros(int(valid.sum()), dtype=schema.dtype)
+    records["ts_start"] = ts_start[valid]
+    records["ts_end"] = ts_end[valid]
+    records["src"] = src[valid]
+    records["dst"] = dst[valid]
+    for i, name in enumerate(schema.number_columns):
+        records[name] = numbers[valid, i]
+
+    _count_rejected(rejected, reasons)
+    return records, sum(reasons.values())
+
+
+def _count_rejected(rejected: dict, reasons: dict):
+    if rejected is None:
+        return
+    for reason, count in reasons.items():
+        if count:
+            rejected[reason] = rejected.get(reason, 0) + count
+
+
+class ResultStreamParser:
+    """
+    Incremental parser of a POST body of result lines.
+
+    feed() takes the body chunk by chunk (any split, already decompressed).
+    Complete lines are parsed by parse_result_block() once `block_bytes` are
+    buffered, so a request holds at most about one block of raw text.
+    """
+
+    def __init__(self, proto: str, block_bytes: int = 1048576):
+        self.proto = proto
+        self.block_bytes = block_bytes
+        self.buffer = bytearray()
+        self.blocks = []
+        self.n_invalid = 0
+        self.n_bytes = 0
+        self.rejected = {}  # reason -> number of lines
+
+    def feed(self, chunk: bytes):
+        self.n_bytes += len(chunk)
+        self.buffer += chunk
+        start = 0
+        while len(self.buffer) - start >= self.block_bytes:
+            end = self.buffer.rfind(b"\n", start, start + self.block_bytes) + 1
+            if end <= start:
+                end = self.buffer.find(b"\n", start + self.block_bytes) + 1
+                if end <= 0:
+                    break  # a very long line, wait for its end
+            self._parse_block(bytes(self.buffer[start:end]))
+            start = end
+        del self.buffer[:start]
+
+    def _parse_block(self, data: bytes):
+        records, n_invalid = parse_result_block(self.proto, data, self.rejected)
+        self.blocks.append(records)
+        self.n_invalid += n_invalid
+
+    def finish(self):
+        """
+        Parses the remaining lines. Returns (records, number of invalid lines).
+        """
+        self._parse_block(bytes(self.buffer))
+        self.buffer = bytearray()
+        records = self.blocks[0] if len(self.blocks) == 1 else np.concatenate(self.blocks)
+        self.blocks = []
+        return records, self.n_invalid
+
+
+def parse_result_records(proto: str, raw_data: str):
+    """
+    Parses a whole POST body of result lines into records of RESULT_DTYPES[proto].
+    Returns (records, number of invalid lines).
+    """
+    parser = ResultStreamParser(proto)
+    parser.feed(raw_data.encode())
+    return parser.finish()
+
+
+def benchmark(n_lines: int = 100000, repeat: int = 5):
+    """
+    Micro-benchmark (lines/s) of the split-based code vs. this parser on a
+    synthetic body. Run: python3 result_parser.py [n_lines]
+    """
+    from result_format import format_result_values, int_to_ip, parse_result_line
+
+    for proto in RESULT_DTYPES:
+        records = np.zeros(n_lines, dtype=RESULT_DTYPES[proto])
+        records["ts_start"] = time.time_ns() - np.arange(n_lines) * 1000
+        records["ts_end"] = records["ts_start"] + 10_000_000_000
+        records["src"] = 0x0A000000 + np.arange(n_lines) // 1000
+        records["dst"] = 0x0A000000 + np.arange(n_lines) % 1000
+        records["n_success"] = 100
+        for name in result_stat_fields(proto):
+            records[name] = np.random.randint(1000, 100000, n_lines)
+        body = "\n".join(
+            f"{int_to_ip(src)},{int_to_ip(dst)},{values}"
+            for src, dst, values in zip(
+                records["src"].tolist(), records["dst"].tolist(), format_result_values(proto, records)
+            )
+        )
+
+        def split_based():  # the original handler: split and re-join, no validation
+            for result in body.strip().split("\n"):
+                data = result.strip().split(",")
+                _ = proto + "," + ",".join(data[0:2]), ",".join(data[2:])
+
+        def line_by_line():
+            return [parse_result_line(proto, line) for line in body.strip().split("\n")]
+
+        def columnar():
+            return parse_result_records(proto, body)
+
+        parsed, n_invalid = columnar()
+        assert n_invalid == 0 and (parsed == records).all()
+        for name, func in [
+            ("split/join (no validation)", split_based),
+            ("parse_result_line (per line)", line_by_line),
+            ("parse_result_block (columnar)", columnar),
+        ]:
+            elapsed = min(_timeit(func) for _ in range(repeat))
+            print(f"{proto:4s} {name:32s} {n_lines / elapsed:12,.0f} lines/s")
+
+
+def _timeit(func) -> float:
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
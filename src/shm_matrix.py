@@ -0,0 +1,497 @@
+import time
+import numpy as np
+from multiprocessing import shared_memory
+from result_format import RESULT_DTYPES, RESULT_SCHEMA_VERSION, ip_to_int
+
+# Shared memory layout of a protocol's latest-value matrix:
+#   header    : uint64[8] = seq, n_slots, capacity, schema version, n_tiles, n_tiles_used,
+#               n_written, (reserved)
+#   ip table  : uint32[capacity], slot -> IPv4 address (stable once assigned, 0: unused)
+#   tile table: int32[capacity / SHM_TILE_SIZE, capacity / SHM_TILE_SIZE],
+#               [src slot block, dst slot block] -> 1 + index of its tile, 0: none
+#   cells     : RESULT_DTYPES[proto][n_tiles * SHM_TILE_SIZE ** 2], tiles of
+#               SHM_TILE_SIZE x SHM_TILE_SIZE cells indexed by [src slot, dst slot]
+#   change log: uint32[n_tiles * SHM_TILE_SIZE ** 2], ring of the cell indices
+#               written by update(); entry i % len is the i-th write, n_written
+#               counts all writes (see changed_cells())
+# Only the tiles of pinglist groups are allocated (see reserve()), so memory
+# grows with the sum of the groups' squares instead of the square of all IPs.
+# `seq` is a seqlock: odd while a writer is updating, bumped by two per update.
+SHM_NAME_PREFIX = "pingweave_latest_"
+SHM_HEADER_WORDS = 8
+SHM_HEADER_SEQ = 0
+SHM_HEADER_N_SLOTS = 1
+SHM_HEADER_CAPACITY = 2
+SHM_HEADER_VERSION = 3
+SHM_HEADER_N_TILES = 4
+SHM_HEADER_N_TILES_USED = 5
+SHM_HEADER_N_WRITTEN = 6
+SHM_TILE_SIZE = 16
+SHM_TILE_CELLS = SHM_TILE_SIZE * SHM_TILE_SIZE
+# lower bounds of the sizes derived from the pinglist (see matrix_sizes)
+SHM_MIN_NODES = 1024
+SHM_MIN_PAIRS = 65536
+
+# matrices created by (or inherited from) this process, proto -> LatestValueMatrix
+latest_matrices = {}
+
+
+def _tiles(n: int) -> int:
+    return -(-n // SHM_TILE_SIZE)
+
+
+def _layout(proto: str, capacity: int, n_tiles: int) -> list:
+    """
+    (offset, size) of the header, ip table, tile table, cells and change log,
+    64-byte aligned.
+    """
+    layout = []
+    offset = 0
+    for size in [
+        SHM_HEADER_WORDS * 8,
+        capacity * 4,
+        _tiles(capacity) ** 2 * 4,
+        n_tiles * SHM_TILE_CELLS * RESULT_DTYPES[proto].itemsize,
+        n_tiles * SHM_TILE_CELLS * 4,
+    ]:
+        layout.append((offset, size))
+        offset += (size + 63) // 64 * 64
+    return layout
+
+
+class LatestValueMatrix:
+    """
+    Latest result of every (src, dst) pair of a protocol in shared memory.
+
+    The collector writes with update(); the plotter reads a group with
+    read_group() without any Redis round trip. Readers never block writers:
+    a read is retried if the seqlock changed while copying.
+    Cells whose ts_end is 0 have no data.
+
+    Slots and tiles are assigned by reserve(), i.e., by the process that
+    loads the pinglist, one group at a time: the new IPs of a group get
+    consecutive slots from a tile boundary, so that a group of n IPs takes
+    ceil(n / SHM_TILE_SIZE) ** 2 tiles. Records of pairs without a tile are
+    not stored (update() returns -1 for them, see n_overflow).
+    """
+
+    def __init__(self, proto: str, shm: shared_memory.SharedMemory, lock=None):
+        self.proto = proto
+        self.shm = shm
+        self.lock = lock
+        self.dtype = RESULT_DTYPES[proto]
+        self.header = np.ndarray((SHM_HEADER_WORDS,), dtype=np.uint64, buffer=shm.buf)
+        self.capacity = int(self.header[SHM_HEADER_CAPACITY])
+        self.n_tiles = int(self.header[SHM_HEADER_N_TILES])
+        if int(self.header[SHM_HEADER_VERSION]) != RESULT_SCHEMA_VERSION:
+            raise ValueError(f"Schema version mismatch of shared memory {shm.name}")
+        layout = _layout(proto, self.capacity, self.n_tiles)
+        self.ip_table = np.ndarray(
+            (self.capacity,), dtype=np.uint32, buffer=shm.buf, offset=layout[1][0]
+        )
+        n_blocks = _tiles(self.capacity)
+        self.tile_table = np.ndarray(
+            (n_blocks, n_blocks), dtype=np.int32, buffer=shm.buf, offset=layout[2][0]
+        )
+        self.cells = np.ndarray(
+            (self.n_tiles * SHM_TILE_CELLS,), dtype=self.dtype, buffer=shm.buf, offset=layout[3][0]
+        )
+        self.change_log = np.ndarray(
+            (self.n_tiles * SHM_TILE_CELLS,), dtype=np.uint32, buffer=shm.buf, offset=layout[4][0]
+        )
+        # IPv4 (int) -> slot, cached from ip_table as sorted arrays
+        self.n_known_slots = 0
+        self.sorted_ips = np.empty(0, np.uint32)
+        self.sorted_slots = np.empty(0, np.int64)
+        self.n_overflow = 0  # records of update() without a cell
+
+    @classmethod
+    def create(cls, proto: str, capacity: int, max_pairs: int, lock=None):
+        """
+        A matrix of `capacity` IPs, with tiles for at least `max_pairs` pairs.
+        """
+        name = SHM_NAME_PREFIX + proto
+        capacity = _tiles(capacity) * SHM_TILE_SIZE
+        n_tiles = -(-max_pairs // SHM_TILE_CELLS)
+        layout = _layout(proto, capacity, n_tiles)
+        size = layout[-1][0] + layout[-1][1]
+        try:
+            shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            # left over from a previous run which was not cleaned up
+            stale = shared_memory.SharedMemory(name=name)
+            stale.close()
+            stale.unlink()
+            shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        header = np.ndarray((SHM_HEADER_WORDS,), dtype=np.uint64, buffer=shm.buf)
+        header[:] = 0
+        header[SHM_HEADER_CAPACITY] = capacity
+        header[SHM_HEADER_VERSION] = RESULT_SCHEMA_VERSION
+        header[SHM_HEADER_N_TILES] = n_tiles
+        del header
+        return cls(proto, shm, lock)
+
+    @classmethod
+    def attach(cls, proto: str, lock=None):
+        return cls(proto, shared_memory.SharedMemory(name=SHM_NAME_PREFIX + proto), lock)
+
+    @property
+    def seq(self) -> int:
+        return int(self.header[SHM_HEADER_SEQ])
+
+    @property
+    def n_written(self) -> int:
+        return int(self.header[SHM_HEADER_N_WRITTEN])
+
+    @property
+    def n_tiles_used(self) -> int:
+        return int(self.header[SHM_HEADER_N_TILES_USED])
+
+    def recover_seqlock(self) -> bool:
+        """
+        Makes the sequence even again if a writer was killed between the two
+        increments of update(). Only safe when no writer process is alive.
+        The cells of that interrupted update may be partially written.
+        """
+        if self.seq % 2 == 0:
+            return False
+        self.header[SHM_HEADER_SEQ] += 1
+        return True
+
+    def _refresh_slots(self):
+        n_slots = int(self.header[SHM_HEADER_N_SLOTS])
+        if n_slots == self.n_known_slots:
+            return
+        ips = self.ip_table[:n_slots]
+        slots = np.flatnonzero(ips)  # skip the padding up to tile boundaries
+        order = np.argsort(ips[slots], kind="stable")
+        self.sorted_ips = ips[slots][order]
+        self.sorted_slots = slots[order]
+        self.n_known_slots = n_slots
+
+    def slots(self, ip_ints: np.ndarray) -> np.ndarray:
+        """
+        Slot of each IPv4 (int), -1 if it has none.
+        """
+        self._refresh_slots()
+        ip_ints = np.asarray(ip_ints, dtype=np.uint32)
+        if len(self.sorted_ips) == 0:
+            return np.full(len(ip_ints), -1, np.int64)
+        pos = np.minimum(np.searchsorted(self.sorted_ips, ip_ints), len(self.sorted_ips) - 1)
+        return np.where(self.sorted_ips[pos] == ip_ints, self.sorted_slots[pos], -1)
+
+    def cell_index(self, src_slots: np.ndarray, dst_slots: np.ndarray) -> np.ndarray:
+        """
+        Index in `cells` of each (src slot, dst slot), -1 if it has no tile.
+        """
+        valid = (src_slots >= 0) & (dst_slots >= 0)
+        src = np.where(valid, src_slots, 0)
+        dst = np.where(valid, dst_slots, 0)
+        tiles = self.tile_table[src // SHM_TILE_SIZE, dst // SHM_TILE_SIZE].astype(np.int64) - 1
+        cells = tiles * SHM_TILE_CELLS + src % SHM_TILE_SIZE * SHM_TILE_SIZE + dst % SHM_TILE_SIZE
+        return np.where(valid & (tiles >= 0), cells, -1)
+
+    def _allocate_tiles(self, block_rows: np.ndarray, block_cols: np.ndarray) -> bool:
+        """
+        Allocates the missing tiles of the (src block, dst block) pairs;
+        nothing if the pool does not have enough. Called with the lock held.
+        """
+        missing = self.tile_table[block_rows, block_cols] == 0
+        block_rows, block_cols = block_rows[missing], block_cols[missing]
+        if len(block_rows) == 0:
+            return True
+        pairs = np.unique(block_rows * len(self.tile_table) + block_cols)
+        n_used = self.n_tiles_used
+        if n_used + len(pairs) > self.n_tiles:
+            return False
+        # fresh tiles are zero (no data): the pool is never reused
+        self.tile_table.reshape(-1)[pairs] = n_used + 1 + np.arange(len(pairs))
+        self.header[SHM_HEADER_N_TILES_USED] = n_used + len(pairs)
+        return True
+
+    def reserve(self, ips: list) -> bool:
+        """
+        Assigns slots to the IPs of a group that have none, and tiles to all
+        pairs of the group. Returns False, reserving nothing, if the matrix
+        is out of slots or tiles.
+        """
+        ip_ints = np.array([ip_to_int(ip) for ip in ips], dtype=np.uint32)
+        if self.lock is not None:
+            self.lock.acquire()
+        try:
+            slots = self.slots(ip_ints)
+            new_ips = ip_ints[(slots < 0) & (ip_ints != 0)]
+            _, first = np.unique(new_ips, return_index=True)
+            new_ips = new_ips[np.sort(first)]  # in the group's order
+
+            n_slots = int(self.header[SHM_HEADER_N_SLOTS])
+            start = _tiles(n_slots) * SHM_TILE_SIZE if len(new_ips) else n_slots
+            if start + len(new_ips) > self.capacity:
+                return False
+            blocks = np.unique(
+                np.concatenate((slots[slots >= 0], start + np.arange(len(new_ips))))
+                // SHM_TILE_SIZE
+            )
+            block_rows, block_cols = np.meshgrid(blocks, blocks, indexing="ij")
+            if not self._allocate_tiles(block_rows.reshape(-1), block_cols.reshape(-1)):
+                return False
+
+            self.ip_table[start : start + len(new_ips)] = new_ips
+            self.header[SHM_HEADER_N_SLOTS] = start + len(new_ips)
+            return True
+        finally:
+            if self.lock is not None:
+                self.lock.release()
+
+    def covers(self, ips: list) -> bool:
+        """
+        True if every pair of the IPs has a cell, i.e., their group is reserved.
+        """
+        slots = self.slots(np.array([ip_to_int(ip) for ip in ips], dtype=np.uint32))
+        if (slots < 0).any():
+            return False
+        blocks = np.unique(slots // SHM_TILE_SIZE)
+        return bool((self.tile_table[np.ix_(blocks, blocks)] > 0).all())
+
+    def update(self, records: np.ndarray) -> np.ndarray:
+        """
+        Writes records (RESULT_DTYPES[proto]) into their (src, dst) cells.
+        Returns the cell index of each record, -1 if its pair has no cell.
+        """
+        if len(records) == 0:
+            return np.empty(0, np.int64)
+        if self.lock is not None:
+            self.lock.acquire()
+        try:
+            cells = self.cell_index(self.slots(records["src"]), self.slots(records["dst"]))
+            mapped = cells >= 0
+            if not mapped.all():
+                self.n_overflow += int((~mapped).sum())
+                records, mapped_cells = records[mapped], cells[mapped]
+            else:
+                mapped_cells = cells
+
+            self.header[SHM_HEADER_SEQ] += 1  # odd: write in progress
+            # np.put: much faster than fancy indexing for wide structured records
+            np.put(self.cells, mapped_cells, records)
+            self._log_changes(mapped_cells)
+            self.header[SHM_HEADER_SEQ] += 1
+        finally:
+            if self.lock is not None:
+                self.lock.release()
+        return cells
+
+    def _log_changes(self, cells: np.ndarray):
+        """
+        Appends written cell indices to the change log; the caller holds the seqlock.
+        Of more than fit, only the last len(change_log) are kept.
+        """
+        n_written = self.n_written
+        kept = cells[-len(self.change_log) :]
+        start = n_written + len(cells) - len(kept)
+        np.put(self.change_log, np.arange(start, start + len(kept)), kept, mode="wrap")
+        self.header[SHM_HEADER_N_WRITTEN] = n_written + len(cells)
+
+    def _read(self, source: np.ndarray, cells: np.ndarray, max_retries: int) -> np.ndarray:
+        """
+        Consistent copy of the given cells of `source` (cells or a field of them).
+        """
+        for _ in range(max_retries):
+            seq_before = self.seq
+            if seq_before % 2 == 1:
+                time.sleep(0)  # a writer is in progress
+                continue
+            records = np.take(source, cells)
+            if self.seq == seq_before:
+                return records
+        raise TimeoutError(f"Cannot read a consistent {self.proto} matrix")
+
+    def read_block(
+        self, src_slots: np.ndarray, dst_slots: np.ndarray, field: str = None, max_retries: int = 1000
+    ) -> np.ndarray:
+        """
+        Consistent copy of the [src, dst] cells between slots (see slots()),
+        or of one field of them. Cells of slot -1 or of pairs without a
+        tile are returned empty (0).
+        """
+        cells = self.cell_index(src_slots[:, None], dst_slots[None, :])
+        source = self.cells if field is None else self.cells[field]
+        mapped = cells >= 0
+        if mapped.all():
+            return self._read(source, cells, max_retries)
+        result = np.zeros(cells.shape, dtype=source.dtype)
+        records = self._read(source, cells[mapped], max_retries)
+        np.put(result.reshape(-1), np.flatnonzero(mapped), records)
+        return result
+
+    def read_group(self, ips: list, max_retries: int = 1000) -> np.ndarray:
+        """
+        Consistent copy of the [src, dst] submatrix of the given IPs.
+        Cells of unknown IPs or pairs are returned empty (ts_end == 0).
+        """
+        slots = self.slots(np.array([ip_to_int(ip) for ip in ips], dtype=np.uint32))
+        return self.read_block(slots, slots, max_retries=max_retries)
+
+    def _cell_slots(self, cells: np.ndarray):
+        """
+        (src slots, dst slots) of cell indices.
+        """
+        block_rows, block_cols = np.nonzero(self.tile_table)
+        tiles = self.tile_table[block_rows, block_cols] - 1
+        tile_rows = np.zeros(self.n_tiles, np.int64)
+        tile_cols = np.zeros(self.n_tiles, np.int64)
+        tile_rows[tiles], tile_cols[tiles] = block_rows, block_cols
+        tile, offset = np.divmod(cells, SHM_TILE_CELLS)
+        row, col = np.divmod(offset, SHM_TILE_SIZE)
+        return tile_rows[tile] * SHM_TILE_SIZE + row, tile_cols[tile] * SHM_TILE_SIZE + col
+
+    def snapshot(self, max_retries: int = 1000):
+        """
+        Consistent copy of all cells with data.
+        Returns (ip_table, src_slots, dst_slots, records).
+        """
+        for _ in range(max_retries):
+            seq_before = self.seq
+            if seq_before % 2 == 1:
+                time.sleep(0)  # a writer is in progress
+                continue
+            n_slots = int(self.header[SHM_HEADER_N_SLOTS])
+            ip_table = self.ip_table[:n_slots].copy()
+            cells = np.flatnonzero(self.cells["ts_end"][: self.n_tiles_used * SHM_TILE_CELLS])
+            records = np.take(self.cells, cells)
+            if self.seq == seq_before:
+                return (ip_table, *self._cell_slots(cells), records)
+        raise TimeoutError(f"Cannot read a consistent {self.proto} matrix")
+
+    def changed_cells(self, since: int, max_retries: int = 1000):
+        """
+        Consistent copy of the cells written since the change log counted
+        `since` writes (a previous n_written). Costs O(writes since then).
+        Returns (n_written, records), records once per cell, or None if the
+        change log has been overwritten since: the caller must read the cells
+        it needs again (e.g., read_group()) and continue from n_written.
+        """
+        for _ in range(max_retries):
+            seq_before = self.seq
+            if seq_before % 2 == 1:
+                time.sleep(0)  # a writer is in progress
+                continue
+            n_written = self.n_written
+            if not 0 <= n_written - since <= len(self.change_log):
+                return None
+            cells = np.take(self.change_log, np.arange(since, n_written), mode="wrap")
+            records = np.take(self.cells, np.unique(cells))
+            if self.seq == seq_before:
+                return n_written, records
+        raise TimeoutError(f"Cannot read a consistent {self.proto} matrix")
+
+    def restore(self, ip_table: np.ndarray, src_slots: np.ndarray, dst_slots: np.ndarray, records: np.ndarray):
+        """
+        Loads the output of snapshot() into an empty matrix, i.e., before any
+        update() or reserve(). Slots must be smaller than len(ip_table) <= capacity.
+        Returns the cell index of each record, -1 if it was not restored
+        because the matrix is out of tiles.
+        """
+        if len(ip_table) > self.capacity:
+            raise ValueError(f"Snapshot has {len(ip_table)} IPs, capacity is {self.capacity}")
+        if self.lock is not None:
+            self.lock.acquire()
+        try:
+            self.header[SHM_HEADER_SEQ] += 1
+            self.ip_table[: len(ip_table)] = ip_table
+            self.header[SHM_HEADER_N_SLOTS] = len(ip_table)
+
+            # tiles of the restored pairs, as long as there are enough
+            block_rows, block_cols = src_slots // SHM_TILE_SIZE, dst_slots // SHM_TILE_SIZE
+            pairs, counts = np.unique(block_rows * len(self.tile_table) + block_cols, return_counts=True)
+            pairs = pairs[np.argsort(-counts, kind="stable")][: self.n_tiles]
+            self._allocate_tiles(*np.divmod(pairs, len(self.tile_table)))
+
+            cells = self.cell_index(src_slots, dst_slots)
+            mapped = cells >= 0
+            np.put(self.cells, cells[mapped], np.take(records, np.flatnonzero(mapped)))
+            self.header[SHM_HEADER_SEQ] += 1
+        finally:
+            if self.lock is not None:
+                self.lock.release()
+        return cells
+
+    def close(self):
+        del self.header, self.ip_table, self.tile_table, self.cells, self.change_log
+        self.shm.close()
+
+
+def matrix_sizes(pinglist, max_nodes: int = 0, max_pairs: int = 0) -> dict:
+    """
+    proto -> (IPs, pairs) of the matrices. A size of 0 means twice what the
+    groups of the pinglist take (tile-aligned), at least SHM_MIN_NODES IPs
+    and SHM_MIN_PAIRS pairs.
+    """
+    sizes = {}
+    for proto in RESULT_DTYPES:
+        groups = pinglist.get(proto) if isinstance(pinglist, dict) else None
+        lengths = [len(ips) for ips in (groups or {}).values() if isinstance(ips, list)]
+        nodes = sum(_tiles(n) * SHM_TILE_SIZE for n in lengths)
+        pairs = sum(_tiles(n) ** 2 * SHM_TILE_CELLS for n in lengths)
+        sizes[proto] = (
+            max_nodes or max(2 * nodes, SHM_MIN_NODES),
+            max_pairs or max(2 * pairs, SHM_MIN_PAIRS),
+        )
+    return sizes
+
+
+def create_latest_matrices(sizes: dict, lock=None):
+    """
+    Creates the shared matrices of all protocols, proto -> (IPs, pairs) of
+    matrix_sizes(). Called by the parent process before forking, so that
+    children inherit them.
+    """
+    for proto, (capacity, max_pairs) in sizes.items():
+        latest_matrices[proto] = LatestValueMatrix.create(proto, capacity, max_pairs, lock)
+    return latest_matrices
+
+
+def reserve_pinglist(pinglist) -> list:
+    """
+    Reserves the groups of a pinglist in the matrices created or inherited
+    by this process (not attached ones, which have no writer lock).
+    Returns the (proto, group) that do not fit or are malformed.
+    """
+    missing = []
+    if not isinstance(pinglist, dict):
+        return missing
+    for proto, groups in pinglist.items():
+        matrix = latest_matrices.get(proto)
+        if matrix is None or matrix.lock is None or not isinstance(groups, dict):
+            continue
+        for group, ips in groups.items():
+            try:
+                if not isinstance(ips, list) or not matrix.reserve(ips):
+                    missing.append((proto, group))
+            except (OSError, TypeError):  # not an IPv4 address
+                missing.append((proto, group))
+    return missing
+
+
+def get_latest_matrix(proto: str):
+    """
+    Returns the inherited matrix of a protocol, or attaches by name.
+    Returns None if the shared memory does not exist.
+    """
+    if proto not in latest_matrices:
+        try:
+            latest_matrices[proto] = LatestValueMatrix.attach(proto)
+        except FileNotFoundError:
+            return None
+    return latest_matrices[proto]
+
+
+def release_latest_matrices():
+    for matrix in latest_matrices.values():
+        shm = matrix.shm
+        matrix.close()
+        try:
+            shm.unlink()
+        except FileNotFoundError:
+            pass
+    latest_matrices.clear()
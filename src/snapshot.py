@@ -0,0 +1,150 @@
+import os
+import struct
+import time
+import numpy as np
+from anomaly import ANOMALY_STATE_DTYPE
+from result_format import RESULT_DTYPES, RESULT_SCHEMA_VERSION
+
+# Warm-restart snapshot of a protocol's collector state:
+#   header (64 bytes), then 8-byte aligned arrays
+#   ip_table  : uint32[n_ips]          slot -> IPv4 of LatestValueMatrix
+#   slots     : uint32[2, n_entries]   (src slot, dst slot) of each entry
+#   records   : RESULT_DTYPES[proto][n_entries]  latest result of the pair
+#   states    : ANOMALY_STATE_DTYPE[n_entries]   anomaly baseline (if state size > 0)
+# File name: <dir>/latest_<proto>.snap, replaced atomically.
+SNAPSHOT_MAGIC = b"PWSS"
+SNAPSHOT_VERSION = 1
+# magic, version, schema version, record size, state size, n_ips, n_entries, created (ns)
+SNAPSHOT_HEADER = struct.Struct("<4sHHIIQQq")
+SNAPSHOT_HEADER_SIZE = 64
+
+
+def snapshot_path(directory: str, proto: str) -> str:
+    return os.path.join(directory, f"latest_{proto}.snap")
+
+
+def _aligned(size: int) -> int:
+    return (size + 7) // 8 * 8
+
+
+def _layout(n_ips: int, n_entries: int, record_size: int, state_size: int) -> list:
+    """
+    (offset, size) of ip_table, slots, records and states.
+    """
+    layout = []
+    offset = SNAPSHOT_HEADER_SIZE
+    for size in [n_ips * 4, n_entries * 8, n_entries * record_size, n_entries * state_size]:
+        layout.append((offset, size))
+        offset += _aligned(size)
+    return layout
+
+
+def write_state_snapshot(path: str, matrix, detector=None) -> int:
+    """
+    Writes the cells with data of a LatestValueMatrix (and the anomaly states
+    of the same cells) via a temporary file and rename. Returns the number of entries.
+    """
+    ip_table, src_slots, dst_slots, records = matrix.snapshot()
+    states = np.empty(0, ANOMALY_STATE_DTYPE)
+    if detector != None:
+        states = np.take(detector.state, matrix.cell_index(src_slots, dst_slots))
+    state_size = ANOMALY_STATE_DTYPE.itemsize if detector != None else 0
+
+    arrays = [
+        ip_table.astype(np.uint32),
+        np.stack([src_slots, dst_slots]).astype(np.uint32),
+        records,
+        states,
+    ]
+    header = SNAPSHOT_HEADER.pack(
+        SNAPSHOT_MAGIC,
+        SNAPSHOT_VERSION,
+        RESULT_SCHEMA_VERSION,
+        records.dtype.itemsize,
+        state_size,
+        len(ip_table),
+        len(records),
+        time.time_ns(),
+    )
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(header.ljust(SNAPSHOT_HEADER_SIZE, b"\0"))
+        for array in arrays:
+            data = array.tobytes()
+            f.write(data)
+            f.write(b"\0" * (_aligned(len(data)) - len(data)))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return len(records)
+
+
+def read_state_snapshot(path: str, proto: str):
+    """
+    Memory-maps a snapshot. Returns (created_ns, ip_table, src_slots,
+    dst_slots, records, states); states is None if not saved.
+    """
+    with open(path, "rb") as f:
+        header = f.read(SNAPSHOT_HEADER.size)
+    if len(header) != SNAPSHOT_HEADER.size:
+        raise ValueError(f"Truncated snapshot: {path}")
+    magic, version, schema_version, record_size, state_size, n_ips, n_entries, created_ns = (
+        SNAPSHOT_HEADER.unpack(header)
+    )
+    if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+        raise ValueError(f"Not a pingweave snapshot: {path}")
+    dtype = RESULT_DTYPES[proto]
+    if schema_version != RESULT_SCHEMA_VERSION or record_size != dtype.itemsize:
+        raise ValueError(f"Schema mismatch of snapshot {path}")
+    if state_size not in [0, ANOMALY_STATE_DTYPE.itemsize]:
+        raise ValueError(f"Anomaly state size mismatch of snapshot {path}")
+
+    layout = _layout(n_ips, n_entries, record_size, state_size)
+    end = layout[-1][0] + layout[-1][1]
+    if os.path.getsize(path) < end:
+        raise ValueError(f"Truncated snapshot: {path}")
+    data = np.memmap(path, dtype=np.uint8, mode="r")
+
+    def section(index, section_dtype):
+        offset, size = layout[index]
+        return data[offset : offset + size].view(section_dtype)
+
+    ip_table = section(0, np.uint32)
+    slots = section(1, np.uint32).reshape(2, n_entries)
+    records = section(2, dtype)
+    states = section(3, ANOMALY_STATE_DTYPE) if state_size else None
+    return created_ns, ip_table, slots[0], slots[1], records, states
+
+
+def restore_state_snapshot(path: str, proto: str, matrix, detector=None, max_age_sec: float = None) -> int:
+    """
+    Loads a snapshot into an empty LatestValueMatrix (and AnomalyDetector),
+    skipping entries whose ts_end is older than `max_age_sec` and those
+    beyond the matrix's capacity. IPs left without entries are dropped.
+    Returns the number of restored entries.
+    """
+    _, ip_table, src_slots, dst_slots, records, states = read_state_snapshot(path, proto)
+
+    rows = np.arange(len(records))
+    if max_age_sec != None:
+        rows = np.flatnonzero(records["ts_end"] >= time.time_ns() - int(max_age_sec * 1e9))
+
+    # renumber the slots of the remaining IPs densely (in their old order)
+    used = np.zeros(len(ip_table), bool)
+    used[src_slots[rows]] = True
+    used[dst_slots[rows]] = True
+    new_slot = np.cumsum(used) - 1
+    src = new_slot[src_slots[rows]]
+    dst = new_slot[dst_slots[rows]]
+    ips = ip_table[used][: matrix.capacity]
+    fits = (src < matrix.capacity) & (dst < matrix.capacity)
+    if not fits.all():
+        rows, src, dst = rows[fits], src[fits], dst[fits]
+
+    # np.take/np.put: much faster than fancy indexing for wide structured records
+    cells = matrix.restore(ips, src, dst, np.take(records, rows))
+    restored = np.flatnonzero(cells >= 0)
+    if detector != None and states is not None:
+        np.put(detector.state, cells[restored], np.take(states, rows[restored]))
+    return len(restored)
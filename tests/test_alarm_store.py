@@ -0,0 +1,86 @@
+import logging
+from alarm_store import AlarmStore
+
+logger = logging.getLogger("test_alarm_store")
+
+
+def open_store(log_dir, writer_id: int, **kwargs) -> AlarmStore:
+    store = AlarmStore(str(log_dir), logger, writer_id=writer_id, **kwargs)
+    store.open()
+    return store
+
+
+def test_dedup_window(tmp_path):
+    store = open_store(tmp_path, 0, dedup_window_sec=10)
+    store.add("10.0.0.1", "Main thread starts", ts=100)
+    store.add("10.0.0.1", "Main thread starts", ts=105)
+    store.add("10.0.0.1", "Main thread starts", ts=200)
+    alarms = store.query(since=0)
+    assert [(a["first_ts"], a["count"]) for a in alarms] == [(200, 1), (100, 2)]
+    assert alarms[0]["type"] == "main_start"
+
+
+def test_other_workers_logs(tmp_path):
+    first, second = open_store(tmp_path, 0), open_store(tmp_path, 1)
+    second.add("10.0.0.2", "Child process termination is detected", ts=100)
+    first.add("10.0.0.1", "something else", ts=101)
+    events = first.read_events()  # without touching the indexes
+    assert events == [("10.0.0.2", "child_terminated", "Child process termination is detected", 100.0)]
+    assert len(first.query(since=0)) == 1
+    first.apply_events(events)
+    assert [a["host"] for a in first.query(since=0)] == ["10.0.0.1", "10.0.0.2"]
+    assert first.read_events() == []
+
+    # a restarted worker replays all logs
+    assert len(open_store(tmp_path, 2).query(since=0)) == 2
+
+
+def test_events_written_before_a_rotation_are_read(tmp_path):
+    first, second = open_store(tmp_path, 0), open_store(tmp_path, 1, log_max_MB=0.0005)
+    second.add("10.0.0.2", "before the last sync", ts=1)
+    first.sync()
+    for i in range(10):  # the last ones rotate the log (> 524 bytes)
+        second.add("10.0.0.2", f"event {i}", ts=2 + i)
+    assert (tmp_path / "pingweave_alarm_w1.jsonl.1").exists()
+    second.add("10.0.0.2", "after the rotation", ts=20)
+    first.sync()
+    messages = sorted(a["message"] for a in first.query(since=0))
+    assert messages == sorted(["before the last sync", "after the rotation"] + [f"event {i}" for i in range(10)])
+
+
+def test_query_indexes_and_limit(tmp_path):
+    store = open_store(tmp_path, 0)
+    for i in range(100):
+        store.add(f"10.0.0.{i % 4}", f"Main thread starts {i}" if i % 2 else f"other {i}", ts=i)
+    alarms = store.query(host="10.0.0.1", alarm_type="main_start", since=0, limit=3)
+    assert [a["last_ts"] for a in alarms] == [97, 93, 89]
+    assert [a["last_ts"] for a in store.query(alarm_type="other", since=0, until=50, limit=2)] == [50, 48]
+    assert [a["last_ts"] for a in store.query(host="10.0.0.2", since=90)] == [98, 94, 90]
+    assert store.query(alarm_type="child_terminated", since=0) == []
+
+
+def test_query_out_of_order_events(tmp_path):
+    store = open_store(tmp_path, 0)
+    for ts in [10, 20, 30, 25, 29]:  # late events of another worker
+        store.add("10.0.0.1", f"event {ts}", ts=ts)
+    assert [a["last_ts"] for a in store.query(since=0, limit=3)] == [30, 29, 25]
+    assert [a["last_ts"] for a in store.query(since=26, limit=10)] == [30, 29]
+
+
+def test_query_walk_stops_at_limit(tmp_path):
+    store = open_store(tmp_path, 0, ring_size=100000)
+    for i in range(10000):
+        store.add("10.0.0.1", f"event {i}", ts=i)
+    visited = []
+
+    class Spy(dict):
+        def __getitem__(self, rid):
+            visited.append(rid)
+            return store.by_time[rid]
+
+        def __reversed__(self):
+            return reversed(store.by_time)
+
+    store.by_host["10.0.0.1"] = Spy()
+    assert len(store.query(host="10.0.0.1", since=0, limit=10)) == 10
+    assert len(visited) == 11
@@ -0,0 +1,72 @@
+import os
+import numpy as np
+import pytest
+import anomaly
+from anomaly import ANOMALY_FAILURE, ANOMALY_LATENCY, AnomalyDetector
+from result_format import RESULT_DTYPES
+
+
+@pytest.fixture
+def detector(monkeypatch):
+    monkeypatch.setattr(anomaly, "SHM_NAME_PREFIX", f"pingweave_test_{os.getpid()}_anomaly_")
+    detector = AnomalyDetector.create("udp", 4)
+    detector.configure(0.1, 10, 6.0, 5.0, 0.2)
+    yield detector
+    shm = detector.shm
+    detector.close()
+    shm.unlink()
+
+
+def report(latency: int = 100_000, n_success: int = 100, n_failure: int = 0) -> np.ndarray:
+    records = np.zeros(1, dtype=RESULT_DTYPES["udp"])
+    records["network_p50"] = records["network_p99"] = latency
+    records["n_success"], records["n_failure"] = n_success, n_failure
+    return records
+
+
+def step(detector, records, cell: int = 0) -> int:
+    rows, kinds = detector.update(records, np.array([cell]))
+    return int(kinds[0]) if len(rows) else 0
+
+
+def test_no_alarm_during_warmup(detector):
+    for _ in range(9):
+        assert step(detector, report(latency=1_000_000, n_failure=100)) == 0
+    assert detector.baseline(0)["n_samples"] == 9
+
+
+def test_latency_anomaly_is_reported_once_per_episode(detector):
+    for _ in range(20):
+        assert step(detector, report()) == 0
+    assert step(detector, report(latency=500_000)) == ANOMALY_LATENCY
+    assert step(detector, report(latency=500_000)) == 0  # still anomalous
+    assert detector.baseline(0)["alarmed"] == ANOMALY_LATENCY
+
+    # back to normal: the CUSUM decays by its slack (0.5) per report
+    n_reports = 0
+    while detector.baseline(0)["alarmed"]:
+        assert step(detector, report()) == 0
+        n_reports += 1
+    assert 20 < n_reports < 300
+    assert step(detector, report(latency=2_000_000)) == ANOMALY_LATENCY
+
+
+def test_failure_anomaly(detector):
+    for _ in range(20):
+        step(detector, report(n_success=99, n_failure=1))
+    assert step(detector, report(n_success=50, n_failure=50)) == ANOMALY_FAILURE
+    # a report of failures only has no latency: the latency state is untouched
+    p50_mean = detector.baseline(0)["p50_mean"]
+    step(detector, report(n_success=0, n_failure=100))
+    assert detector.baseline(0)["p50_mean"] == p50_mean
+
+
+def test_untracked_and_separate_pairs(detector):
+    for _ in range(20):
+        step(detector, report(), cell=1)
+    rows, kinds = detector.update(
+        np.concatenate((report(500_000), report(500_000), report())), np.array([-1, 1, 2])
+    )
+    assert rows.tolist() == [1] and kinds.tolist() == [ANOMALY_LATENCY]
+    assert detector.baseline(2)["n_samples"] == 1
+    assert detector.baseline(0)["n_samples"] == 0
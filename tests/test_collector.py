@@ -0,0 +1,126 @@
+import asyncio
+import gzip
+import multiprocessing
+import zlib
+import numpy as np
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+import collector
+from ingest_queue import IngestQueue
+from result_format import RESULT_DTYPES, format_result_values, int_to_ip
+
+
+@pytest.fixture(autouse=True)
+def empty_queue(monkeypatch):
+    monkeypatch.setattr(collector, "ingest_queue", IngestQueue(1000))
+    monkeypatch.setattr(collector, "ingest_retry_after_sec", 5)
+    monkeypatch.setattr(collector, "result_max_body_MB", 1)
+    monkeypatch.setattr(collector, "result_read_chunk_KB", 1)
+
+
+def make_body(n: int) -> tuple:
+    records = np.zeros(n, dtype=RESULT_DTYPES["udp"])
+    records["src"] = 0x0A000001
+    records["dst"] = 0x0A000100 + np.arange(n)
+    records["ts_start"] = 1_790_000_000_000_000_000
+    records["ts_end"] = records["ts_start"] + 10**10
+    records["n_success"] = np.arange(n)
+    records["network_p50"] = np.arange(n) * 7
+    body = "\n".join(
+        f"{int_to_ip(src)},{int_to_ip(dst)},{values}"
+        for src, dst, values in zip(
+            records["src"].tolist(), records["dst"].tolist(), format_result_values("udp", records)
+        )
+    )
+    return records, body.encode()
+
+
+def post_all(posts: list) -> list:
+    """
+    POSTs (body, Content-Encoding) to /result_udp; returns the statuses.
+    One connection per POST: aiohttp closes it after an undecodable body.
+    """
+
+    async def run():
+        app = web.Application()
+        app.router.add_post("/result_udp", collector.handle_result_udp_post)
+        statuses = []
+        for body, encoding in posts:
+            headers = {"Content-Encoding": encoding} if encoding != None else {}
+            async with TestClient(TestServer(app)) as client:
+                response = await client.post("/result_udp", data=body, headers=headers)
+                statuses.append(response.status)
+        return statuses
+
+    return asyncio.run(run())
+
+
+def queued_records() -> np.ndarray:
+    batches = asyncio.run(collector.ingest_queue.get())
+    return np.concatenate([records for _, records in batches])
+
+
+@pytest.mark.parametrize(
+    "encoding, compress",
+    [
+        (None, lambda body: body),
+        ("gzip", gzip.compress),
+        ("deflate", zlib.compress),
+        ("GZIP", gzip.compress),
+    ],
+)
+def test_compressed_upload(encoding, compress):
+    records, body = make_body(500)  # parsed in chunks of result_read_chunk_KB
+    assert len(body) > 10 * 1024
+    assert post_all([(compress(body), encoding)]) == [200]
+    assert (queued_records() == records).all()
+
+
+def test_rejected_uploads():
+    records, body = make_body(10)
+    bomb = gzip.compress(b"\n" * (2 * 1024 * 1024))  # over result_max_body_MB once inflated
+    assert len(bomb) < 1024 * 1024
+    statuses = post_all(
+        [
+            (body, "compress"),
+            (bomb, "gzip"),
+            (body, "gzip"),  # not gzipped
+        ]
+    )
+    assert statuses == [415, 413, 400]
+    assert collector.ingest_queue.depth == 0
+
+
+def count_in_worker(my_worker_id: int, n_requests: int):
+    collector.worker_id = my_worker_id
+    for _ in range(n_requests):
+        collector.count_ingest(requests=1, records=10, bytes=100)
+    collector.set_ingest_gauge("queue_depth", my_worker_id)
+
+
+def test_per_worker_counters(monkeypatch):
+    monkeypatch.setattr(collector, "ingest_counters", None)
+    monkeypatch.setattr(collector, "worker_id", 0)
+    collector.create_ingest_counters(3)  # before forking, like the server
+    workers = [
+        multiprocessing.get_context("fork").Process(target=count_in_worker, args=(i, 10 * i))
+        for i in (1, 2)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    count_in_worker(0, 1)
+
+    async def run():
+        app = web.Application()
+        app.router.add_get("/collector_stats", collector.handle_collector_stats_get)
+        async with TestClient(TestServer(app)) as client:
+            return await (await client.get("/collector_stats")).json()
+
+    stats = asyncio.run(run())
+    assert stats["responder"] == 0
+    assert [w["requests"] for w in stats["workers"]] == [1, 10, 20]
+    assert [w["queue_depth"] for w in stats["workers"]] == [0, 1, 2]
+    assert stats["total"]["requests"] == 31 and stats["total"]["records"] == 310
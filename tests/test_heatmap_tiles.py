@@ -0,0 +1,96 @@
+import numpy as np
+import pytest
+from heatmap_tiles import (
+    NO_TIME,
+    TILE_FACTOR,
+    TILE_HEADER,
+    HeatmapTileWriter,
+    _aggregate,
+    level_sizes,
+    read_tile_value,
+)
+
+# one latency value (0: Failure) and one ratio value
+ZERO_IS_FAILURE = np.array([True, False])
+
+
+def block_of(latencies: list, ratios: list):
+    """
+    One TILE_FACTOR x TILE_FACTOR block of both values, padded with No Data.
+    """
+    values = np.full((2, TILE_FACTOR * TILE_FACTOR), -1, np.float32)
+    values[0, : len(latencies)] = latencies
+    values[1, : len(ratios)] = ratios
+    times = np.full(TILE_FACTOR * TILE_FACTOR, NO_TIME, np.int64)
+    times[: max(len(latencies), len(ratios))] = 1000 + np.arange(max(len(latencies), len(ratios)))
+    return values.reshape(2, TILE_FACTOR, TILE_FACTOR), times.reshape(TILE_FACTOR, TILE_FACTOR)
+
+
+@pytest.mark.parametrize(
+    "latencies, expected",
+    [
+        ([100, 0, 7000000], 0),  # Failure outranks the slowest latency
+        ([100, 7000000], 7000000),
+        ([-1, 0], 0),
+        ([-1, 5], 5),
+        ([], -1),  # No Data only
+    ],
+)
+def test_aggregate_latency_severity(latencies, expected):
+    values, times = block_of(latencies, [])
+    value, time = _aggregate(values, times, ZERO_IS_FAILURE)
+    assert value.shape == (2, 1, 1) and value.dtype == np.float32
+    assert value[0, 0, 0] == expected
+
+
+def test_aggregate_ratio_is_max():
+    values, times = block_of([], [0, 0.25, 1.0, 0.5])
+    value, time = _aggregate(values, times, ZERO_IS_FAILURE)
+    assert value[1, 0, 0] == 1.0
+    assert time[0, 0] == 1000  # the oldest report
+
+    values, times = block_of([], [0])
+    assert _aggregate(values, times, ZERO_IS_FAILURE)[0][1, 0, 0] == 0  # no failure, not No Data
+
+
+def test_aggregate_without_failure_values_is_max():
+    values, times = block_of([100, 0], [])
+    assert _aggregate(values, times)[0][0, 0, 0] == 100
+
+
+def test_aggregate_pads_partial_blocks():
+    values = np.zeros((2, TILE_FACTOR + 1, TILE_FACTOR + 2), np.float32)
+    times = np.ones((TILE_FACTOR + 1, TILE_FACTOR + 2), np.int64)
+    value, time = _aggregate(values, times, ZERO_IS_FAILURE)
+    assert value.shape == (2, 2, 2) and time.shape == (2, 2)
+    assert (value[0] == 0).all() and (value[1] == 0).all()
+    assert (time == 1).all()
+
+
+def test_pyramid_top_level_shows_a_single_failure(tmp_path):
+    n = 300
+    sizes = level_sizes(n)
+    writer = HeatmapTileWriter(
+        str(tmp_path),
+        "group",
+        n,
+        ["network_p50", "failure_ratio"],
+        lambda i, values: np.zeros(values.shape, np.uint8),
+        123,
+        [True, False],
+    )
+    values = np.full((2, n, n), 5000, np.float32)
+    values[1] = 0.0
+    values[0, 299, 299] = 0  # one failed pair
+    times = np.full((n, n), 1000, np.int64)
+    for first in range(0, n, 64):
+        writer.add_rows(values[:, first : first + 64], times[first : first + 64])
+    writer.close()
+
+    top = len(sizes) - 1
+    data = read_tile_value(str(tmp_path), "group", top, 0, 0, "network_p50")
+    _, _, _, rows, cols, created = TILE_HEADER.unpack(data[: TILE_HEADER.size])
+    assert (rows, cols, created) == (sizes[-1], sizes[-1], 123)
+    n_cells = rows * cols
+    top_values = np.frombuffer(data, "<f4", n_cells, TILE_HEADER.size + 8 * n_cells)
+    assert top_values[-1] == 0 and (top_values[:-1] == 5000).all()
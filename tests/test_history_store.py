@@ -0,0 +1,90 @@
+import logging
+import numpy as np
+from history_store import HistoryStore, history_records_to_dict, map_segment
+from result_format import RESULT_DTYPES, ip_to_int
+
+logger = logging.getLogger("test_history_store")
+SEC = 1_000_000_000
+
+
+def make_records(src: str, dst: str, ts_end_sec: list) -> np.ndarray:
+    records = np.zeros(len(ts_end_sec), dtype=RESULT_DTYPES["udp"])
+    records["src"] = ip_to_int(src)
+    records["dst"] = ip_to_int(dst)
+    records["ts_end"] = np.array(ts_end_sec, dtype=np.int64) * SEC
+    records["ts_start"] = records["ts_end"] - SEC
+    records["network_p50"] = np.arange(len(records))
+    return records
+
+
+def write(store: HistoryStore, records: np.ndarray):
+    store._write("udp", records)
+    store._close_files(lambda key: True)
+
+
+def test_query_filters_and_sorts_across_writers(tmp_path):
+    first = HistoryStore(str(tmp_path), logger, writer_id=0, segment_sec=100)
+    second = HistoryStore(str(tmp_path), logger, writer_id=1, segment_sec=100)
+    write(first, make_records("10.0.0.1", "10.0.0.2", [50, 150, 250]))
+    write(second, make_records("10.0.0.2", "10.0.0.1", [40, 160]))
+    write(second, make_records("10.0.0.1", "10.0.0.3", [60]))
+
+    records, next_cursor = first.query("udp", ts_from_ns=0, ts_to_ns=1000 * SEC)
+    assert next_cursor is None
+    assert (records["ts_end"] // SEC == [40, 50, 60, 150, 160, 250]).all()
+
+    records, _ = first.query("udp", src="10.0.0.1", ts_from_ns=0, ts_to_ns=200 * SEC)
+    assert (records["ts_end"] // SEC == [50, 60, 150]).all()
+    records, _ = first.query("udp", "10.0.0.1", "10.0.0.2", 100 * SEC, 1000 * SEC)
+    assert (records["ts_end"] // SEC == [150, 250]).all()
+
+
+def test_compacted_segments(tmp_path):
+    store = HistoryStore(str(tmp_path), logger, segment_sec=100)
+    records = make_records("10.0.0.2", "10.0.0.1", [30, 10])
+    records = np.concatenate((records, make_records("10.0.0.1", "10.0.0.2", [20, 20])))
+    records["network_p50"][3] = records["network_p50"][2]
+    write(store, records)
+    store.compact()
+
+    path = store.list_segments("udp")[0]
+    _, compacted = map_segment(path, records.dtype)
+    assert len(compacted) == 3  # the duplicate is gone
+    assert (compacted["src"][:-1] <= compacted["src"][1:]).all()
+
+    result, _ = store.query("udp", "10.0.0.2", "10.0.0.1", 0, 100 * SEC)
+    assert (result["ts_end"] // SEC == [10, 30]).all()
+
+
+def test_query_pages(tmp_path):
+    store = HistoryStore(str(tmp_path), logger, segment_sec=10)
+    ts_end_sec = list(range(100)) + [55, 55, 55]  # equal ts_end on a page boundary
+    write(store, make_records("10.0.0.1", "10.0.0.2", ts_end_sec))
+
+    pages = []
+    cursor = 0
+    while cursor is not None:
+        records, cursor = store.query("udp", ts_from_ns=cursor, ts_to_ns=100 * SEC, limit=8)
+        assert 0 < len(records) <= 8
+        pages.append(records)
+    result = np.concatenate(pages)
+    assert (np.sort(result["ts_end"] // SEC) == sorted(ts_end_sec)).all()
+
+    # more records of one ts_end than the limit: they are returned together
+    records, cursor = store.query("udp", ts_from_ns=55 * SEC, ts_to_ns=100 * SEC, limit=2)
+    assert len(records) == 4 and cursor == 55 * SEC + 1
+
+
+def test_full_queue_drops_records(tmp_path):
+    store = HistoryStore(str(tmp_path), logger, max_queue_size=1)
+    store.append("udp", make_records("10.0.0.1", "10.0.0.2", [1, 2]))
+    store.append("udp", make_records("10.0.0.1", "10.0.0.2", [3, 4, 5]))
+    assert store.n_dropped == 3
+
+
+def test_history_records_to_dict(tmp_path):
+    columns = history_records_to_dict(make_records("10.0.0.1", "10.0.0.2", [1, 2]))
+    assert columns["src"] == ["10.0.0.1", "10.0.0.1"]
+    assert columns["dst"] == ["10.0.0.2", "10.0.0.2"]
+    assert columns["network_p50"] == [0, 1]
+    assert "reserved" not in columns
@@ -0,0 +1,62 @@
+import asyncio
+import numpy as np
+from ingest_queue import IngestQueue
+from result_format import RESULT_DTYPES
+
+
+def make_records(n: int, first_dst: int = 0, ts_end: int = 1) -> np.ndarray:
+    records = np.zeros(n, dtype=RESULT_DTYPES["udp"])
+    records["src"] = 1
+    records["dst"] = first_dst + np.arange(n)
+    records["ts_end"] = ts_end
+    return records
+
+
+def test_get_takes_at_most_max_records():
+    queue = IngestQueue(100)
+    assert queue.put("udp", make_records(5))
+    assert queue.put("rdma", make_records(10))
+    batches = asyncio.run(queue.get(8))
+    assert [(proto, len(records)) for proto, records in batches] == [("udp", 5), ("rdma", 3)]
+    assert queue.depth == 7
+    batches = asyncio.run(queue.get(8))
+    assert [(proto, len(records)) for proto, records in batches] == [("rdma", 7)]
+    assert queue.depth == 0 and not queue.not_empty.is_set()
+
+
+def test_reject_policy():
+    queue = IngestQueue(10, "reject")
+    assert queue.put("udp", make_records(8))
+    assert not queue.put("udp", make_records(3))
+    assert queue.n_rejected == 1 and queue.depth == 8
+    assert queue.put("udp", make_records(2))
+
+
+def test_drop_oldest_policy():
+    queue = IngestQueue(10, "drop_oldest")
+    assert queue.put("udp", make_records(6, first_dst=0))
+    assert queue.put("udp", make_records(6, first_dst=100))
+    assert queue.depth == 10 and queue.n_dropped == 2
+    batches = asyncio.run(queue.get())
+    dsts = np.concatenate([records["dst"] for _, records in batches])
+    assert dsts.tolist() == [2, 3, 4, 5] + list(range(100, 106))
+
+    # a batch larger than the capacity keeps its newest records
+    assert queue.put("udp", make_records(15))
+    assert queue.depth == 10 and queue.n_dropped == 7
+    assert asyncio.run(queue.get())[0][1]["dst"].tolist() == list(range(5, 15))
+
+
+def test_merge_policy():
+    queue = IngestQueue(10, "merge")
+    assert queue.put("udp", make_records(8, ts_end=1))
+    # same pairs, newer: merged into the queued ones
+    assert queue.put("udp", make_records(8, ts_end=2))
+    assert queue.depth == 8 and queue.n_merged == 8
+    [(proto, records)] = asyncio.run(queue.get())
+    assert proto == "udp" and (records["ts_end"] == 2).all()
+
+    # other pairs that do not fit even after merging are rejected
+    assert queue.put("udp", make_records(8))
+    assert not queue.put("udp", make_records(8, first_dst=100))
+    assert queue.n_rejected == 1 and queue.depth == 8
@@ -0,0 +1,110 @@
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import time
+import numpy as np
+import pytest
+import live
+import shm_matrix
+from live import LIVE_MAX_AGE_SEC, LIVE_METRICS, LiveFeed
+from result_format import RESULT_DTYPES, ip_to_int
+from shm_matrix import LatestValueMatrix
+
+IPS = ["10.0.0.1", "10.0.0.2", "10.0.0.3"]
+
+
+@pytest.fixture
+def matrix(monkeypatch):
+    monkeypatch.setattr(shm_matrix, "SHM_NAME_PREFIX", f"pingweave_test_{os.getpid()}_")
+    monkeypatch.setattr(shm_matrix, "latest_matrices", {})
+    matrix = LatestValueMatrix.create("udp", 16, 256, multiprocessing.Lock())
+    shm_matrix.latest_matrices["udp"] = matrix
+    matrix.reserve(IPS)
+    yield matrix
+    shm_matrix.release_latest_matrices()
+
+
+def records(pairs: list, age_sec: float = 0) -> np.ndarray:
+    result = np.zeros(len(pairs), dtype=RESULT_DTYPES["udp"])
+    result["src"] = [ip_to_int(IPS[src]) for src, _ in pairs]
+    result["dst"] = [ip_to_int(IPS[dst]) for _, dst in pairs]
+    result["ts_end"] = time.time_ns() - int(age_sec * 1e9)
+    return result
+
+
+def events(subscriber) -> list:
+    result = []
+    while not subscriber.queue.empty():
+        event, data = subscriber.queue.get_nowait()
+        result.append((event, json.loads(data)))
+    return result
+
+
+def test_snapshot_then_changed_cells(matrix, monkeypatch):
+    monkeypatch.setattr(live, "LIVE_SNAPSHOT_BLOCK_IPS", 2)  # two blocks of src rows
+    matrix.update(np.concatenate((records([(0, 1), (2, 0)]), records([(1, 0)], LIVE_MAX_AGE_SEC + 1))))
+    feed = LiveFeed(lambda: {"udp": {"g": IPS}}, logging.getLogger())
+    subscriber = feed.subscribe("udp", "g")
+    assert events(subscriber) == []  # the snapshot is built by resync()
+    asyncio.run(feed.resync())
+    [(event, message)] = events(subscriber)
+    assert event == "snapshot" and message["ips"] == IPS
+    assert sorted(row[:2] for row in message["cells"]) == [[0, 1], [2, 0]]  # the stale cell is left out
+
+    matrix.update(records([(2, 0), (2, 1)]))
+    matrix.update(records([(2, 0)]))
+    matrix.update(records([(1, 2)], LIVE_MAX_AGE_SEC + 1))
+    feed.poll()
+    [(event, message)] = events(subscriber)
+    assert event == "cells"
+    assert sorted(row[:2] for row in message["cells"]) == [[2, 0], [2, 1]]
+    assert len(message["cells"][0]) == 3 + 2 * len(LIVE_METRICS) + 1
+
+    feed.poll()
+    assert events(subscriber) == []
+
+
+def test_one_snapshot_per_group(matrix, monkeypatch):
+    built = []
+    monkeypatch.setattr(live, "snapshot_message", lambda *args: built.append(args) or "{}")
+    feed = LiveFeed(lambda: {"udp": {"g": IPS, "h": IPS[:1]}}, logging.getLogger())
+    subscribers = [feed.subscribe("udp", group) for group in ["g", "g", "h"]]
+    asyncio.run(feed.resync())
+    assert sorted(group for _, group, _ in built) == ["g", "h"]
+    assert all(not s.stale and s.queue.qsize() == 1 for s in subscribers)
+
+
+def test_slow_reader_is_resynced_after_the_poll(matrix):
+    feed = LiveFeed(lambda: {"udp": {"g": IPS}}, logging.getLogger(), max_queued=1)
+    subscriber = feed.subscribe("udp", "g")
+    asyncio.run(feed.resync())
+    matrix.update(records([(0, 1)]))
+    feed.poll()  # the queue still holds the snapshot
+    assert subscriber.stale and subscriber.queue.qsize() == 1
+    asyncio.run(feed.resync())
+    [(event, message)] = events(subscriber)
+    assert event == "snapshot" and len(message["cells"]) == 1
+
+
+def test_resync_after_change_log_overrun(matrix):
+    feed = LiveFeed(lambda: {"udp": {"g": IPS}}, logging.getLogger())
+    subscriber = feed.subscribe("udp", "g")
+    asyncio.run(feed.resync())
+    events(subscriber)
+    for _ in range(len(matrix.change_log) // 9 + 1):
+        matrix.update(records([(src, dst) for src in range(3) for dst in range(3)]))
+    feed.poll()
+    assert subscriber.stale and events(subscriber) == []
+    assert feed.last_written["udp"] == matrix.n_written
+    asyncio.run(feed.resync())
+    [(event, message)] = events(subscriber)
+    assert event == "snapshot" and len(message["cells"]) == 9
+
+
+def test_large_groups_are_refused(matrix, monkeypatch):
+    monkeypatch.setattr(live, "LIVE_MAX_IPS", 2)
+    feed = LiveFeed(lambda: {"udp": {"g": IPS}}, logging.getLogger())
+    with pytest.raises(ValueError):
+        feed.subscribe("udp", "g")
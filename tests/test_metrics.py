@@ -0,0 +1,59 @@
+import asyncio
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+import metrics
+
+
+@pytest.fixture(autouse=True)
+def empty_registry(monkeypatch):
+    monkeypatch.setattr(metrics, "registry", {})
+    monkeypatch.setattr(metrics, "_route_metrics", {})
+
+
+def request_all(paths: list):
+    async def handle(request):
+        return web.Response(text="ok")
+
+    async def run():
+        app = web.Application(middlewares=[metrics.metrics_middleware])
+        app.router.add_get("/pinglist", handle)
+        app.router.add_get("/watch", handle)
+        async with TestClient(TestServer(app)) as client:
+            for path in paths:
+                await (await client.get(path)).read()
+
+    asyncio.run(run())
+
+
+def samples(name: str) -> dict:
+    return {
+        dict(key).get("route"): metric.snapshot()
+        for key, metric in metrics.registry.get(name, {"metrics": {}})["metrics"].items()
+    }
+
+
+def test_long_polls_are_not_request_latencies():
+    request_all(["/pinglist", "/pinglist", "/watch", "/missing"])
+    latency = samples("pingweave_http_request_duration_seconds")
+    assert latency["/pinglist"]["count"] == 2 and "/watch" not in latency
+    assert latency["unmatched"]["count"] == 1
+    assert samples("pingweave_http_stream_duration_seconds")["/watch"]["count"] == 1
+    assert samples("pingweave_http_requests_total") == {"/pinglist": 2, "/watch": 1, "unmatched": 1}
+
+
+def test_route_metrics_are_cached():
+    request_all(["/pinglist"])
+    duration, requests, _ = metrics._route_metrics["/pinglist"]
+    request_all(["/pinglist"])
+    assert metrics._route_metrics["/pinglist"][0] is duration
+    assert requests[200].value == 2
+
+
+def test_render_prometheus():
+    metrics.counter("pingweave_test_total", "A test counter", proto="udp").inc(3)
+    metrics.histogram("pingweave_test_seconds", "A test histogram", buckets=(1.0,)).observe(0.5)
+    text = metrics.render_prometheus({"server": metrics.snapshot_registry()})
+    assert 'pingweave_test_total{process="server",proto="udp"} 3' in text
+    assert 'pingweave_test_seconds_bucket{le="1.0",process="server"} 1' in text
+    assert 'pingweave_test_seconds_bucket{le="+Inf",process="server"} 1' in text
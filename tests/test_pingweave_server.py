@@ -0,0 +1,293 @@
+import asyncio
+import collections
+import os
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+import pingweave_server as server
+
+
+@pytest.fixture(autouse=True)
+def empty_pinglist(monkeypatch, tmp_path):
+    monkeypatch.setattr(server, "PINGLIST_PATH", str(tmp_path / "pinglist.yaml"))
+    for name, value in [
+        ("pinglist_in_memory", {}),
+        ("pinglist_file_stat", None),
+        ("pinglist_digest", None),
+        ("pinglist_response", None),
+        ("pinglist_ip_groups", {}),
+        ("pinglist_slices", {}),
+        ("pinglist_lock", asyncio.Lock()),
+        ("watch_changed", asyncio.Event()),
+        ("address_store", collections.OrderedDict()),
+        ("address_store_version", 1000),
+        ("address_store_base_version", 1000),
+        ("address_store_changes", collections.OrderedDict()),
+        ("address_store_lock", asyncio.Lock()),
+        ("address_store_max_entries", 100),
+        ("address_store_expire_sec", 300),
+    ]:
+        monkeypatch.setattr(server, name, value)
+    monkeypatch.setattr(server, "reserve_pinglist", lambda pinglist: [])
+
+
+def write_pinglist(tmp_path, text: str):
+    (tmp_path / "pinglist.yaml").write_text(text)
+    asyncio.run(server.read_pinglist())
+
+
+def serve(handler):
+    """
+    Runs `handler(client)` against the server's routes.
+    """
+
+    async def run():
+        app = web.Application()
+        app.router.add_get("/pinglist", server.get_pinglist)
+        app.router.add_get("/address_store", server.get_address_store)
+        app.router.add_post("/address", server.post_address)
+        app.router.add_get("/watch", server.get_watch)
+        async with TestClient(TestServer(app)) as client:
+            return await handler(client)
+
+    return asyncio.run(run())
+
+
+async def post_address(client, ip: str, qpn: int = 1):
+    address = dict(ip_address=ip, gid=f"gid-{ip}", lid=1, qpn=qpn, dtime="2026-10-18 00:00:00")
+    response = await client.post("/address", json=address)
+    assert response.status == 200
+
+
+async def get_json(client, path: str):
+    response = await client.get(path)
+    assert response.status == 200
+    return await response.json()
+
+
+async def get(client, path: str, **headers):
+    response = await client.get(path, headers=headers)
+    return response.status, response.headers, await response.read()
+
+
+def test_missing_pinglist_notifies_once(tmp_path):
+    asyncio.run(server.read_pinglist())
+    assert server.pinglist_response != None
+    watch_changed = server.watch_changed
+    asyncio.run(server.read_pinglist())
+    assert server.watch_changed is watch_changed  # nothing changed, nobody woken
+
+    (tmp_path / "pinglist.yaml").write_text("udp:\n  g: [10.0.0.1, 10.0.0.2]\n")
+    asyncio.run(server.read_pinglist())
+    assert server.watch_changed is not watch_changed
+    assert server.pinglist_in_memory["udp"]["g"] == ["10.0.0.1", "10.0.0.2"]
+
+    # present -> missing wakes the watchers again
+    (tmp_path / "pinglist.yaml").unlink()
+    watch_changed = server.watch_changed
+    asyncio.run(server.read_pinglist())
+    assert server.watch_changed is not watch_changed and server.pinglist_in_memory == {}
+
+
+def test_pinglist_not_loaded():
+    async def requests(client):
+        return await get(client, "/pinglist")
+
+    assert serve(requests)[0] == 503  # not loaded yet
+
+
+def test_pinglist_not_modified(tmp_path):
+    write_pinglist(tmp_path, "udp:\n  g: [10.0.0.1, 10.0.0.2]\n")
+
+    async def requests(client):
+        status, headers, body = await get(client, "/pinglist", **{"Accept-Encoding": "gzip"})
+        assert status == 200 and headers["Content-Encoding"] == "gzip"
+        assert body == b'{"udp": {"g": ["10.0.0.1", "10.0.0.2"]}}'
+        etag = headers["ETag"]
+        for if_none_match in [etag, f"W/{etag}", f'"other", {etag}', "*"]:
+            status, headers, body = await get(client, "/pinglist", **{"If-None-Match": if_none_match})
+            assert status == 304 and headers["ETag"] == etag and body == b""
+        assert (await get(client, "/pinglist", **{"If-None-Match": '"other"'}))[0] == 200
+        return etag
+
+    etag = serve(requests)
+
+    # touched, not changed: same version, watchers are not woken
+    watch_changed = server.watch_changed
+    os.utime(tmp_path / "pinglist.yaml", ns=(1, 1))
+    asyncio.run(server.read_pinglist())
+    assert server.watch_changed is watch_changed and server.pinglist_response[0] == etag
+
+    write_pinglist(tmp_path, "udp:\n  g: [10.0.0.1, 10.0.0.3]\n")
+
+    async def after_change(client):
+        return await get(client, "/pinglist", **{"If-None-Match": etag})
+
+    status, headers, _ = serve(after_change)
+    assert status == 200 and headers["ETag"] != etag
+
+
+PINGLIST = """
+udp:
+  g1: [10.0.0.1, 10.0.0.2]
+  g2: [10.0.0.2, 10.0.0.3]
+rdma:
+  g3: [10.0.0.1, 10.0.0.3]
+"""
+
+
+def test_pinglist_slices(tmp_path):
+    write_pinglist(tmp_path, PINGLIST)
+
+    async def requests(client):
+        slices = {}
+        for node in ["10.0.0.1", "10.0.0.2", "10.0.0.3", "10.0.0.9", "10.0.0.1,10.0.0.2", ""]:
+            status, headers, body = await get(client, f"/pinglist?node={node}")
+            assert status == 200
+            slices[node] = (headers["ETag"], body)
+        return slices
+
+    slices = serve(requests)
+    assert slices["10.0.0.1"][1] == b'{"udp": {"g1": ["10.0.0.1", "10.0.0.2"]}, "rdma": {"g3": ["10.0.0.1", "10.0.0.3"]}}'
+    assert slices["10.0.0.2"][1] == b'{"udp": {"g1": ["10.0.0.1", "10.0.0.2"], "g2": ["10.0.0.2", "10.0.0.3"]}, "rdma": {}}'
+    # every protocol is kept for nodes without groups
+    assert slices["10.0.0.9"][1] == slices[""][1] == b'{"udp": {}, "rdma": {}}'
+    assert slices["10.0.0.1,10.0.0.2"][1] == server.pinglist_response[1]
+    assert slices["10.0.0.1,10.0.0.2"][0] == server.pinglist_response[0]
+
+    # a slice is encoded once per set of groups
+    response = asyncio.run(server.get_pinglist_response("10.0.0.1"))
+    assert asyncio.run(server.get_pinglist_response(" 10.0.0.1 ")) is response
+
+    # a change of g1 only changes the slices including g1
+    write_pinglist(tmp_path, PINGLIST.replace("g1: [10.0.0.1, 10.0.0.2]", "g1: [10.0.0.1, 10.0.0.2, 10.0.0.4]"))
+    assert server.pinglist_slices == {}
+    assert asyncio.run(server.get_pinglist_response("10.0.0.1"))[0] != slices["10.0.0.1"][0]
+    assert asyncio.run(server.get_pinglist_response("10.0.0.3"))[0] == slices["10.0.0.3"][0]
+    assert asyncio.run(server.get_pinglist_response("10.0.0.9"))[0] == slices["10.0.0.9"][0]
+
+
+def test_address_store_deltas(monkeypatch):
+    async def requests(client):
+        await post_address(client, "10.0.0.1")
+        await post_address(client, "10.0.0.2")
+        full = await get_json(client, "/address_store")
+        first = await get_json(client, "/address_store?since=1000")
+        unchanged = await get_json(client, "/address_store?since=1002")
+
+        await post_address(client, "10.0.0.1")  # only utime is refreshed
+        await post_address(client, "10.0.0.2", qpn=2)
+        await post_address(client, "10.0.0.3")
+        second = await get_json(client, "/address_store?since=1002")
+        invalid = await client.get("/address_store?since=x")
+        return full, first, unchanged, second, invalid.status
+
+    full, first, unchanged, second, invalid_status = serve(requests)
+    assert sorted(full) == ["10.0.0.1", "10.0.0.2"]  # without ?since, the old format
+    assert first == dict(version=1002, full=False, entries=full, removed=[])
+    assert unchanged == dict(version=1002, full=False, entries={}, removed=[])
+    assert second["version"] == 1004 and second["removed"] == []
+    assert sorted(second["entries"]) == ["10.0.0.2", "10.0.0.3"]
+    assert second["entries"]["10.0.0.2"][3] == 2
+    assert invalid_status == 400
+
+    # removals, until more than ADDRESS_STORE_MAX_REMOVED removed IPs are remembered
+    monkeypatch.setattr(server, "ADDRESS_STORE_MAX_REMOVED", 1)
+    del server.address_store["10.0.0.1"]
+    server.record_address_change("10.0.0.1")
+    assert server.address_store_delta(1004) == ({}, ["10.0.0.1"])
+    del server.address_store["10.0.0.3"]
+    server.record_address_change("10.0.0.3")
+    assert server.address_store_base_version == 1006  # both were forgotten
+    assert server.address_store_delta(1005) == None
+    assert server.address_store_delta(1006) == ({}, [])
+    assert server.address_store_delta(1007) == None  # from the future (a restart)
+
+    async def resync(client):
+        return await get_json(client, "/address_store?since=1004")
+
+    response = serve(resync)
+    assert response["full"] and list(response["entries"]) == ["10.0.0.2"]
+
+
+def test_address_store_expiry_and_eviction(monkeypatch):
+    async def requests(client):
+        for ip in ["10.0.0.1", "10.0.0.2", "10.0.0.3", "10.0.0.1"]:
+            await post_address(client, ip)
+
+    serve(requests)
+    assert list(server.address_store) == ["10.0.0.2", "10.0.0.3", "10.0.0.1"]  # by update
+    now = server.address_store["10.0.0.1"][5]
+    server.address_store["10.0.0.2"][5] = now - 301
+    server.address_store["10.0.0.3"][5] = now - 300
+
+    watch_changed = server.watch_changed
+    assert server.expire_address_store(now) == 1
+    assert server.expire_address_store(now) == 0
+    assert list(server.address_store) == ["10.0.0.3", "10.0.0.1"]
+    assert server.address_store_delta(1003) == ({}, ["10.0.0.2"])
+    assert server.watch_changed is not watch_changed
+
+    # beyond the capacity, the least recently updated entries are evicted
+    monkeypatch.setattr(server, "address_store_max_entries", 2)
+
+    async def more(client):
+        await post_address(client, "10.0.0.3", qpn=2)
+        await post_address(client, "10.0.0.4")
+
+    serve(more)
+    assert list(server.address_store) == ["10.0.0.3", "10.0.0.4"]
+    entries, removed = server.address_store_delta(1004)
+    assert sorted(entries) == ["10.0.0.3", "10.0.0.4"] and removed == ["10.0.0.1"]
+
+
+def test_watch_wakeups(tmp_path):
+    write_pinglist(tmp_path, PINGLIST)
+    changed_pinglist = PINGLIST.replace("g1: [10.0.0.1, 10.0.0.2]", "g1: [10.0.0.1, 10.0.0.4]")
+
+    async def watch(client, **params):
+        query = "&".join(f"{key}={value}" for key, value in params.items())
+        return await get_json(client, f"/watch?{query}")
+
+    async def requests(client):
+        loop = asyncio.get_running_loop()
+        etag = server.pinglist_response[0]
+        etag_3 = (await server.get_pinglist_response("10.0.0.3"))[0]
+        results = {}
+        results["current"] = await watch(client, pinglist_version=etag, address_version=1000, timeout=0)
+
+        # woken by a change of the node's groups, not by other groups
+        start = loop.time()
+        node_1 = asyncio.create_task(watch(client, node="10.0.0.1", pinglist_version=etag, timeout=10))
+        node_3 = asyncio.create_task(watch(client, node="10.0.0.3", pinglist_version=etag_3, timeout=0.5))
+        await asyncio.sleep(0.1)
+        (tmp_path / "pinglist.yaml").write_text(changed_pinglist)
+        await server.read_pinglist()
+        results["node_1"] = await node_1
+        results["node_1_sec"] = loop.time() - start
+        results["node_3"] = await node_3
+
+        # woken by a posted address
+        start = loop.time()
+        address = asyncio.create_task(watch(client, address_version=1000, timeout=10))
+        await asyncio.sleep(0.1)
+        await post_address(client, "10.0.0.1")
+        results["address"] = await address
+        results["address_sec"] = loop.time() - start
+        results["invalid"] = (await client.get("/watch?timeout=x")).status
+        return results
+
+    results = serve(requests)
+    assert results["current"]["pinglist"] == results["current"]["address_store"] == False
+    assert results["current"]["address_version"] == 1000
+    assert results["node_1"]["pinglist"] and results["node_1_sec"] < 5
+    assert results["node_1"]["pinglist_version"] != results["current"]["pinglist_version"]
+    assert not results["node_3"]["pinglist"]  # timed out, its groups are unchanged
+    assert results["address"] == dict(
+        pinglist_version=server.pinglist_response[0],
+        address_version=1001,
+        pinglist=False,
+        address_store=True,
+    )
+    assert results["address_sec"] < 5
+    assert results["invalid"] == 400
@@ -0,0 +1,258 @@
+import asyncio
+import numpy as np
+import pytest
+import collector
+from collector import RedisWriteBatcher, records_to_redis_items
+from redis_reader import EXPIRE_SCRIPT, RedisBulkReader, group_cells, update_index_key
+from result_format import RESULT_DTYPES, int_to_ip
+
+IPS = [f"10.0.0.{i}" for i in range(1, 5)]
+
+
+class FakeRedis:
+    """
+    The few commands of the batcher (async) and the bulk reader (sync) on a
+    dict, with bytes keys and values like a client without decode_responses.
+    """
+
+    def __init__(self):
+        self.values = {}
+        self.indexes = {}  # key -> {member: score}
+        self.executed = []  # commands of each executed pipeline
+
+    @staticmethod
+    def _bytes(value):
+        return value if isinstance(value, bytes) else str(value).encode()
+
+    def mset(self, mapping: dict):
+        for key, value in mapping.items():
+            self.values[self._bytes(key)] = self._bytes(value)
+
+    def zadd(self, key, mapping: dict):
+        index = self.indexes.setdefault(self._bytes(key), {})
+        for member, score in mapping.items():
+            index[self._bytes(member)] = score
+
+    def mget(self, keys: list):
+        return [self.values.get(self._bytes(key)) for key in keys]
+
+    def zrangebyscore(self, key, low, high):
+        index = self.indexes.get(self._bytes(key), {})
+        return [m for m, s in sorted(index.items(), key=lambda i: i[1]) if s >= low]
+
+    def exists(self, key):
+        return int(self._bytes(key) in self.indexes)
+
+    def pipeline(self, transaction=False):
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    def __init__(self, redis: FakeRedis):
+        self.redis = redis
+        self.commands = []
+
+    def __getattr__(self, name):
+        return lambda *args: self.commands.append((name, args))
+
+    def execute(self):
+        self.redis.executed.append([name for name, _ in self.commands])
+        return [getattr(self.redis, name)(*args) for name, args in self.commands]
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class AsyncPipeline(FakePipeline):
+    async def execute(self):
+        return FakePipeline.execute(self)
+
+
+class AsyncFakeRedis(FakeRedis):
+    def pipeline(self, transaction=False):
+        return AsyncPipeline(self)
+
+    def sync_client(self) -> FakeRedis:
+        client = FakeRedis()
+        client.values, client.indexes = self.values, self.indexes
+        client.executed = self.executed
+        return client
+
+
+def pair_records(proto: str, ts_end: int = 1_790_000_000_000_000_000) -> np.ndarray:
+    records = np.zeros(len(IPS) ** 2, dtype=RESULT_DTYPES[proto])
+    records["src"] = np.repeat([0x0A000001 + i for i in range(len(IPS))], len(IPS))
+    records["dst"] = np.tile([0x0A000001 + i for i in range(len(IPS))], len(IPS))
+    records["ts_start"] = ts_end - 10**10
+    records["ts_end"] = ts_end + np.arange(len(records))
+    records["n_success"] = np.arange(len(records))
+    for name in RESULT_DTYPES[proto].names[8:]:
+        records[name] = np.arange(len(records)) * 1009 + 1
+    return records
+
+
+def store(redis: AsyncFakeRedis, proto: str, records: np.ndarray):
+    batcher = RedisWriteBatcher(redis, 5, 0)
+    batcher.submit(records_to_redis_items(proto, records))
+    asyncio.run(batcher.flush())
+    return batcher
+
+
+@pytest.mark.parametrize("value_format", ["text", "packed"])
+@pytest.mark.parametrize("proto", ["rdma", "udp"])
+def test_value_round_trip(monkeypatch, proto, value_format):
+    monkeypatch.setattr(collector, "redis_value_format", value_format)
+    redis = AsyncFakeRedis()
+    records = pair_records(proto)
+    store(redis, proto, records)
+
+    reader = RedisBulkReader(redis.sync_client(), batch_size=5, pipeline_depth=2)
+    cells = reader.read_group(proto, IPS)
+    assert (cells.reshape(-1) == records).all()
+    assert reader.n_invalid == 0
+
+
+def test_mixed_formats_and_invalid_values(monkeypatch):
+    redis = AsyncFakeRedis()
+    records = pair_records("udp")
+    monkeypatch.setattr(collector, "redis_value_format", "text")
+    store(redis, "udp", records[:8])
+    monkeypatch.setattr(collector, "redis_value_format", "packed")
+    store(redis, "udp", records[8:])
+    redis.values[f"udp,{IPS[0]},{IPS[1]}".encode()] = b"garbage"
+    redis.values[f"udp,{IPS[3]},{IPS[3]}".encode()] = b"\x00\x01short"
+
+    reader = RedisBulkReader(redis.sync_client())
+    cells = reader.read_group("udp", IPS).reshape(-1)
+    assert reader.n_invalid == 2
+    assert cells[1]["ts_end"] == 0 and cells[15]["ts_end"] == 0
+    valid = np.ones(len(records), bool)
+    valid[[1, 15]] = False
+    assert (cells[valid] == records[valid]).all()
+
+
+def test_bulk_reads(monkeypatch):
+    monkeypatch.setattr(collector, "redis_value_format", "packed")
+    redis = AsyncFakeRedis()
+    records = pair_records("udp")
+    store(redis, "udp", records)
+    redis.executed.clear()
+
+    # 2 source rows of 5 IPs per MGET (batch_size // 5), 2 MGETs per round trip
+    reader = RedisBulkReader(redis.sync_client(), batch_size=10, pipeline_depth=2)
+    cells = reader.read_group("udp", IPS[::-1] + ["10.0.0.9"])
+    assert redis.executed == [["mget", "mget"], ["mget"]]
+    assert (cells[:4, :4] == records.reshape(4, 4)[::-1, ::-1]).all()
+    assert (cells[4]["ts_end"] == 0).all() and (cells[:, 4]["ts_end"] == 0).all()
+
+    # records of other IPs are ignored
+    cells = group_cells("udp", records, IPS[1:3])
+    assert (cells == records.reshape(4, 4)[1:3, 1:3]).all()
+
+
+def test_batcher_coalesces_writes(monkeypatch):
+    monkeypatch.setattr(collector, "redis_value_format", "packed")
+    redis = AsyncFakeRedis()
+    records = pair_records("udp")
+    newer = records.copy()
+    newer["ts_end"] += 10**9
+    batcher = RedisWriteBatcher(redis, 5, 0)
+
+    async def handlers():
+        writer = asyncio.create_task(batcher.run())
+        # POST handlers of one event-loop tick share a flush
+        batcher.submit(records_to_redis_items("udp", records[:8]))
+        batcher.submit(records_to_redis_items("udp", records[8:]))
+        batcher.submit(records_to_redis_items("udp", newer[:2]))  # same keys, newer values
+        await asyncio.sleep(0.01)
+        writer.cancel()
+
+    asyncio.run(handlers())
+    assert batcher.n_flush == 1 and batcher.n_keys == len(records)
+    # one round trip: MSETs and ZADDs of at most max_batch_size keys
+    assert redis.executed == [["mset"] * 4 + ["zadd"] * 4]
+    cells = RedisBulkReader(redis.sync_client()).read_group("udp", IPS).reshape(-1)
+    assert (cells[:2] == newer[:2]).all() and (cells[2:] == records[2:]).all()
+
+
+def test_update_index(monkeypatch):
+    monkeypatch.setattr(collector, "redis_value_format", "packed")
+    redis = AsyncFakeRedis()
+    records = pair_records("udp")
+    store(redis, "udp", records)
+
+    index = redis.indexes[update_index_key("udp").encode()]
+    assert len(index) == len(records)
+    for record in records:
+        pair = f"{int_to_ip(record['src'])},{int_to_ip(record['dst'])}".encode()
+        assert index[pair] == record["ts_end"]
+
+    reader = RedisBulkReader(redis.sync_client(), batch_size=3)
+    updated = reader.read_updated_since("udp", int(records["ts_end"][10]))
+    assert (np.sort(updated, order="ts_end") == records[10:]).all()
+    assert reader.read_updated_since("rdma", 0) is None
+
+
+class FakeExpireScript:
+    """
+    EXPIRE_SCRIPT on FakeRedis: deletes up to ARGV[3] of the oldest pairs
+    updated before the cutoff ARGV[2].
+    """
+
+    def __init__(self, redis: FakeRedis):
+        self.redis = redis
+        self.n_calls = 0
+
+    async def __call__(self, keys: list, args: list):
+        self.n_calls += 1
+        prefix, cutoff, limit = args
+        index = self.redis.indexes.get(keys[0].encode(), {})
+        stale = sorted((s, m) for m, s in index.items() if s < cutoff)[:limit]
+        for _, pair in stale:
+            del index[pair]
+            self.redis.values.pop(prefix.encode() + pair, None)
+        return len(stale)
+
+
+def test_expire_in_chunks(monkeypatch):
+    monkeypatch.setattr(collector, "redis_value_format", "packed")
+    redis = AsyncFakeRedis()
+    script = FakeExpireScript(redis)
+    redis.register_script = lambda source: script
+    now = 1_790_000_000_000_000_000
+    monkeypatch.setattr(collector.time, "time_ns", lambda: now)
+    records = pair_records("udp", ts_end=now - 100 * 10**9)
+    records["ts_end"][:5] = now  # still reporting
+    batcher = store(redis, "udp", records)
+
+    assert asyncio.run(batcher.expire(60, max_keys_per_call=4)) == 11
+    assert script.n_calls == 3 + 1  # udp in chunks of 4, then rdma
+    assert len(redis.values) == len(redis.indexes[b"udp:updated"]) == 5
+    reader = RedisBulkReader(redis.sync_client())
+    assert (np.sort(reader.read_updated_since("udp", 0), order="ts_end") == records[:5]).all()
+
+
+def test_expire_script_on_redis():
+    redis = pytest.importorskip("redis")
+    client = redis.Redis(unix_socket_path="/var/run/redis/redis-server.sock", socket_timeout=1)
+    try:
+        client.ping()
+    except redis.exceptions.RedisError:
+        pytest.skip("no Redis server")
+
+    prefix, index = "pingweave-test,", "pingweave-test:updated"
+    try:
+        for i in range(10):
+            client.set(f"{prefix}10.0.0.{i},10.0.0.1", "value")
+            client.zadd(index, {f"10.0.0.{i},10.0.0.1": i})
+        script = client.register_script(EXPIRE_SCRIPT)
+        assert script(keys=[index], args=[prefix, 7, 4]) == 4  # oldest first
+        assert script(keys=[index], args=[prefix, 7, 4]) == 3
+        assert script(keys=[index], args=[prefix, 7, 4]) == 0
+        assert client.zrange(index, 0, -1) == [f"10.0.0.{i},10.0.0.1".encode() for i in (7, 8, 9)]
+        assert client.exists(*[f"{prefix}10.0.0.{i},10.0.0.1" for i in range(10)]) == 3
+    finally:
+        client.delete(index, *[f"{prefix}10.0.0.{i},10.0.0.1" for i in range(10)])
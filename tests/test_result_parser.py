@@ -0,0 +1,103 @@
+import numpy as np
+import pytest
+from result_format import RESULT_DTYPES, format_result_values, int_to_ip, parse_result_line
+from result_parser import I64_MAX, ResultStreamParser, parse_result_block
+
+TS = "2026-10-18 10:00:00.123456789"
+
+
+def result_line(proto="rdma", src="10.0.0.1", dst="10.0.0.2", stat="5000", count="10"):
+    groups = ["client", "network", "server"] if proto == "rdma" else ["network"]
+    stats = "".join(f",{group}," + ",".join([stat] * 5) for group in groups)
+    return f"{src},{dst},{TS},{TS},{count},1,0{stats}"
+
+
+def make_records(proto: str, n: int) -> np.ndarray:
+    records = np.zeros(n, dtype=RESULT_DTYPES[proto])
+    records["ts_start"] = 1_790_000_000_000_000_000 + np.arange(n) * 1000
+    records["ts_end"] = records["ts_start"] + 10_000_000_000
+    records["src"] = 0x0A000000 + np.arange(n) // 7
+    records["dst"] = 0x0A000000 + np.arange(n) % 7
+    records["n_success"] = np.arange(n)
+    for name in RESULT_DTYPES[proto].names[8:]:
+        records[name] = np.arange(n) * 1009 % 5000000
+    return records
+
+
+def body_of(proto: str, records: np.ndarray) -> bytes:
+    return "\n".join(
+        f"{int_to_ip(src)},{int_to_ip(dst)},{values}"
+        for src, dst, values in zip(
+            records["src"].tolist(), records["dst"].tolist(), format_result_values(proto, records)
+        )
+    ).encode()
+
+
+@pytest.mark.parametrize("proto", ["rdma", "udp"])
+def test_round_trip(proto):
+    records = make_records(proto, 50)
+    parsed, n_invalid = parse_result_block(proto, body_of(proto, records))
+    assert n_invalid == 0
+    assert (parsed == records).all()
+
+
+@pytest.mark.parametrize("proto", ["rdma", "udp"])
+def test_matches_line_parser(proto):
+    line = result_line(proto)
+    parsed, _ = parse_result_block(proto, line.encode())
+    assert tuple(parsed[0].tolist()) == parse_result_line(proto, line)
+
+
+@pytest.mark.parametrize(
+    "line, reason",
+    [
+        (result_line().rsplit(",", 1)[0], "n_fields"),
+        (result_line(src="10.0.0.256"), "ip"),
+        (result_line().replace(TS, "2026-13-18 10:00:00.123456789", 1), "timestamp"),
+        (result_line().replace("network", "netwrk"), "group"),
+        (result_line(stat="12a"), "number"),
+        (result_line(count=str(2**32)), "number"),
+        (result_line(stat=str(I64_MAX + 1)), "number"),
+        (result_line(stat="9999999999999999999"), "number"),
+        (result_line(stat="1" * 20), "number"),
+    ],
+)
+def test_rejects(line, reason):
+    rejected = {}
+    records, n_invalid = parse_result_block("rdma", line.encode(), rejected)
+    assert len(records) == 0 and n_invalid == 1
+    assert rejected == {reason: 1}
+
+
+def test_int64_bounds():
+    for stat in [str(I64_MAX), "1000000000000000000", "0999999999999999999"]:
+        records, n_invalid = parse_result_block("rdma", result_line(stat=stat).encode())
+        assert n_invalid == 0
+        assert records["network_p99"][0] == int(stat)
+
+
+def test_blanks_around_lines():
+    line = result_line()
+    body = f"  {line} \n\t{line}\r\n\n   \n{line}\t".encode()
+    records, n_invalid = parse_result_block("rdma", body)
+    assert n_invalid == 0 and len(records) == 3
+    assert (records == parse_result_block("rdma", line.encode())[0][0]).all()
+
+
+def test_invalid_lines_do_not_affect_others():
+    body = "\n".join([result_line(), "garbage", result_line(stat="-1"), result_line(dst="10.0.0.3")])
+    records, n_invalid = parse_result_block("rdma", body.encode())
+    assert n_invalid == 2
+    assert [int_to_ip(dst) for dst in records["dst"].tolist()] == ["10.0.0.2", "10.0.0.3"]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 100, 100000])
+def test_stream_parser_any_split(chunk_size):
+    records = make_records("udp", 200)
+    body = body_of("udp", records) + b"\nbad line\n"
+    parser = ResultStreamParser("udp", block_bytes=512)
+    for start in range(0, len(body), chunk_size):
+        parser.feed(body[start : start + chunk_size])
+    parsed, n_invalid = parser.finish()
+    assert n_invalid == 1
+    assert (parsed == records).all()
@@ -0,0 +1,166 @@
+import multiprocessing
+import os
+import numpy as np
+import pytest
+import shm_matrix
+from result_format import RESULT_DTYPES, ip_to_int
+from shm_matrix import SHM_TILE_SIZE, LatestValueMatrix, matrix_sizes, reserve_pinglist
+
+
+@pytest.fixture(autouse=True)
+def private_shm_names(monkeypatch):
+    # never touch the matrices of a running pingweave_server
+    monkeypatch.setattr(shm_matrix, "SHM_NAME_PREFIX", f"pingweave_test_{os.getpid()}_")
+    monkeypatch.setattr(shm_matrix, "latest_matrices", {})
+    yield
+    shm_matrix.release_latest_matrices()
+
+
+def group_ips(first: int, n: int) -> list:
+    return [f"10.{first // 256}.{first % 256}.{i}" for i in range(n)]
+
+
+def pair_records(src_ips: list, dst_ips: list, ts_end: int = 1000) -> np.ndarray:
+    records = np.zeros(len(src_ips) * len(dst_ips), dtype=RESULT_DTYPES["udp"])
+    records["src"] = np.repeat([ip_to_int(ip) for ip in src_ips], len(dst_ips))
+    records["dst"] = np.tile([ip_to_int(ip) for ip in dst_ips], len(src_ips))
+    records["ts_end"] = ts_end + np.arange(len(records))
+    records["network_p50"] = records["src"] % 1000 * 1000 + records["dst"] % 1000
+    return records
+
+
+def create(capacity=256, max_pairs=4096):
+    matrix = LatestValueMatrix.create("udp", capacity, max_pairs, multiprocessing.Lock())
+    shm_matrix.latest_matrices["udp"] = matrix
+    return matrix
+
+
+def test_update_and_read_group():
+    matrix = create()
+    ips = group_ips(0, 20)
+    assert matrix.reserve(ips)
+    assert matrix.covers(ips)
+
+    records = pair_records(ips, ips)
+    cells = matrix.update(records)
+    assert (cells >= 0).all() and len(np.unique(cells)) == len(cells)
+    assert matrix.n_overflow == 0
+
+    read = matrix.read_group(ips)
+    assert (read.reshape(-1) == records).all()
+    # any order and subset of the group
+    subset = [ips[5], ips[0], ips[19]]
+    read = matrix.read_group(subset)
+    assert read[0, 2]["network_p50"] == ip_to_int(ips[5]) % 1000 * 1000 + ip_to_int(ips[19]) % 1000
+
+
+def test_pairs_outside_the_reserved_groups():
+    matrix = create()
+    first, second = group_ips(0, 4), group_ips(1, 4)
+    assert matrix.reserve(first) and matrix.reserve(second)
+    assert not matrix.covers(first + second)  # tiles between the groups
+
+    records = pair_records(first[:1], second[:1] + ["10.9.9.9"])
+    cells = matrix.update(records)
+    assert (cells == -1).all()
+    assert matrix.n_overflow == 2
+    assert (matrix.read_group(first + second)["ts_end"] == 0).all()
+
+
+def test_groups_start_at_tile_boundaries():
+    matrix = create()
+    assert matrix.reserve(group_ips(0, SHM_TILE_SIZE + 1))  # 2 x 2 tiles
+    assert matrix.n_tiles_used == 4
+    assert matrix.reserve(group_ips(1, 3))  # 1 tile
+    assert matrix.n_tiles_used == 5
+    assert matrix.slots(np.array([ip_to_int(group_ips(1, 1)[0])]))[0] == 2 * SHM_TILE_SIZE
+
+    # known IPs keep their slots, tiles of a new combination are added
+    assert matrix.reserve(group_ips(0, 1) + group_ips(1, 1))
+    assert matrix.n_tiles_used == 7
+
+
+def test_reserve_out_of_tiles_reserves_nothing():
+    matrix = create(max_pairs=3 * SHM_TILE_SIZE**2)
+    ips = group_ips(0, 2 * SHM_TILE_SIZE)  # needs 4 tiles
+    assert not matrix.reserve(ips)
+    assert matrix.n_tiles_used == 0
+    assert (matrix.slots(np.array([ip_to_int(ip) for ip in ips])) == -1).all()
+    assert matrix.reserve(ips[:SHM_TILE_SIZE])
+
+
+def test_reserve_pinglist():
+    create(max_pairs=2 * SHM_TILE_SIZE**2)
+    pinglist = {
+        "udp": {"a": group_ips(0, 4), "b": group_ips(1, 4), "c": group_ips(2, 4), "bad": ["x"]},
+        "rdma": {"d": group_ips(3, 4)},  # no matrix
+    }
+    assert reserve_pinglist(pinglist) == [("udp", "c"), ("udp", "bad")]
+    assert reserve_pinglist(pinglist) == [("udp", "c"), ("udp", "bad")]  # idempotent
+
+
+def test_matrix_sizes():
+    pinglist = {"udp": {"a": group_ips(0, 20), "b": group_ips(1, 1000)}}
+    sizes = matrix_sizes(pinglist)
+    tiles = 2**2 + 63**2
+    assert sizes["udp"] == (2 * (32 + 1008), 2 * tiles * SHM_TILE_SIZE**2)
+    assert sizes["rdma"] == (shm_matrix.SHM_MIN_NODES, shm_matrix.SHM_MIN_PAIRS)
+    assert matrix_sizes(pinglist, 100, 200)["udp"] == (100, 200)
+
+
+def test_snapshot_restore():
+    matrix = create()
+    ips = group_ips(0, 5) + group_ips(1, 30)
+    assert matrix.reserve(ips[:5]) and matrix.reserve(ips[5:])
+    records = pair_records(ips[:5], ips[:5])
+    records = np.concatenate((records, pair_records(ips[5:], ips[5:])))
+    matrix.update(records)
+
+    ip_table, src_slots, dst_slots, saved = matrix.snapshot()
+    assert len(saved) == len(records)
+    shm_matrix.release_latest_matrices()
+
+    restored = create()
+    cells = restored.restore(ip_table, src_slots, dst_slots, saved)
+    assert (cells >= 0).all()
+    assert (restored.read_group(ips[5:]).reshape(-1) == records[25:]).all()
+    assert (restored.read_group(ips[:5])["ts_end"] > 0).all()
+
+
+def test_changed_cells():
+    matrix = create(max_pairs=SHM_TILE_SIZE**2)
+    ips = group_ips(0, 3)
+    matrix.reserve(ips)
+    since = matrix.n_written
+    matrix.update(pair_records(ips, ips))
+    since, records = matrix.changed_cells(since)
+    assert since == 9 and len(records) == 9
+    assert (matrix.read_group(ips).reshape(-1) == records).all()
+
+    # a cell written twice is returned once, with its latest record
+    matrix.update(pair_records(ips[1:2], ips[2:], ts_end=5000))
+    matrix.update(pair_records(ips[1:2], ips[2:], ts_end=6000))
+    since, records = matrix.changed_cells(since)
+    assert len(records) == 1 and records[0]["ts_end"] == 6000
+    assert matrix.changed_cells(since)[0] == since
+    assert len(matrix.changed_cells(since)[1]) == 0
+
+    # more writes than the change log holds: the reader must resync
+    for ts_end in range(10, SHM_TILE_SIZE**2 // 9 + 20):
+        matrix.update(pair_records(ips, ips, ts_end=ts_end * 100))
+    assert matrix.changed_cells(since) is None
+    since = matrix.n_written - 9
+    _, records = matrix.changed_cells(since)
+    assert len(records) == 9
+
+
+def test_seqlock():
+    matrix = create()
+    ips = group_ips(0, 2)
+    matrix.reserve(ips)
+    matrix.header[shm_matrix.SHM_HEADER_SEQ] += 1  # a writer died mid-update
+    with pytest.raises(TimeoutError):
+        matrix.read_group(ips, max_retries=3)
+    assert matrix.recover_seqlock()
+    assert not matrix.recover_seqlock()
+    assert matrix.read_group(ips).shape == (2, 2)
@@ -0,0 +1,74 @@
+import multiprocessing
+import os
+import time
+import numpy as np
+import pytest
+import anomaly
+import shm_matrix
+from anomaly import AnomalyDetector
+from result_format import RESULT_DTYPES, ip_to_int
+from shm_matrix import LatestValueMatrix
+from snapshot import read_state_snapshot, restore_state_snapshot, snapshot_path, write_state_snapshot
+
+IPS = [f"10.0.0.{i}" for i in range(1, 6)]
+
+
+@pytest.fixture(autouse=True)
+def private_shm_names(monkeypatch):
+    monkeypatch.setattr(shm_matrix, "SHM_NAME_PREFIX", f"pingweave_test_{os.getpid()}_")
+    monkeypatch.setattr(shm_matrix, "latest_matrices", {})
+    monkeypatch.setattr(anomaly, "SHM_NAME_PREFIX", f"pingweave_test_{os.getpid()}_anomaly_")
+    yield
+    shm_matrix.release_latest_matrices()
+
+
+def create_state():
+    matrix = LatestValueMatrix.create("udp", 16, 256, multiprocessing.Lock())
+    shm_matrix.latest_matrices["udp"] = matrix
+    matrix.reserve(IPS)
+    detector = AnomalyDetector.create("udp", len(matrix.cells))
+    return matrix, detector
+
+
+def release(detector):
+    shm = detector.shm
+    detector.close()
+    shm.unlink()
+
+
+def test_round_trip(tmp_path):
+    matrix, detector = create_state()
+    records = np.zeros(len(IPS) ** 2, dtype=RESULT_DTYPES["udp"])
+    records["src"] = np.repeat([ip_to_int(ip) for ip in IPS], len(IPS))
+    records["dst"] = np.tile([ip_to_int(ip) for ip in IPS], len(IPS))
+    records["ts_end"] = time.time_ns()
+    records["ts_end"][:3] -= 3600 * 10**9  # too old to restore
+    records["n_success"] = 100
+    records["network_p50"] = records["network_p99"] = np.arange(len(records)) * 1000 + 1000
+    cells = matrix.update(records)
+    detector.update(records, cells)
+
+    path = snapshot_path(str(tmp_path), "udp")
+    assert write_state_snapshot(path, matrix, detector) == len(records)
+    baselines = [detector.baseline(cell) for cell in cells]
+    shm_matrix.release_latest_matrices()
+    release(detector)
+
+    matrix, detector = create_state()
+    assert restore_state_snapshot(path, "udp", matrix, detector, max_age_sec=60) == len(records) - 3
+    restored = matrix.read_group(IPS).reshape(-1)
+    assert (restored[:3]["ts_end"] == 0).all()
+    assert (restored[3:] == records[3:]).all()
+    new_cells = matrix.cell_index(
+        matrix.slots(records["src"]), matrix.slots(records["dst"])
+    )
+    assert [detector.baseline(cell) for cell in new_cells[3:]] == baselines[3:]
+    release(detector)
+
+
+def test_rejects_other_files(tmp_path):
+    path = str(tmp_path / "garbage.bin")
+    with open(path, "wb") as f:
+        f.write(b"x" * 100)
+    with pytest.raises(ValueError):
+        read_state_snapshot(path, "udp")